@@ -1,6 +1,5 @@
-from os import listdir
-from graphmodel import Generator
-from graphmodel.NGram import MultiInstrumentNGram
+from graphmodel import Generator, corpus
+from graphmodel.NGram import MultiInstrumentNGram, merge_models
 
 from graphmodel.appio import reader, applogger
 from graphmodel.appio.scheduler import PatternSchedule
@@ -31,26 +30,23 @@ def reproduce():
 def remixing():
     in_transcript = reader.load_transcript(file1)
     in_transcript2 = reader.load_transcript(file2)
-    ngram = MultiInstrumentNGram(nsize)
-    ngram.build_from_transcript(in_transcript)
-    ngram.build_from_transcript(in_transcript2)
+    song_ngram = MultiInstrumentNGram(nsize)
+    song_ngram.build_from_transcript(in_transcript)
+    song_ngram2 = MultiInstrumentNGram(nsize)
+    song_ngram2.build_from_transcript(in_transcript2)
+    ngram = merge_models([song_ngram, song_ngram2])
     scheduled_tracks = Generator.generate_multi_instrument_tracks(ngram, ticks)
     return PatternSchedule(scheduled_tracks=scheduled_tracks, meta=in_transcript.get_transcript_meta())
 
 
 def run_from_eminem_music():
-    files = listdir("music/Eminem")
+    files = corpus.list_midi_files(["music/Eminem"])
     ignored = ["music/Eminem/business.mid", "music/Eminem/forgotaboutdre.mid", "music/Eminem/purple pills.mid"]
                # "music/Eminem/Under_The_Influence.mid"]
-    ngram = MultiInstrumentNGram(nsize)
-    last_transcript = None
-    for file in files:
-        path = "music/Eminem/" + file
-        if path not in ignored:
-            print path
-            transcript = reader.load_transcript(path)
-            ngram.build_from_transcript(transcript)
-            last_transcript = transcript
+    paths = [path for path in files if path not in ignored]
+    ngram, rejected = corpus.build_corpus_model(paths, nsize)
+    last_path = [path for path in paths if path not in rejected][-1]
+    last_transcript = reader.load_transcript(last_path)
     scheduled_tracks = Generator.generate_multi_instrument_tracks(ngram, ticks)
     return PatternSchedule(scheduled_tracks=scheduled_tracks, meta=last_transcript.get_transcript_meta())
 
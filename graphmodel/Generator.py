@@ -1,87 +1,130 @@
+import functools
+import hashlib
+import heapq
+import itertools
 import logging
-from random import randint
+import random
+from collections import deque
+from multiprocessing import Pool
 
 import midi
-from graphmodel.NGram import MultiInstrumentNGram
+from graphmodel.NGram import MultiInstrumentNGram, HighestCountFrameSelector
 
-from graphmodel.appio import reader
-from graphmodel.appio.scheduler import AbstractEventsScheduledTrack, NotesAndEventsScheduledTrack, PatternSchedule
-from graphmodel.appio.writer import MidiFileWriter
+from graphmodel.appio import applogger, midistream, reader
+from graphmodel.appio.cache import content_key
+from graphmodel.appio.scheduler import NotesAndEventsScheduledTrack, PatternSchedule, TempoScheduledTrack
+from graphmodel.appio.writer import MidiStreamWriter, encode_track_stream
 from graphmodel.model import Policies
 from graphmodel.model.Policies import FrameSelectionPolicy
+from graphmodel.utils import MidiUtils
 
 __author__ = 'Adisor'
 
+logger = applogger.logger
+
+# in-process MemoryCache of the built models by (content key of the input file, nsize), None to build them every time
+model_cache = None
+# on-disk OutputCache of the songs generated with a seed, None to generate them every time
+output_cache = None
+
+# version of the generation code, it is part of the output cache keys so it should change whenever the songs
+# generated for a seed change
+GENERATOR_VERSION = 3
+
+# rough memory use of the model objects, measured on the bundled music, used to weigh the models in the model cache
+COMPONENT_BYTES = 6 * 1024
+FRAME_BYTES = 256
+
 
-# TODO: BREAK REPEATING LOOPS IN GENERATION
-# TODO: USE SEED FOR RANDOM GENERATOR TO REPRODUCE
 # TODO: DURATION IS NOT COMPUTED CORRECTLY
 class SingleInstrumentGenerator(object):
     """
     This class generates music. Currently, it takes the sound event data from an ngram, but that can change
     """
 
-    def __init__(self, ngram, duration, meta_track):
+    def __init__(self, ngram, duration, meta_track, policy=None, rng=random):
+        """
+        :param meta_track: TempoScheduledTrack of the tempo events, only used by generate, None for generate_events
+        :param policy: frame selection policy, None to follow Policies.frame_selection_policy
+        :param rng: the random module or a random.Random instance, which draws the random frames
+        """
         self.ngram = ngram
         self.duration = duration
         self.meta_track = meta_track
+        self.policy = policy
+        self.rng = rng
+        # keeps track of when frames were last selected by the highest count policy
+        self.highest_count_selector = None
 
     def generate(self, instrument, channel):
         """
         Generates a scheduled track by selecting best frames and scheduling their sound events on the track
         """
         scheduler = TrackScheduler(meta_track=self.meta_track, instrument=instrument, channel=channel)
+        for frame in self.schedule_frames(scheduler):
+            pass
+        return scheduler.get_scheduled_track()
+
+    def generate_events(self, instrument, channel):
+        """
+        Generates the track as a stream, the frames are selected while the stream is consumed
+        :return: iterator of (time, midi event) pairs in the order of the track
+        """
+        scheduler = StreamingTrackScheduler(instrument=instrument, channel=channel)
+        for frame in self.schedule_frames(scheduler):
+            for timed_event in scheduler.pop_ready_events():
+                yield timed_event
+        for timed_event in scheduler.finish():
+            yield timed_event
+
+    def schedule_frames(self, scheduler):
+        """
+        Selects frames and schedules their sound events until the scheduler reaches the duration
+        :return: iterator that yields each frame after it is scheduled
+        """
+        self.highest_count_selector = HighestCountFrameSelector(self.ngram)
+        if len(self.ngram) == 0:
+            # the track of the instrument is shorter than a frame, so the instrument stays silent
+            logger.warning("The ngram has no frames, nothing is generated for the instrument")
+            return
         frame = self.ngram.get_first_frame()
         while scheduler.get_duration() < self.duration:
-            scheduler.schedule_frame_components(frame.get_components()[1:])
-            frame = self.next_frame(frame.last())
             # we are only concerned about elements after the first one
-        return scheduler.get_scheduled_track()
+            scheduler.schedule_frame_components(self.ngram.get_frame_components(frame)[1:])
+            yield frame
+            frame = self.next_frame(frame[-1])
 
     # find the frame with the maximum count that starts with last_sound_event
     def next_frame(self, last_frame_component):
-        if Policies.frame_selection_policy is FrameSelectionPolicy.HIGHEST_COUNT:
+        policy = self.get_policy()
+        if policy is FrameSelectionPolicy.HIGHEST_COUNT:
             return self.get_next_highest_count_frame(last_frame_component)
-        if Policies.frame_selection_policy is FrameSelectionPolicy.RANDOM:
+        if policy is FrameSelectionPolicy.RANDOM:
             pass
-        if Policies.frame_selection_policy is FrameSelectionPolicy.PROB:
+        if policy is FrameSelectionPolicy.PROB:
             return self.get_prob_next_frame(last_frame_component)
         return None
 
+    def get_policy(self):
+        if self.policy is None:
+            return Policies.frame_selection_policy
+        return self.policy
+
     def get_next_highest_count_frame(self, last_sound_event):
-        next_frame = self.ngram.get_next_best_frame(last_sound_event)
+        next_frame = self.highest_count_selector.select(last_sound_event)
         if next_frame is None:
-            next_frame = self.ngram.get_random_frame()
+            next_frame = self.ngram.get_random_frame(self.rng)
         return next_frame
 
     def get_prob_next_frame(self, last_sound_event):
         # Gets the next frame according to probability
-        next_frame = None
-        total_count = 0
-        frame_list = []
-        count_list = []
-        if not self.ngram.has_index(last_sound_event):
-            return self.ngram.get_random_frame()
-        indexes = self.ngram.get_sound_event_indexes(last_sound_event)
-        for index in indexes:
-            frame = self.ngram.get_indexed_frame(index)
-            count = self.ngram.get_frame_count(frame)
-            if frame.first() == last_sound_event:
-                total_count += count
-                frame_list.append(frame)
-                count_list.append(total_count)
-        key = randint(0, total_count)
-        for i, count in enumerate(count_list):
-            if key <= count:
-                next_frame = frame_list[i]
-                break
-        # this means we reached the end of the samples, pick a random next frame
+        next_frame = self.ngram.get_next_prob_frame(last_sound_event, self.rng)
+        # there are no samples, pick a random next frame
         if next_frame is None:
-            next_frame = self.ngram.get_random_frame()
+            next_frame = self.ngram.get_random_frame(self.rng)
         return next_frame
 
 
-# TODO: TEMPOS SHOULD BE UNIQUE AND CAN ONLY HAVE ONE AT A TIME NOT TWO( which happens when taking notes further in the track)
 class TrackScheduler(object):
     """
     Schedules notes and tempo events into a track
@@ -101,10 +144,13 @@ class TrackScheduler(object):
             sound_event = component.get_sound_event()
             # add tempo and other events
             for note in sound_event.get_notes():
-                self.scheduled_track.schedule_note(note, self.time)
-                self.meta_track.schedule_event(component.get_tempo_event(), self.time)
+                self.schedule_note(note, self.time)
+            self.meta_track.schedule_event(component.get_tempo_event(), self.time)
             self.time += component.get_pause_to_next_component()
 
+    def schedule_note(self, note, start):
+        self.scheduled_track.schedule_note(note, start)
+
     def get_duration(self):
         return self.scheduled_track.get_duration()
 
@@ -112,27 +158,204 @@ class TrackScheduler(object):
         return self.scheduled_track
 
 
-def generate_multi_instrument_tracks(multi_instrument_ngram, duration):
+class StreamingTrackScheduler(object):
+    """
+    Schedules notes like TrackScheduler, but hands out the midi events in the order of the track as soon as they are
+    known, instead of keeping the whole track, so it has pop_ready_events and finish in place of get_scheduled_track
+
+    The scheduler time never goes back, so once a note starts, no event can be scheduled before it. Note ons are
+    ready right away, and note offs wait in a heap until a note starts at or after their time. Events at the same
+    time keep the order in which they were scheduled, like in the sorted scheduled track. Only the note offs of the
+    notes that are still sounding are kept
+
+    The tempo events of the components are not kept either, the meta track of the written file only has the key and
+    time signatures of the transcript, so a meta track collecting them would grow with the song for nothing
+    """
+
+    def __init__(self, instrument=0, channel=0):
+        self.time = 0
+        self.channel = channel
+        self.duration = 0
+        # number of note offs scheduled so far, orders the note offs that have the same time
+        self.sequence = 0
+        # heap of (time, sequence, midi event) note offs
+        self.pending_note_offs = []
+        # (time, midi event) pairs in the order of the track
+        self.ready_events = deque([(0, MidiUtils.to_program_change_event(instrument))])
+
+    def schedule_frame_components(self, components):
+        """
+        Schedules the notes from each component in the list of components, like TrackScheduler
+        :param components: list of components from the frame
+        """
+        for component in components:
+            for note in component.get_sound_event().get_notes():
+                self.schedule_note(note, self.time)
+            self.time += component.get_pause_to_next_component()
+
+    def schedule_note(self, note, start):
+        self.release_note_offs(start)
+        self.ready_events.append((start, MidiUtils.to_note_on_event(note, self.channel)))
+        end = start + note.duration
+        heapq.heappush(self.pending_note_offs, (end, self.sequence, MidiUtils.to_note_off_event(note, self.channel)))
+        self.sequence += 1
+        self.duration = max(self.duration, start, end)
+
+    def release_note_offs(self, time):
+        """
+        Moves the note offs up to the time to the ready events
+        """
+        pending_note_offs = self.pending_note_offs
+        while pending_note_offs and pending_note_offs[0][0] <= time:
+            (end, sequence, event) = heapq.heappop(pending_note_offs)
+            self.ready_events.append((end, event))
+
+    def pop_ready_events(self):
+        """
+        :return: list of the (time, midi event) pairs that are ready, in the order of the track
+        """
+        ready_events = list(self.ready_events)
+        self.ready_events.clear()
+        return ready_events
+
+    def finish(self):
+        """
+        :return: list of the remaining (time, midi event) pairs, in the order of the track
+        """
+        while self.pending_note_offs:
+            (end, sequence, event) = heapq.heappop(self.pending_note_offs)
+            self.ready_events.append((end, event))
+        return self.pop_ready_events()
+
+    def get_duration(self):
+        return self.duration
+
+
+def generate_multi_instrument_tracks(multi_instrument_ngram, duration, policy=None, progress=None, rng=random,
+                                     seed=None):
     """
     Generates a track for each instrument
     :param multi_instrument_ngram: ngram object
     :param duration: ticks
+    :param policy: frame selection policy, None to follow Policies.frame_selection_policy
+    :param rng: the random module or a random.Random instance, shared by the instruments in order
+    :param seed: seed of the random stream of each instrument, see get_instrument_rng, None to use rng
+    :param progress: function called with the fraction of the instruments that were generated
     :return: list of scheduled tracks
     """
     instruments = multi_instrument_ngram.get_instruments()
-    meta_track = AbstractEventsScheduledTrack()
+    meta_track = TempoScheduledTrack()
     # scheduled_tracks = [meta_track]
     scheduled_tracks = []
     channel = 0
     for instrument in instruments:
         ngram = multi_instrument_ngram.get_ngram(instrument)
-        single_instrument_generator = SingleInstrumentGenerator(meta_track=meta_track, ngram=ngram, duration=duration)
+        single_instrument_generator = SingleInstrumentGenerator(meta_track=meta_track, ngram=ngram, duration=duration,
+                                                                policy=policy,
+                                                                rng=get_instrument_rng(rng, seed, instrument))
         scheduled_track = single_instrument_generator.generate(instrument, channel)
         scheduled_tracks.append(scheduled_track)
         channel += 1
+        if progress is not None:
+            progress(float(channel) / len(instruments))
     return scheduled_tracks
 
 
+def generate_multi_instrument_events(multi_instrument_ngram, duration, policy=None, progress=None, rng=random,
+                                     seed=None):
+    """
+    Same as generate_multi_instrument_tracks, but each track is a stream of events that is generated while it is
+    consumed. The streams share the rng when there is no seed, so they have to be consumed in order, one after another
+    :return: list of iterators of (time, midi event) pairs, one for each instrument
+    """
+    instruments = multi_instrument_ngram.get_instruments()
+
+    def generate_events(instrument, channel):
+        ngram = multi_instrument_ngram.get_ngram(instrument)
+        single_instrument_generator = SingleInstrumentGenerator(meta_track=None, ngram=ngram, duration=duration,
+                                                                policy=policy,
+                                                                rng=get_instrument_rng(rng, seed, instrument))
+        for timed_event in single_instrument_generator.generate_events(instrument, channel):
+            yield timed_event
+        if progress is not None:
+            progress(float(channel + 1) / len(instruments))
+
+    return [generate_events(instrument, channel) for (channel, instrument) in enumerate(instruments)]
+
+
+# the model of the parallel generation, set in the worker processes when they start
+worker_ngram = None
+
+
+def set_worker_ngram(multi_instrument_ngram):
+    global worker_ngram
+    worker_ngram = multi_instrument_ngram
+
+
+def generate_worker_track(job):
+    """
+    Generates the track of a single instrument of the worker model, runs in the worker processes
+    """
+    return generate_instrument_track(worker_ngram, job)
+
+
+def generate_instrument_track(multi_instrument_ngram, job):
+    """
+    Generates and encodes the track of a single instrument
+    :param job: (instrument, channel, duration, policy, seed) tuple
+    :return: String with the encoded events of the track
+    """
+    (instrument, channel, duration, policy, seed) = job
+    single_instrument_generator = SingleInstrumentGenerator(meta_track=None, duration=duration, policy=policy,
+                                                            ngram=multi_instrument_ngram.get_ngram(instrument),
+                                                            rng=get_instrument_rng(random, seed, instrument))
+    track_buffer = encode_track_stream(single_instrument_generator.generate_events(instrument, channel))
+    return str(track_buffer)
+
+
+def generate_parallel_tracks(multi_instrument_ngram, duration, seed, policy=None, processes=None, progress=None):
+    """
+    Generates the instruments in parallel, each one with its own random stream, see get_instrument_rng
+
+    The tracks are streamed like in generate_multi_instrument_events, so the instruments share nothing. The workers
+    are forked with the model and send back the encoded tracks, which are a few bytes per event
+    :param seed: seed of the random streams, the tracks are the same for a seed whatever the number of processes
+    :param processes: number of worker processes, None for one per core, 1 to generate the tracks in this process
+    :param progress: function called with the fraction of the instruments that were generated
+    :return: list of Strings with the encoded events of each track, in the order of the instruments
+    """
+    instruments = multi_instrument_ngram.get_instruments()
+    jobs = [(instrument, channel, duration, policy, seed) for (channel, instrument) in enumerate(instruments)]
+    pool = None
+    if processes == 1:
+        results = itertools.imap(functools.partial(generate_instrument_track, multi_instrument_ngram), jobs)
+    else:
+        pool = Pool(processes, initializer=set_worker_ngram, initargs=(multi_instrument_ngram,))
+        results = pool.imap(generate_worker_track, jobs)
+    track_buffers = []
+    try:
+        for track_buffer in results:
+            track_buffers.append(track_buffer)
+            if progress is not None:
+                progress(float(len(track_buffers)) / len(instruments))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return track_buffers
+
+
+def get_instrument_rng(rng, seed, instrument):
+    """
+    :param rng: the random module or a random.Random instance, returned when there is no seed
+    :param seed: seed of the generation, None to use rng
+    :return: random.Random seeded from the seed and the instrument, so each instrument has its own random stream
+    """
+    if seed is None:
+        return rng
+    return random.Random(int(hashlib.sha1('%s:%s' % (seed, instrument)).hexdigest()[:16], 16))
+
+
 """
 THINGS TO ADD:
 SELECTING TEMPO AT EACH NOTE
@@ -141,25 +364,105 @@ USE DISTRIBUTED SOUND EVENT
 """
 
 
-def generate(input_file, ticks, folder='default', nsize=2, policy='random'):
+# frame selection policies by their names on the website
+POLICY_NAMES = {'random': FrameSelectionPolicy.RANDOM, 'highest': FrameSelectionPolicy.HIGHEST_COUNT,
+                'prob': FrameSelectionPolicy.PROB, 'experimental': FrameSelectionPolicy.EXPERIMENTAL}
+
+
+def generate(input_file, ticks, folder='default', nsize=2, policy='random', progress=None, seed=None, processes=1):
+    """
+    Generates a song from the input file and writes it next to it as output-<name>.mid
+    The policy is passed to the generators instead of being set globally, so several songs can be generated at once
+
+    The built model is taken from the model cache when it is set, so only the sampling is repeated for new ticks or
+    policies. Songs generated with a seed are the same every time, so they are also kept in the output cache
+    :param progress: function called with (fraction done, name of the current stage)
+    :param seed: seed of the random frame selections, None for a different song every time
+    :param processes: number of processes that generate the instruments, None for one per core. With more than one,
+    the model is forked into each process, and a song without seed gets a random seed
+    :return: output file name
+    """
     # properties that should be on the website:
-    if policy == 'random':
-        Policies.frame_selection_policy = FrameSelectionPolicy.RANDOM
-    elif policy == 'highest':
-        Policies.frame_selection_policy = FrameSelectionPolicy.HIGHEST_COUNT
-    elif policy == 'prob':
-        Policies.frame_selection_policy = FrameSelectionPolicy.PROB
-    elif policy == 'experimental':
-        Policies.frame_selection_policy = FrameSelectionPolicy.EXPERIMENTAL
-    else:
-        Policies.frame_selection_policy = FrameSelectionPolicy.RANDOM
+    frame_selection_policy = POLICY_NAMES.get(policy, FrameSelectionPolicy.RANDOM)
+
+    def report(fraction, stage):
+        if progress is not None:
+            progress(fraction, stage)
 
     # generation code
     name = input_file.split('.')[0]
+    input_file_name = "%s/%s" % (folder, input_file)
     output_file_name = "%s/output-%s.mid" % (folder, name)
-    in_transcript = reader.load_transcript("%s/%s" % (folder, input_file))
+    report(0.0, 'loading')
+    model_key = None
+    if model_cache is not None or output_cache is not None:
+        with open(input_file_name, 'rb') as midi_file:
+            model_key = (content_key(midi_file.read(), midistream.LOADER_VERSION), nsize)
+    output_key = None
+    if output_cache is not None and seed is not None:
+        output_key = output_cache.get_key(model_key, frame_selection_policy, ticks, seed, GENERATOR_VERSION)
+        data = output_cache.get(output_key)
+        if data is not None:
+            write_output(output_file_name, data)
+            report(1.0, 'done')
+            return output_file_name
+    (ngram, meta) = load_model(input_file_name, nsize, model_key, report)
+    report(0.3, 'generating')
+    generation_progress = lambda done: report(0.3 + 0.7 * done, 'generating')
+    if processes == 1:
+        # the tracks are written while they are generated
+        track_streams = generate_multi_instrument_events(ngram, ticks, policy=frame_selection_policy, seed=seed,
+                                                         progress=generation_progress)
+        MidiStreamWriter(PatternSchedule(scheduled_tracks=track_streams, meta=meta)).save_to_file(output_file_name)
+    else:
+        if seed is None:
+            seed = random.getrandbits(64)
+        track_buffers = generate_parallel_tracks(ngram, ticks, seed, policy=frame_selection_policy,
+                                                 processes=processes, progress=generation_progress)
+        with open(output_file_name, 'wb') as output_file:
+            MidiStreamWriter(PatternSchedule(scheduled_tracks=track_buffers, meta=meta)).write_encoded(output_file)
+    if output_key is not None:
+        with open(output_file_name, 'rb') as output_file:
+            output_cache.put(output_key, output_file.read())
+    report(1.0, 'done')
+    return output_file_name
+
+
+def load_model(input_file_name, nsize, model_key=None, report=None):
+    """
+    Builds the model of the input file, or takes it from the model cache
+    The cached models are shared by the generations of all threads, so their indexing is finished before they are
+    cached, the generations would otherwise sort contexts and build alias tables while other generations query them
+    :param model_key: (content key of the input file, nsize), only needed with the model cache
+    :param report: function called with (fraction done, name of the current stage) before the model is built
+    :return: (MultiInstrumentNGram, TranscriptMeta)
+    """
+    if model_cache is not None:
+        model = model_cache.get(model_key)
+        if model is not None:
+            return model
+    in_transcript = reader.load_transcript(input_file_name)
+    if report is not None:
+        report(0.1, 'building')
     ngram = MultiInstrumentNGram(nsize)
     ngram.build_from_transcript(in_transcript)
-    scheduled_tracks = generate_multi_instrument_tracks(ngram, ticks)
-    pattern_schedule = PatternSchedule(scheduled_tracks=scheduled_tracks, meta=in_transcript.get_transcript_meta())
-    MidiFileWriter(pattern_schedule).save_to_file(output_file_name)
+    model = (ngram, in_transcript.get_transcript_meta())
+    if model_cache is not None:
+        ngram.finish_index()
+        model_cache.put(model_key, model)
+    return model
+
+
+def estimate_model_size(model):
+    """
+    :param model: (MultiInstrumentNGram, TranscriptMeta)
+    :return: approximate number of bytes used by the model
+    """
+    ngram = model[0]
+    frames = sum(len(ngram.get_ngram(instrument).frames) for instrument in ngram.get_instruments())
+    return len(ngram.vocabulary) * COMPONENT_BYTES + frames * FRAME_BYTES
+
+
+def write_output(output_file_name, data):
+    with open(output_file_name, 'wb') as output_file:
+        output_file.write(data)
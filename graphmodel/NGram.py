@@ -1,9 +1,12 @@
-from collections import defaultdict, Counter, OrderedDict
-from random import randint
+from collections import defaultdict, Counter, OrderedDict, deque
+import random
 import time
+import heapq
 import operator
-from graphmodel.utils import MidiUtils
-from graphmodel.utils.iterator import DictIterator
+import numpy
+from graphmodel.utils import MidiUtils, ArrayUtils
+from graphmodel.model.SongObjects import NoteFlyweights
+from graphmodel.utils.sampling import AliasTable
 
 __author__ = 'Adisor'
 
@@ -30,44 +33,51 @@ class _SingleInstrumentNGram(object):
     The statistical model is build as follows:
         The class counts the number of unique same sized consecutive sequences of sound events in a
         transcript's track/channel. Each sequence's size is determined during object instantiation
+
+    Frames are tuples of component ids from the vocabulary, which can be shared between ngrams
+
+    The backend selects how tracks are counted, both backends produce the same frames and vocabulary
     """
 
-    def __init__(self, n):
+    def __init__(self, n, vocabulary=None, backend=None):
         self.frame_size = n
+        if vocabulary is None:
+            vocabulary = FrameComponentVocabulary()
+        self.vocabulary = vocabulary
+        self.backend = backend if backend is not None else NGramBuildBackend.PYTHON
         self.frame_distribution = defaultdict(FrameStatisticalData)
+        # every frame of the distribution in order of first appearance, used for constant time frame selection
+        self.frames = []
         self.indexer = SoundEventFrameIndexer(frame_dict=self.frame_distribution)
 
     def build_from_transcript(self, music_transcript):
         for track in music_transcript.get_tracks():
-            self.build_from_track(track, music_transcript.get_tempo_dict())
+            self.build_from_track(track, music_transcript.get_tempo_timeline())
 
-    def build_from_track(self, track, tempo_dict):
+    def build_from_track(self, track, tempo_timeline):
         """
         Updates the ngram with the data from the track
 
         The ngram is updated by creating frames from the sequences of notes and updating their statistical data
 
-        The tempo_dict parameter is used in constructing frame components
+        The tempo_timeline parameter is used in constructing frame components
         :param track: instrument track
-        :param tempo_dict: a dict that maps tempo events to times
+        :param tempo_timeline: timeline of the tempo events of the transcript
         :return: updated ngram
         """
+        if self.backend == NGramBuildBackend.NUMPY:
+            self.build_from_track_arrays(track, tempo_timeline)
+            return
         times = track.times()
+        sound_events = track.get_sound_events()
         # used to construct the frames
         frames = OrderedFrames(self.frame_size)
         # used to set the tempo of each frame component
-        tempo_event_iterator = DictIterator(tempo_dict)
+        tempo_events = tempo_timeline.tempos_at(times)
         for time_index in range(0, len(times), 1):
             start_time = times[time_index]
-            tempo_event = None
-            if not tempo_event_iterator.is_empty():
-                # update tempo iterator so that we get the most recent tempo event
-                while tempo_event_iterator.has_next() and tempo_event_iterator.current_key() < start_time:
-                    tempo_event_iterator.go_next()
-                if tempo_event_iterator.has_previous() and tempo_event_iterator.current_key() > start_time:
-                    tempo_event_iterator.go_previous()
-                tempo_event = tempo_event_iterator.current_value()
-            sound_event = track.get_sound_event(start_time)
+            tempo_event = tempo_events[time_index]
+            sound_event = sound_events[time_index]
 
             # update previous pause
             pause_to_previous_event = 0
@@ -79,15 +89,73 @@ class _SingleInstrumentNGram(object):
             if time_index + 1 < len(times):
                 pause_to_next_event = times[time_index + 1] - start_time
 
-            # create frame and add it
-            frame_component = FrameComponent(sound_event=sound_event, tempo_event=tempo_event,
-                                             pause_to_previous_event=pause_to_next_event,
-                                             pause_to_next_event=pause_to_previous_event)
-            frames.add(frame_component)
+            # intern the frame component and add its id
+            component_id = self.vocabulary.intern_component(sound_event=sound_event, tempo_event=tempo_event,
+                                                            pause_to_previous_event=pause_to_next_event,
+                                                            pause_to_next_event=pause_to_previous_event)
+            frames.add(component_id)
             # update the count with the first frame
             if frames.is_first_frame_full():
                 frame = frames.remove_first()
-                self.frame_distribution[frame].count += 1
+                self.add_frame_count(frame)
+
+    def build_from_track_arrays(self, track, tempo_timeline):
+        """
+        Vectorized version of build_from_track
+
+        The note columns of the track are turned into arrays of sound event ids, pauses and active tempos, the
+        components are interned once per distinct row and all the frames are counted at once over a strided view of
+        the component ids
+        :param track: instrument track
+        :param tempo_timeline: timeline of the tempo events of the transcript
+        """
+        start_times = track.get_times()
+        if len(start_times) == 0:
+            return
+        # sound events are hashed from the note columns and only created when the vocabulary does not have them
+        sound_event_ids = numpy.empty(len(start_times), dtype=numpy.int64)
+        for (index, key) in enumerate(track.get_sound_event_hashes()):
+            sound_event_id = self.vocabulary.get_sound_event_id(key)
+            if sound_event_id is None:
+                sound_event_id = self.vocabulary.intern_sound_event(track.get_sound_event_at(index))
+            sound_event_ids[index] = sound_event_id
+        tempo_events = tempo_timeline.tempo_events
+        tempo_indexes = tempo_timeline.indexes_at(start_times)
+
+        pauses = numpy.diff(start_times)
+        pauses_to_previous_event = numpy.concatenate(([0], pauses))
+        pauses_to_next_event = numpy.concatenate((pauses, [0]))
+
+        # intern each distinct component in order of first occurrence, pauses are swapped like in build_from_track
+        columns = numpy.column_stack((sound_event_ids, tempo_indexes, pauses_to_previous_event, pauses_to_next_event))
+        rows, first_indexes, inverse, row_counts = ArrayUtils.unique_rows_in_order(columns)
+        row_component_ids = numpy.empty(len(rows), dtype=numpy.int64)
+        for row_index, (sound_event_id, tempo_index, pause_to_next, pause_to_previous) in enumerate(rows.tolist()):
+            row_component_ids[row_index] = self.vocabulary.intern_component_id(
+                sound_event_id=sound_event_id,
+                tempo_event=tempo_events[tempo_index] if tempo_index >= 0 else None,
+                pause_to_next_event=pause_to_next, pause_to_previous_event=pause_to_previous)
+        component_ids = row_component_ids[inverse]
+
+        if self.frame_size <= 0 or len(component_ids) < self.frame_size:
+            return
+        windows = ArrayUtils.sliding_windows(component_ids, self.frame_size)
+        frames, frame_first_indexes, frame_inverse, frame_counts = ArrayUtils.unique_rows_in_order(windows)
+        for frame, count in zip(frames.tolist(), frame_counts.tolist()):
+            self.add_frame_count(tuple(frame), count)
+
+    def add_frame_count(self, frame, count=1):
+        """
+        Increases the count of the frame and lets the indexer know about the change
+        :param frame: tuple of component ids
+        :param count: number of new occurrences of the frame
+        """
+        data = self.frame_distribution[frame]
+        is_new = data.count == 0
+        if is_new:
+            self.frames.append(frame)
+        self.indexer.frame_changed(frame, is_new=is_new)
+        data.count += count
 
     def sort_and_index(self):
         """
@@ -95,44 +163,139 @@ class _SingleInstrumentNGram(object):
         """
         self.indexer.index_frames()
 
+    def finish_index(self):
+        """
+        Sorts every context and builds its alias table now instead of on the first query, after which the queries
+        of the generations no longer change the ngram and it can be shared by generations on other threads
+        """
+        self.indexer.finish_index()
+
+    def merge(self, other, component_ids, weight=1):
+        """
+        Adds the frame counts of another ngram to this one
+        :param other: ngram whose component ids are mapped by component_ids
+        :param component_ids: list that maps the component ids of the other ngram to the ids of this ngram
+        :param weight: the counts of the other ngram are multiplied by the weight
+        """
+        for (frame, count) in other.get_frame_counts():
+            self.add_frame_count(tuple(component_ids[component_id] for component_id in frame), count * weight)
+        self.sort_and_index()
+
+    def get_frame_counts(self):
+        """
+        :return: list of (frame, count) pairs in order of first appearance of the frames
+        """
+        return [(frame, self.frame_distribution[frame].count) for frame in self.frames]
+
     def get_first_frame(self):
-        return self.frame_distribution.keys()[0]
+        return self.frames[0]
 
-    def get_random_frame(self):
-        index = randint(0, len(self.frame_distribution) - 1)
-        return self.frame_distribution.keys()[index]
+    def __len__(self):
+        """
+        :return: number of distinct frames
+        """
+        return len(self.frames)
 
-    def get_next_best_frame(self, sound_event):
+    def get_random_frame(self, rng=random):
         """
-        :param sound_event: represents context information from last frame
+        :param rng: the random module or a random.Random instance
+        """
+        index = rng.randint(0, len(self.frames) - 1)
+        return self.frames[index]
+
+    def get_next_best_frame(self, component_id):
+        """
+        :param component_id: represents context information from last frame
         :return: the next best frame based on the indexer evaluation function
         """
-        return self.indexer.get_best_frame(sound_event)
+        return self.indexer.get_best_frame(component_id)
+
+    def get_next_frame_counts(self, component_id):
+        """
+        :param component_id: represents context information from last frame
+        :return: list of (frame, count) pairs for the frames that start with the component
+        """
+        items = self.indexer.get_frames_that_start_with_sound_event(component_id)
+        return [(frame, data.count) for (frame, data) in items]
+
+    def get_next_prob_frame(self, component_id, rng=random):
+        """
+        :param component_id: represents context information from last frame
+        :param rng: the random module or a random.Random instance
+        :return: a next frame drawn in proportion to its count, None if no frame starts with the component
+        """
+        return self.indexer.get_prob_frame(component_id, rng)
+
+    def get_frame_components(self, frame):
+        """
+        :param frame: tuple of component ids
+        :return: tuple of the frame components the ids stand for
+        """
+        return self.vocabulary.get_components(frame)
 
     def __str__(self):
         string = "NGram:\n"
         for frame in self.frame_distribution:
-            string += str(self.frame_distribution[frame]) + ": " + str(frame) + "\n"
+            components = self.get_frame_components(frame)
+            string += str(self.frame_distribution[frame]) + ": " + frame_to_string(components) + "\n"
         return string
 
 
 class SoundEventFrameIndexer(object):
+    """
+    Maps each component id to the frames that start with it, so the generator can find the continuations of a frame
+
+    Indexing is incremental: only frames that are new or whose counts changed since the last index are looked at,
+    and the frames of a context are sorted the first time they are queried after a change. Alias tables used for
+    drawing frames by probability are built the same way, on the first draw after a change
+    """
+
     def __init__(self, frame_dict):
         # maps statistical data to frames
         self.frame_dict = frame_dict
-        # maps frames to the sound events that are first in the frame
+        # maps frames to the component ids that are first in the frame
         self.first_sound_event_frames = defaultdict(lambda: [])
+        # frames added to the frame dict since the last index
+        self.new_frames = []
+        # component ids whose frames changed since the last index
+        self.changed_contexts = set()
+        # component ids whose frames need to be sorted before they are queried
+        self.unsorted_contexts = set()
+        # maps component ids to (frames, alias table) pairs for drawing frames in proportion to their counts
+        self.context_samplers = {}
+
+    def frame_changed(self, frame, is_new=False):
+        """
+        Records a change of the frame, it is picked up by the next index
+        :param frame: tuple of component ids
+        :param is_new: True if the frame was not in the frame dict before
+        """
+        if is_new:
+            self.new_frames.append(frame)
+        self.changed_contexts.add(frame[0])
 
     def index_frames(self):
         """
-        Maps the frames that have s as their starting sound event to s
-        The mapped frames are sorted based on the evaluation function of the statistical data object
+        Maps the frames that have s as their starting component id to s
+        The mapped frames are sorted based on the evaluation function of the statistical data object when they
+        are queried
+        """
+        for frame in self.new_frames:
+            self.index_frame_dict_item((frame, self.frame_dict[frame]))
+        self.new_frames = []
+        self.unsorted_contexts.update(self.changed_contexts)
+        for component_id in self.changed_contexts:
+            self.context_samplers.pop(component_id, None)
+        self.changed_contexts = set()
+
+    def finish_index(self):
         """
-        for item in self.frame_dict.items():
-            self.index_frame_dict_item(item)
-        for sound_event in self.first_sound_event_frames:
-            self.first_sound_event_frames[sound_event] = sorted(self.first_sound_event_frames[sound_event],
-                                                                key=operator.itemgetter(1))
+        Indexes the changed frames, then does the building of alias tables and the sorting that the queries would do
+        """
+        self.index_frames()
+        for component_id in self.first_sound_event_frames.keys():
+            self.get_frames_that_start_with_sound_event(component_id)
+            self.get_prob_frame_sampler(component_id)
 
     def index_frame_dict_item(self, item):
         """
@@ -140,37 +303,153 @@ class SoundEventFrameIndexer(object):
         :param item: dict key,value pair
         """
         (frame, data) = item
-        self.first_sound_event_frames[frame.first()].append(item)
-
-    def get_frames_that_start_with_sound_event(self, sound_event):
-        return self.first_sound_event_frames[sound_event]
+        self.first_sound_event_frames[frame[0]].append(item)
 
-    def get_best_frame(self, sound_event):
-        if len(self.first_sound_event_frames[sound_event]) > 0:
-            (frame, data) = self.first_sound_event_frames[sound_event][-1]
+    def get_frames_that_start_with_sound_event(self, component_id):
+        """
+        :param component_id: id of the first component
+        :return: list of (frame, data) items sorted by the evaluation function of the statistical data
+        """
+        if component_id in self.unsorted_contexts:
+            # the alias table draws from the frames in the order they were indexed, so it is built before the sort
+            self.get_prob_frame_sampler(component_id)
+            self.unsorted_contexts.discard(component_id)
+            self.first_sound_event_frames[component_id].sort(key=operator.itemgetter(1))
+        return self.first_sound_event_frames.get(component_id, [])
+
+    def get_best_frame(self, component_id):
+        frames = self.get_frames_that_start_with_sound_event(component_id)
+        if len(frames) > 0:
+            (frame, data) = frames[-1]
             return frame
         return None
 
+    def get_prob_frame(self, component_id, rng=random):
+        """
+        Draws one of the frames that start with the component, in proportion to the frame counts
+        :param component_id: id of the first component
+        :param rng: the random module or a random.Random instance
+        :return: frame or None if no frame starts with the component
+        """
+        sampler = self.get_prob_frame_sampler(component_id)
+        if sampler is None:
+            return None
+        (frames, alias_table) = sampler
+        return frames[alias_table.sample(rng)]
+
+    def get_prob_frame_sampler(self, component_id):
+        """
+        :param component_id: id of the first component
+        :return: (frames, alias table) pair of the context, None if no frame with a count starts with the component
+        """
+        sampler = self.context_samplers.get(component_id)
+        if sampler is None:
+            items = [item for item in self.first_sound_event_frames.get(component_id, ()) if item[1].count > 0]
+            if len(items) == 0:
+                return None
+            sampler = ([frame for (frame, data) in items], AliasTable([data.count for (frame, data) in items]))
+            self.context_samplers[component_id] = sampler
+        return sampler
+
+
+class HighestCountFrameSelector(object):
+    """
+    Selects next frames by the highest count plus the number of selections elapsed since the frame was last
+    selected, which is the priority of prioritize_count_and_last_played_elapsed
+
+    Each selection is a step, and a frame last selected at step l has count + (step - l) as its priority. The
+    step is the same for every frame at a selection, so the frames of a context are kept in a heap keyed by
+    count - l, and only the selected frame has its key changed. Every selection costs O(log k) for k frames in
+    the context, and frames that were just played give way to the others, which breaks repeating loops
+
+    The selection state belongs to one generation, the ngram is not modified
+    """
+
+    def __init__(self, ngram):
+        self.ngram = ngram
+        # number of selections made so far
+        self.step = 0
+        # maps component ids to heaps of (-(count - last selected step), -order, frame, count) entries
+        self.context_heaps = {}
+
+    def select(self, component_id):
+        """
+        :param component_id: represents context information from last frame
+        :return: the next frame, None if no frame starts with the component
+        """
+        heap = self.context_heaps.get(component_id)
+        if heap is None:
+            # the candidates come sorted by count, ties go to the later one like in get_best_frame
+            candidates = self.ngram.get_next_frame_counts(component_id)
+            heap = [(-count, -order, frame, count) for order, (frame, count) in enumerate(candidates)]
+            heapq.heapify(heap)
+            self.context_heaps[component_id] = heap
+        if len(heap) == 0:
+            return None
+        self.step += 1
+        (priority, order, frame, count) = heap[0]
+        heapq.heapreplace(heap, (-(count - self.step), order, frame, count))
+        return frame
+
+
+def merge_models(multi_instrument_ngrams, weights=None):
+    """
+    Combines already built ngrams into a new one, such as per song models into a remix corpus
+    :param multi_instrument_ngrams: non empty list of ngrams with the same nsize
+    :param weights: list with a positive weight for each ngram, all weights are 1 by default
+    :return: new MultiInstrumentNGram
+    """
+    if len(multi_instrument_ngrams) == 0:
+        raise ValueError("no models to merge")
+    if weights is None:
+        weights = [1] * len(multi_instrument_ngrams)
+    if len(weights) != len(multi_instrument_ngrams):
+        raise ValueError("Expected %s weights, got %s" % (len(multi_instrument_ngrams), len(weights)))
+    merged = MultiInstrumentNGram(multi_instrument_ngrams[0].nsize)
+    for (multi_instrument_ngram, weight) in zip(multi_instrument_ngrams, weights):
+        merged.merge(multi_instrument_ngram, weight)
+    return merged
+
+
+class NGramBuildBackend(object):
+    def __init__(self):
+        pass
+
+    PYTHON = 0  # one frame component at a time
+    NUMPY = 1  # whole track at once with numpy arrays
+
 
 class MultiInstrumentNGram(object):
     """
     Builds ngram for each instrument
     """
 
-    def __init__(self, nsize=0):
+    def __init__(self, nsize=0, backend=NGramBuildBackend.PYTHON):
         self.instrument_ngrams = {}
         self.nsize = nsize
+        self.backend = backend
+        # shared by all instrument ngrams so that each distinct component is stored once
+        self.vocabulary = FrameComponentVocabulary()
 
     def build_from_transcript(self, music_transcript):
         for instrument in music_transcript.get_instruments():
             track = music_transcript.get_track(instrument)
-            self.add_instrument_track(instrument, track, music_transcript.get_tempo_dict())
+            self.add_instrument_track(instrument, track, music_transcript.get_tempo_timeline())
+
+    def add_instrument_track(self, instrument, track, tempo_timeline):
+        ngram = self.get_or_create_ngram(instrument)
+        ngram.build_from_track(track, tempo_timeline)
+        ngram.sort_and_index()
 
-    def add_instrument_track(self, instrument, track, tempo_dict):
+    def get_or_create_ngram(self, instrument):
+        """
+        :param instrument: instrument number
+        :return: the ngram of the instrument, an empty ngram that shares the vocabulary is created if there is none
+        """
         if instrument not in self.instrument_ngrams:
-            self.instrument_ngrams[instrument] = _SingleInstrumentNGram(self.nsize)
-        self.instrument_ngrams[instrument].build_from_track(track, tempo_dict)
-        self.instrument_ngrams[instrument].sort_and_index()
+            self.instrument_ngrams[instrument] = _SingleInstrumentNGram(self.nsize, self.vocabulary,
+                                                                       self.backend)
+        return self.instrument_ngrams[instrument]
 
     def get_ngram(self, instrument):
         """
@@ -181,99 +460,189 @@ class MultiInstrumentNGram(object):
 
     def get_instruments(self):
         """
-        :return: list of instrument integers
+        :return: sorted list of instrument integers, the order does not depend on how the ngram was built
+        """
+        return sorted(self.instrument_ngrams)
+
+    def finish_index(self):
+        """
+        Finishes the indexing of every instrument ngram, see _SingleInstrumentNGram.finish_index
         """
-        return self.instrument_ngrams.keys()
+        for ngram in self.instrument_ngrams.values():
+            ngram.finish_index()
+
+    def merge(self, other, weight=1):
+        """
+        Adds the frame counts of an already built ngram to this one, without reading any midi. The components of the
+        other ngram are interned into this ngram's vocabulary and its frames are mapped to the new ids
+        :param other: MultiInstrumentNGram, or a mapped one, with the same nsize
+        :param weight: positive number the counts of the other ngram are multiplied by
+        """
+        if other.nsize != self.nsize:
+            raise ValueError("Can not merge an ngram with nsize %s into one with nsize %s" % (other.nsize, self.nsize))
+        if weight <= 0:
+            raise ValueError("Merge weight must be positive: %s" % weight)
+        component_ids = self.vocabulary.intern_vocabulary(other.vocabulary)
+        for instrument in other.get_instruments():
+            self.get_or_create_ngram(instrument).merge(other.get_ngram(instrument), component_ids, weight)
 
 
 class OrderedFrames(object):
     """
     Used for constructing the NGram
 
-    Contains consecutive frames - consecutive based on timeline tick
+    Keeps a sliding window over the last frame_size consecutive component ids - consecutive based on timeline
+    tick. Each time the window fills up it holds exactly one new frame, which is emitted once by remove_first
     """
 
     def __init__(self, frame_size):
         # corresponds to the nsize of the ngram
         self.frame_size = frame_size
-        # list of consecutive frames
-        self.frames = []
+        # ring buffer of the most recent components, the oldest component falls off when a new one is added
+        self.window = deque(maxlen=frame_size)
+        # true when the frame currently in the window has already been emitted
+        self.emitted = False
 
-    def add(self, frame_component):
-        # Adds sound event to all frames
-        frame = Frame(self.frame_size)
-        self.frames.append(frame)
-        for frame in self.frames:
-            frame.add(frame_component)
+    def add(self, component_id):
+        # Slides the window by one component
+        self.window.append(component_id)
+        self.emitted = False
 
     def remove_first(self):
-        frame = self.frames[0]
-        del self.frames[0]
-        return frame
+        """
+        :return: the frame in the window, as a tuple of component ids
+        """
+        self.emitted = True
+        return tuple(self.window)
 
     def is_first_frame_full(self):
-        return self.frames[0].is_full()
+        return 0 < self.frame_size == len(self.window) and not self.emitted
 
     def reset(self):
-        self.frames = []
+        self.window.clear()
+        self.emitted = False
 
     def __sizeof__(self):
-        return len(self.frames)
+        return len(self.window)
 
 
-class Frame(object):
-    """
-    Object that encapsulates a tuple of Frame Components, and represents a progression of notes
+class FrameComponentVocabulary(object):
     """
+    Interns frame components into dense integer ids
 
-    def __init__(self, max_size=0):
-        self.max_size = max_size
-        self.components = ()
-        self.hash = None
+    A component is identified by its sound event together with its tempo and pauses. Every distinct sound event
+    is also stored once and shared by all the components that play it. Frames only hold the ids, and the ids
+    are mapped back to components when the generator schedules them
+    """
 
-    def get_components(self):
+    def __init__(self):
+        # maps sound event hashes to sound event ids
+        self._sound_event_ids = {}
+        # sound events indexed by their id
+        self._sound_events = []
+        # maps component keys to component ids
+        self._component_ids = {}
+        # frame components indexed by their id
+        self._components = []
+        # (sound event id, tempo key, pause to next, pause to previous) keys indexed by component id
+        self._component_keys = []
+        # the stored sound events are made of notes shared by all of them
+        self._flyweights = NoteFlyweights()
+
+    def intern_sound_event(self, sound_event):
         """
-        :return: the tuple of frame components
+        :param sound_event: instrument sound event
+        :return: the id of the sound event, the first sound event with its hash is kept as the representative,
+        moved to time 0 and made of shared notes
         """
-        return self.components
-
-    def add(self, frame_component):
-        self.components += (frame_component,)
-
-    def remove_first(self):
-        self.components = self.components[1:]
-
-    def is_full(self):
-        return len(self.components) == self.max_size
+        key = hash(sound_event)
+        sound_event_id = self._sound_event_ids.get(key)
+        if sound_event_id is None:
+            sound_event_id = len(self._sound_events)
+            self._sound_event_ids[key] = sound_event_id
+            self._sound_events.append(self._flyweights.intern_sound_event(sound_event))
+        return sound_event_id
+
+    def get_sound_event_id(self, key):
+        """
+        :param key: hash of a sound event
+        :return: the id of the sound event with the hash, None if there is none
+        """
+        return self._sound_event_ids.get(key)
 
-    def first(self):
-        return self.components[0]
+    def intern_component(self, sound_event, tempo_event=None, pause_to_next_event=0, pause_to_previous_event=0):
+        """
+        :return: the id of the frame component with the given sound event and timing data
+        """
+        return self.intern_component_id(self.intern_sound_event(sound_event), tempo_event, pause_to_next_event,
+                                        pause_to_previous_event)
 
-    def last(self):
-        return self.components[-1]
+    def intern_component_id(self, sound_event_id, tempo_event=None, pause_to_next_event=0, pause_to_previous_event=0):
+        """
+        :param sound_event_id: id of a sound event of this vocabulary
+        :return: the id of the frame component with the given sound event and timing data
+        """
+        key = (sound_event_id, tempo_event_key(tempo_event), pause_to_next_event, pause_to_previous_event)
+        component_id = self._component_ids.get(key)
+        if component_id is None:
+            component_id = len(self._components)
+            self._component_ids[key] = component_id
+            self._component_keys.append(key)
+            self._components.append(FrameComponent(sound_event=self._sound_events[sound_event_id],
+                                                   tempo_event=tempo_event,
+                                                   pause_to_next_event=pause_to_next_event,
+                                                   pause_to_previous_event=pause_to_previous_event))
+        return component_id
+
+    def intern_vocabulary(self, other):
+        """
+        Interns every component of another vocabulary
+        :param other: vocabulary
+        :return: list that maps the component ids of the other vocabulary to the ids of this one
+        """
+        component_ids = []
+        for component_id in range(len(other)):
+            component = other.get_component(component_id)
+            component_ids.append(self.intern_component(component.get_sound_event(), component.get_tempo_event(),
+                                                       pause_to_next_event=component.pause_to_next_event,
+                                                       pause_to_previous_event=component.pause_to_previous_event))
+        return component_ids
+
+    def get_component(self, component_id):
+        return self._components[component_id]
+
+    def get_components(self, component_ids):
+        """
+        :param component_ids: iterable of component ids, such as a frame
+        :return: tuple of frame components
+        """
+        return tuple(self._components[component_id] for component_id in component_ids)
 
-    def __sizeof__(self):
-        return len(self.components)
+    def get_component_key(self, component_id):
+        """
+        :return: (sound event id, tempo key, pause to next, pause to previous) of the component
+        """
+        return self._component_keys[component_id]
 
-    def __hash__(self):
-        if not self.hash:
-            self.hash = hash(self.components)
-        return self.hash
+    def get_sound_event(self, sound_event_id):
+        return self._sound_events[sound_event_id]
 
-    def __eq__(self, other):
-        return self.__hash__() == other.__hash__()
+    def get_sound_events(self):
+        """
+        :return: list of sound events indexed by their id
+        """
+        return self._sound_events
 
-    def __str__(self):
-        string = "Frame:"
-        for component in self.components:
-            string += str(component) + ","
-        return string
+    def __len__(self):
+        return len(self._components)
 
 
 class FrameComponent(object):
     """
     Encapsulates the sound event object and data regarding timing
     """
+    __slots__ = ('sound_event', 'tempo_event', 'pause_to_next_event', 'pause_to_previous_event', 'hash')
+
     def __init__(self, sound_event, tempo_event=None, pause_to_next_event=0, pause_to_previous_event=0):
         self.sound_event = sound_event
         self.tempo_event = tempo_event
@@ -307,6 +676,8 @@ class FrameStatisticalData(object):
     It is crucial in the generation process as next frames are selected based on the comparison
     algorithm of this class
     """
+    __slots__ = ('count', 'last_played_elapsed')
+
     def __init__(self):
         # number of times the frame associated with this data has appeared before
         self.count = 0
@@ -329,5 +700,22 @@ def hash_sound_event(frame_component):
     return hash(frame_component.sound_event)
 
 
+def tempo_event_key(tempo_event):
+    """
+    :param tempo_event: Midi tempo event or None
+    :return: hashable value that is equal for tempo events with the same data
+    """
+    if tempo_event is None:
+        return None
+    return tuple(tempo_event.data)
+
+
+def frame_to_string(components):
+    string = "Frame:"
+    for component in components:
+        string += str(component) + ","
+    return string
+
+
 frame_statistical_data_comparison_function = prioritize_count_and_last_played_elapsed
 frame_component_hash_function = hash_sound_event
@@ -0,0 +1,274 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+from graphmodel.appio import applogger, midistream
+
+__author__ = 'Adisor'
+
+"""
+Content addressed caches kept on disk, and an in-process cache of built objects
+
+Each entry is a file in the cache folder, named by its key. Reading an entry touches its modification time, so the
+oldest modification times belong to the least recently used entries, which are removed first when the folder grows
+over its size cap. Entries are written to a temporary file and renamed, so several processes can share a folder.
+"""
+
+logger = applogger.logger
+
+ENTRY_MAGIC = 'ADIC'
+# magic, payload length, crc32 of the payload
+ENTRY_HEADER = struct.Struct('<4sII')
+ENTRY_SUFFIX = '.entry'
+
+DEFAULT_TRANSCRIPT_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_OUTPUT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+def content_key(data, version):
+    """
+    :param data: String with the content that the entry is derived from
+    :param version: version of the code that derives the entry from the content
+    :return: String key
+    """
+    return '%s-v%s' % (hashlib.sha1(data).hexdigest(), version)
+
+
+class DiskCache(object):
+    """
+    Stores byte strings by key in a folder, with a size cap and least recently used eviction
+    """
+
+    def __init__(self, folder, max_bytes):
+        """
+        :param folder: String path, created if it does not exist
+        :param max_bytes: size cap of the entries in the folder
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    def get_entry_path(self, key):
+        return os.path.join(self.folder, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """
+        :param key: String key
+        :return: String stored under the key, None if there is no entry or it is damaged
+        """
+        entry_path = self.get_entry_path(key)
+        try:
+            with open(entry_path, 'rb') as entry_file:
+                data = entry_file.read()
+        except IOError:
+            self.misses += 1
+            return None
+        payload = data[ENTRY_HEADER.size:]
+        if len(data) < ENTRY_HEADER.size or (ENTRY_MAGIC, len(payload), zlib.crc32(payload) & 0xffffffff) != \
+                ENTRY_HEADER.unpack_from(data, 0):
+            logger.warning("Removing damaged cache entry %s", entry_path)
+            self.remove(entry_path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            # evicted by another process after it was read
+            pass
+        self.hits += 1
+        return payload
+
+    def put(self, key, payload):
+        """
+        Stores the payload under the key, then evicts the least recently used entries if the folder is over its cap
+        """
+        header = ENTRY_HEADER.pack(ENTRY_MAGIC, len(payload), zlib.crc32(payload) & 0xffffffff)
+        (handle, temporary_path) = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as entry_file:
+                entry_file.write(header + payload)
+            os.rename(temporary_path, self.get_entry_path(key))
+        except (IOError, OSError):
+            self.remove(temporary_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = self.list_entries()
+        size = sum(entry_size for (modification_time, entry_size, entry_path) in entries)
+        for (modification_time, entry_size, entry_path) in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            self.remove(entry_path)
+            self.evictions += 1
+            size -= entry_size
+
+    def list_entries(self):
+        """
+        :return: list of (modification time, size, path) of the entries in the folder
+        """
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            entry_path = os.path.join(self.folder, name)
+            try:
+                entry_stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+        return entries
+
+    @staticmethod
+    def remove(entry_path):
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for (modification_time, entry_size, entry_path) in self.list_entries():
+            self.remove(entry_path)
+
+    def get_stats(self):
+        """
+        :return: dict with the hit, miss and eviction counters of this object and the current size of the folder
+        """
+        entries = self.list_entries()
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(entries),
+                'size': sum(entry_size for (modification_time, entry_size, entry_path) in entries),
+                'max_size': self.max_bytes}
+
+
+class TranscriptCache(object):
+    """
+    Caches the decoded midi files by their content, so a file that was already seen is not parsed again
+
+    Only files that have the proper input format are stored, the others are decoded every time so their analysis
+    report can be rebuilt
+    """
+
+    def __init__(self, folder, max_bytes=DEFAULT_TRANSCRIPT_CACHE_SIZE):
+        self.disk_cache = DiskCache(folder, max_bytes)
+
+    def load_midi_arrays(self, midi_file_name, report):
+        """
+        :param midi_file_name: String path
+        :param report: AnalysisReport that receives the issues of the file when it is decoded
+        :return: MidiFileArrays
+        """
+        with open(midi_file_name, 'rb') as midi_file:
+            data = midi_file.read()
+        key = content_key(data, midistream.LOADER_VERSION)
+        encoded = self.disk_cache.get(key)
+        if encoded is not None:
+            return midistream.decode_midi_arrays(encoded)
+        midi_arrays = midistream.read_midi_bytes(data, report)
+        if report.is_valid():
+            self.disk_cache.put(key, midistream.encode_midi_arrays(midi_arrays))
+        return midi_arrays
+
+    def get_stats(self):
+        return self.disk_cache.get_stats()
+
+
+class OutputCache(object):
+    """
+    Caches generated midi files by the model they were generated from and the generation parameters
+    """
+
+    def __init__(self, folder, max_bytes=DEFAULT_OUTPUT_CACHE_SIZE):
+        self.disk_cache = DiskCache(folder, max_bytes)
+
+    @staticmethod
+    def get_key(model_key, policy, ticks, seed, version):
+        """
+        :param model_key: (content key of the input file, nsize)
+        :param version: version of the code that generates the output from the model
+        :return: String key
+        """
+        (input_key, nsize) = model_key
+        return '%s-n%s-p%s-t%s-s%s-g%s' % (input_key, nsize, policy, ticks, seed, version)
+
+    def get(self, key):
+        return self.disk_cache.get(key)
+
+    def put(self, key, data):
+        self.disk_cache.put(key, data)
+
+    def get_stats(self):
+        return self.disk_cache.get_stats()
+
+
+class MemoryCache(object):
+    """
+    Keeps built objects in memory by key, with a size cap and least recently used eviction
+
+    The size of an object is given by a function, usually an estimate, since python does not tell the size of an
+    object graph. The cache can be used from several threads
+    """
+
+    def __init__(self, max_size, get_size):
+        """
+        :param max_size: size cap of the objects in the cache
+        :param get_size: function that returns the size of an object
+        """
+        self.max_size = max_size
+        self.get_size = get_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # maps keys to (object, size) pairs, the least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: the object stored under the key, None if there is none
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Stores the object, then evicts the least recently used objects while the cache is over its cap
+        Objects bigger than the cap are not stored
+        """
+        size = self.get_size(value)
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.size -= old_entry[1]
+            if size > self.max_size:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                (evicted_value, evicted_size) = self._entries.popitem(last=False)[1]
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'size': self.size, 'max_size': self.max_size}
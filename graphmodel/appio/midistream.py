@@ -0,0 +1,323 @@
+import mmap
+import os
+import struct
+from collections import deque
+
+import numpy as np
+from midi import events
+
+from graphmodel.appio.preprocessing import AnalysisReport
+
+__author__ = 'Adisor'
+
+"""
+Streaming midi file reader that decodes the notes of each track straight into columnar arrays
+
+python-midi creates one object per event, which the transcript loader then converts into notes. This reader walks the
+bytes of each MTrk chunk once, decodes the delta times and the running status by hand, and only creates event objects
+for the few meta events that the transcript meta keeps (tempo, key signature, time signature).
+
+Note offs close the oldest open note with the same channel and pitch, so overlapping notes with the same pitch keep
+their own durations. Notes that are never closed keep a duration of 0.
+"""
+
+FILE_MAGIC = 'MThd'
+TRACK_MAGIC = 'MTrk'
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+PROGRAM_CHANGE = 0xC0
+CHANNEL_AFTER_TOUCH = 0xD0
+SYSEX = 0xF0
+SYSEX_ESCAPE = 0xF7
+META = 0xFF
+
+END_OF_TRACK = 0x2F
+SET_TEMPO = 0x51
+TIME_SIGNATURE = 0x58
+KEY_SIGNATURE = 0x59
+
+# meta events kept for the transcript meta
+KEPT_META_EVENTS = {SET_TEMPO: events.SetTempoEvent, TIME_SIGNATURE: events.TimeSignatureEvent,
+                    KEY_SIGNATURE: events.KeySignatureEvent}
+# meta events that should only be in the first track
+GLOBAL_META_EVENTS = (TIME_SIGNATURE, KEY_SIGNATURE)
+
+NOTE_DTYPE = np.int64
+
+# version of the decoded output, it is part of the cache keys so it should change whenever the decoding changes
+LOADER_VERSION = 1
+
+# compact encoding of the decoded file, used by the transcript cache
+ARRAYS_MAGIC = 'ADIMIDI1'
+ARRAYS_HEADER = struct.Struct('<8sHHI')
+# program (-1 if the track has none), number of notes, number of meta events, bytes per time
+TRACK_HEADER = struct.Struct('<iIIB')
+# start time, tick, meta command, data length
+META_EVENT_HEADER = struct.Struct('<qIBI')
+# times are stored in 4 bytes unless the track is too long for them
+TIME_DTYPES = {4: '<u4', 8: '<i8'}
+# pitches, velocities and channels fit in a byte
+BYTE_COLUMNS = ('pitches', 'velocities', 'channels')
+
+
+class MidiStreamError(Exception):
+    pass
+
+
+class MidiFileArrays(object):
+    """
+    The decoded midi file
+    """
+
+    def __init__(self, midiformat, resolution, tracks):
+        self.format = midiformat
+        self.resolution = resolution
+        # list of MidiTrackArrays in the order of the file
+        self.tracks = tracks
+
+
+class MidiTrackArrays(object):
+    """
+    The notes of one track, one array element per note in the order of their note on events, plus the track meta
+    """
+
+    def __init__(self, starts, durations, pitches, velocities, channels, program, meta_events):
+        self.starts = np.array(starts, dtype=NOTE_DTYPE)
+        self.durations = np.array(durations, dtype=NOTE_DTYPE)
+        self.pitches = np.array(pitches, dtype=NOTE_DTYPE)
+        self.velocities = np.array(velocities, dtype=NOTE_DTYPE)
+        self.channels = np.array(channels, dtype=NOTE_DTYPE)
+        # data of the first program change event, None if the track has none
+        self.program = program
+        # list of (start time, midi meta event) tuples, the events have the delta time as tick like python-midi
+        self.meta_events = meta_events
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def read_midi_file(midi_file_name, report=None):
+    """
+    Maps the file into memory and decodes it
+    :param midi_file_name: String path
+    :param report: AnalysisReport that receives the issues of the tracks
+    :return: MidiFileArrays
+    """
+    with open(midi_file_name, 'rb') as midi_file:
+        if os.fstat(midi_file.fileno()).st_size == 0:
+            raise MidiStreamError("Empty MIDI file: " + midi_file_name)
+        mapped_file = mmap.mmap(midi_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return read_midi_bytes(mapped_file, report)
+        finally:
+            mapped_file.close()
+
+
+def read_midi_bytes(data, report=None):
+    """
+    :param data: contents of a midi file, str, buffer or mmap
+    :param report: AnalysisReport that receives the issues of the tracks
+    :return: MidiFileArrays
+    """
+    if report is None:
+        report = AnalysisReport()
+    (midiformat, track_count, resolution, position) = read_header(data)
+    try:
+        tracks = [decode_track(chunk, track_index, report)
+                  for (track_index, chunk) in enumerate(iter_track_chunks(data, position, track_count))]
+    except IndexError:
+        raise MidiStreamError("Truncated track in MIDI file")
+    return MidiFileArrays(midiformat, resolution, tracks)
+
+
+def read_header(data):
+    """
+    :return: (format, number of tracks, resolution, position of the first chunk after the header)
+    """
+    if data[0:4] != FILE_MAGIC:
+        raise MidiStreamError("Bad header in MIDI file.")
+    (header_size, midiformat, track_count, resolution) = struct.unpack('>LHHH', data[4:14])
+    return midiformat, track_count, resolution, 8 + header_size
+
+
+def iter_track_chunks(data, position, track_count):
+    """
+    Yields the contents of the MTrk chunks one at a time, chunks of other types are skipped
+    """
+    end = len(data)
+    tracks = 0
+    while tracks < track_count and position + 8 <= end:
+        magic = data[position:position + 4]
+        (size,) = struct.unpack('>L', data[position + 4:position + 8])
+        position += 8
+        if position + size > end:
+            raise MidiStreamError("Truncated chunk in MIDI file: " + magic)
+        if magic == TRACK_MAGIC:
+            tracks += 1
+            yield data[position:position + size]
+        position += size
+
+
+def decode_track(chunk, track_index, report):
+    """
+    Decodes the events of one track
+    :param chunk: contents of the MTrk chunk
+    :param track_index: index of the track in the file
+    :param report: AnalysisReport that receives the issues of the track
+    :return: MidiTrackArrays
+    """
+    data = bytearray(chunk)
+    end = len(data)
+    position = 0
+    present_time = 0
+    running_status = 0
+    track_channel = None
+    has_multiple_channels = False
+    program = None
+    meta_events = []
+    starts = []
+    durations = []
+    pitches = []
+    velocities = []
+    channels = []
+    # (channel, pitch) -> deque of the indexes of the notes that are still on, oldest first
+    on_notes = {}
+    while position < end:
+        (delta, position) = read_varlen(data, position)
+        present_time += delta
+        status = data[position]
+        if status & 0x80:
+            position += 1
+            if status < SYSEX:
+                running_status = status
+        elif running_status:
+            # running status, the byte is the first data byte of the event
+            status = running_status
+        else:
+            raise MidiStreamError("Bad byte value in track %s" % track_index)
+
+        if status == META:
+            command = data[position]
+            (length, position) = read_varlen(data, position + 1)
+            if command in KEPT_META_EVENTS:
+                event = KEPT_META_EVENTS[command](tick=delta, data=list(data[position:position + length]))
+                if track_index > 0 and command in GLOBAL_META_EVENTS:
+                    report.add_issue(AnalysisReport.MISPLACED_GLOBAL_META_EVENT, track_index, event)
+                meta_events.append((present_time, event))
+            position += length
+            if command == END_OF_TRACK:
+                break
+            continue
+        if status == SYSEX or status == SYSEX_ESCAPE:
+            (length, position) = read_varlen(data, position)
+            position += length
+            continue
+        if status > SYSEX:
+            raise MidiStreamError("Unsupported system message %s in track %s" % (status, track_index))
+
+        kind = status & 0xF0
+        channel = status & 0x0F
+        if kind == PROGRAM_CHANGE or kind == CHANNEL_AFTER_TOUCH:
+            first = data[position]
+            second = 0
+            position += 1
+        else:
+            first = data[position]
+            second = data[position + 1]
+            position += 2
+
+        if track_channel is None:
+            track_channel = channel
+        elif track_channel != channel and not has_multiple_channels:
+            has_multiple_channels = True
+            event_data = [first] if kind == PROGRAM_CHANGE or kind == CHANNEL_AFTER_TOUCH else [first, second]
+            event = events.EventRegistry.Events[kind](tick=delta, channel=channel, data=event_data)
+            report.add_issue(AnalysisReport.MULTIPLE_CHANNELS, track_index, event)
+
+        if kind == NOTE_ON and second > 0:
+            key = (channel, first)
+            if key not in on_notes:
+                on_notes[key] = deque()
+            on_notes[key].append(len(starts))
+            starts.append(present_time)
+            durations.append(0)
+            pitches.append(first)
+            velocities.append(second)
+            channels.append(channel)
+        elif kind == NOTE_ON or kind == NOTE_OFF:
+            open_notes = on_notes.get((channel, first))
+            if open_notes:
+                note_index = open_notes.popleft()
+                durations[note_index] = present_time - starts[note_index]
+        elif kind == PROGRAM_CHANGE and program is None:
+            program = first
+    return MidiTrackArrays(starts, durations, pitches, velocities, channels, program, meta_events)
+
+
+def read_varlen(data, position):
+    """
+    Decodes a variable length quantity
+    :param data: bytearray
+    :param position: index of the first byte of the quantity
+    :return: (value, position after the quantity)
+    """
+    byte = data[position]
+    position += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+    return value, position
+
+
+def encode_midi_arrays(midi_arrays):
+    """
+    :param midi_arrays: MidiFileArrays
+    :return: String with the compact encoding of the decoded file
+    """
+    chunks = [ARRAYS_HEADER.pack(ARRAYS_MAGIC, midi_arrays.format, midi_arrays.resolution, len(midi_arrays.tracks))]
+    for track in midi_arrays.tracks:
+        program = -1 if track.program is None else track.program
+        end_time = int((track.starts + track.durations).max()) if len(track) > 0 else 0
+        time_size = 4 if end_time <= 0xFFFFFFFF else 8
+        chunks.append(TRACK_HEADER.pack(program, len(track), len(track.meta_events), time_size))
+        for column in (track.starts, track.durations):
+            chunks.append(column.astype(TIME_DTYPES[time_size]).tobytes())
+        for name in BYTE_COLUMNS:
+            chunks.append(getattr(track, name).astype(np.uint8).tobytes())
+        for (start_time, event) in track.meta_events:
+            chunks.append(META_EVENT_HEADER.pack(start_time, event.tick, event.metacommand, len(event.data)))
+            chunks.append(str(bytearray(event.data)))
+    return ''.join(chunks)
+
+
+def decode_midi_arrays(data):
+    """
+    :param data: String made by encode_midi_arrays
+    :return: MidiFileArrays
+    """
+    (magic, midiformat, resolution, track_count) = ARRAYS_HEADER.unpack_from(data, 0)
+    if magic != ARRAYS_MAGIC:
+        raise MidiStreamError("Not an encoded midi file")
+    position = ARRAYS_HEADER.size
+    tracks = []
+    for track_index in range(track_count):
+        (program, note_count, meta_event_count, time_size) = TRACK_HEADER.unpack_from(data, position)
+        position += TRACK_HEADER.size
+        columns = []
+        for dtype in (TIME_DTYPES[time_size], TIME_DTYPES[time_size]) + (np.uint8,) * len(BYTE_COLUMNS):
+            column = np.frombuffer(data, dtype=dtype, count=note_count, offset=position)
+            columns.append(column.astype(NOTE_DTYPE))
+            position += column.nbytes
+        meta_events = []
+        for meta_event_index in range(meta_event_count):
+            (start_time, tick, command, length) = META_EVENT_HEADER.unpack_from(data, position)
+            position += META_EVENT_HEADER.size
+            event_data = list(bytearray(data[position:position + length]))
+            meta_events.append((start_time, KEPT_META_EVENTS[command](tick=tick, data=event_data)))
+            position += length
+        program = None if program < 0 else program
+        tracks.append(MidiTrackArrays(*(columns + [program, meta_events])))
+    return MidiFileArrays(midiformat, resolution, tracks)
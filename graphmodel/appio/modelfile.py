@@ -0,0 +1,542 @@
+import mmap
+import struct
+import zlib
+import random
+
+import midi
+import numpy
+
+from graphmodel.NGram import MultiInstrumentNGram, FrameComponent
+from graphmodel.model.SongObjects import InstrumentSoundEvent, Note
+from graphmodel.utils.sampling import AliasTable
+
+__author__ = 'Adisor'
+
+"""
+BINARY MODEL FILE FORMAT, ALL NUMBERS ARE LITTLE ENDIAN:
+HEADER: magic, format version (uint32), number of sections (uint32), nsize (int64), crc32 of the section data (uint32)
+SECTION TABLE: one entry per section: name (24 bytes), numpy dtype (8 bytes), rows, columns and offset (uint64)
+SECTION DATA: each section is a C ordered array that starts at a multiple of 8 bytes
+
+SECTIONS:
+note_starts, note_durations, note_pitches, note_volumes: the notes of all sound events
+sound_event_notes: sound event i has the notes from sound_event_notes[i] to sound_event_notes[i + 1]
+tempo_bytes, tempo_offsets: data of the distinct tempo events, laid out like the notes of the sound events
+components: one row per component id: sound event id, tempo id (-1 for no tempo), pause to next, pause to previous
+instruments: instrument numbers
+instrument_frames: the frames and counts of instrument i are the rows from instrument_frames[i] to [i + 1]
+frames: one row of component ids per frame, each instrument's frames are in order of first appearance
+counts: count of each frame, integers unless the model was merged with weights (since version 2)
+instrument_contexts: the contexts of instrument i are from instrument_contexts[i] to [i + 1]
+context_ids: the first component ids of the frames of each instrument, sorted
+context_frames: the frames of context i are from context_frames[i] to [i + 1] in index_frames
+index_frames: rows of the frames that start with each context, sorted by count like the indexer sorts them
+"""
+
+MAGIC = 'ADIMODEL'
+# version 2 allows weighted, floating point counts
+FORMAT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+HEADER = struct.Struct('<8sIIqI4x')
+SECTION_ENTRY = struct.Struct('<24s8sQQQ')
+ALIGNMENT = 8
+
+# section name -> dtype
+SECTION_DTYPES = {
+    'note_starts': '<i8',
+    'note_durations': '<i8',
+    'note_pitches': '<i4',
+    'note_volumes': '<i4',
+    'sound_event_notes': '<i8',
+    'tempo_bytes': '|u1',
+    'tempo_offsets': '<i8',
+    'components': '<i8',
+    'instruments': '<i8',
+    'instrument_frames': '<i8',
+    'frames': '<i4',
+    'counts': '<i8',
+    'instrument_contexts': '<i8',
+    'context_ids': '<i4',
+    'context_frames': '<i8',
+    'index_frames': '<i8',
+}
+
+
+# dtype of the counts of weighted models
+FLOAT_COUNT_DTYPE = '<f8'
+
+
+class ModelFileError(Exception):
+    pass
+
+
+def save_model(multi_instrument_ngram, model_file_name):
+    """
+    Writes the ngram to a binary model file
+    :param multi_instrument_ngram: built ngram
+    :param model_file_name: String path
+    """
+    data = encode_sections(model_sections(multi_instrument_ngram), multi_instrument_ngram.nsize)
+    with open(model_file_name, 'wb') as model_file:
+        model_file.write(data)
+
+
+def load_model(model_file_name, validate=True):
+    """
+    Reads a binary model file back into a MultiInstrumentNGram, without reading any midi
+    :param model_file_name: String path
+    :param validate: check the checksum of the section data
+    :return: MultiInstrumentNGram
+    """
+    with open(model_file_name, 'rb') as model_file:
+        data = model_file.read()
+    (nsize, sections) = decode_sections(data, validate)
+    return build_model(nsize, sections)
+
+
+def map_model(model_file_name, validate=False):
+    """
+    Memory maps a binary model file for read-only use. Nothing is copied out of the file: frames, counts and context
+    ranges are numpy views of the mapped sections, so processes that map the same file share its memory
+    :param model_file_name: String path
+    :param validate: check the checksum of the section data, which reads the whole file
+    :return: MappedMultiInstrumentNGram
+    """
+    with open(model_file_name, 'rb') as model_file:
+        mapped_file = mmap.mmap(model_file.fileno(), 0, access=mmap.ACCESS_READ)
+    (nsize, sections) = decode_sections(mapped_file, validate)
+    return MappedMultiInstrumentNGram(nsize, sections, mapped_file)
+
+
+def model_sections(multi_instrument_ngram):
+    """
+    Flattens the ngram into the arrays of the model file
+    :return: dict that maps section names to numpy arrays
+    """
+    nsize = multi_instrument_ngram.nsize
+    vocabulary = multi_instrument_ngram.vocabulary
+    sections = {}
+
+    notes = []
+    sound_event_notes = [0]
+    for sound_event in vocabulary.get_sound_events():
+        for note in sound_event.get_notes():
+            notes.append((note.start_time, note.duration, note.pitch, note.volume))
+        sound_event_notes.append(len(notes))
+    note_columns = numpy.array(notes, dtype=numpy.int64).reshape(-1, 4)
+    sections['note_starts'] = note_columns[:, 0]
+    sections['note_durations'] = note_columns[:, 1]
+    sections['note_pitches'] = note_columns[:, 2]
+    sections['note_volumes'] = note_columns[:, 3]
+    sections['sound_event_notes'] = sound_event_notes
+
+    tempo_ids = {}
+    tempo_bytes = []
+    tempo_offsets = [0]
+    components = []
+    for component_id in range(len(vocabulary)):
+        (sound_event_id, tempo_key, pause_to_next, pause_to_previous) = vocabulary.get_component_key(component_id)
+        tempo_id = -1
+        if tempo_key is not None:
+            if tempo_key not in tempo_ids:
+                tempo_ids[tempo_key] = len(tempo_ids)
+                tempo_bytes.extend(tempo_key)
+                tempo_offsets.append(len(tempo_bytes))
+            tempo_id = tempo_ids[tempo_key]
+        components.append((sound_event_id, tempo_id, pause_to_next, pause_to_previous))
+    sections['tempo_bytes'] = tempo_bytes
+    sections['tempo_offsets'] = tempo_offsets
+    sections['components'] = numpy.array(components, dtype=numpy.int64).reshape(-1, 4)
+
+    instruments = multi_instrument_ngram.get_instruments()
+    frames = []
+    counts = []
+    instrument_frames = [0]
+    instrument_contexts = [0]
+    context_ids = []
+    context_frames = [0]
+    index_frames = []
+    for instrument in instruments:
+        ngram = multi_instrument_ngram.get_ngram(instrument)
+        first_row = len(frames)
+        instrument_counts = [ngram.frame_distribution[frame].count for frame in ngram.frames]
+        frames.extend(ngram.frames)
+        counts.extend(instrument_counts)
+        instrument_frames.append(len(frames))
+        if nsize > 0 and len(ngram.frames) > 0:
+            first_ids = numpy.array([frame[0] for frame in ngram.frames], dtype=numpy.int64)
+            # stable, so frames with the same count keep their order of first appearance like in the indexer
+            order = numpy.lexsort((numpy.array(instrument_counts), first_ids))
+            (contexts, context_starts) = numpy.unique(first_ids[order], return_index=True)
+            context_ids.extend(contexts.tolist())
+            context_frames.extend((context_starts[1:] + len(index_frames)).tolist())
+            index_frames.extend((order + first_row).tolist())
+            context_frames.append(len(index_frames))
+        instrument_contexts.append(len(context_ids))
+    sections['instruments'] = instruments
+    sections['instrument_frames'] = instrument_frames
+    sections['frames'] = numpy.array(frames, dtype=numpy.int64).reshape(len(frames), nsize)
+    sections['counts'] = counts
+    sections['instrument_contexts'] = instrument_contexts
+    sections['context_ids'] = context_ids
+    sections['context_frames'] = context_frames
+    sections['index_frames'] = index_frames
+
+    for name in sections:
+        sections[name] = numpy.ascontiguousarray(sections[name], dtype=SECTION_DTYPES[name])
+    if not all(isinstance(count, (int, long)) for count in counts):
+        sections['counts'] = numpy.ascontiguousarray(counts, dtype=FLOAT_COUNT_DTYPE)
+    return sections
+
+
+def encode_sections(sections, nsize):
+    """
+    :param sections: dict that maps section names to numpy arrays
+    :param nsize: nsize of the ngram
+    :return: the bytes of the model file
+    """
+    names = sorted(sections)
+    offset = align(HEADER.size + SECTION_ENTRY.size * len(names))
+    data_start = offset
+    entries = []
+    chunks = []
+    for name in names:
+        array = sections[name]
+        columns = array.shape[1] if array.ndim == 2 else 0
+        entries.append(SECTION_ENTRY.pack(name, array.dtype.str, array.shape[0], columns, offset))
+        chunk = array.tobytes()
+        padding = align(len(chunk)) - len(chunk)
+        chunks.append(chunk + '\0' * padding)
+        offset += len(chunk) + padding
+    data = ''.join(chunks)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(names), nsize, zlib.crc32(data) & 0xffffffff)
+    table = header + ''.join(entries)
+    return table + '\0' * (data_start - len(table)) + data
+
+
+def decode_sections(data, validate=True):
+    """
+    Reads the header and the section table, the arrays are views into data and are not copied
+    :param data: bytes, mmap or any other buffer with the contents of a model file
+    :param validate: check the checksum of the section data
+    :return: (nsize, dict that maps section names to numpy arrays)
+    """
+    if len(data) < HEADER.size:
+        raise ModelFileError("Model file is too short")
+    (magic, version, section_count, nsize, checksum) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ModelFileError("Not a model file")
+    if version not in SUPPORTED_VERSIONS:
+        raise ModelFileError("Unsupported model file version: %s" % version)
+    data_start = align(HEADER.size + SECTION_ENTRY.size * section_count)
+    if len(data) < data_start:
+        raise ModelFileError("Model file section table is truncated")
+    if validate and zlib.crc32(buffer(data, data_start)) & 0xffffffff != checksum:
+        raise ModelFileError("Model file checksum does not match")
+    sections = {}
+    for index in range(section_count):
+        entry = SECTION_ENTRY.unpack_from(data, HEADER.size + index * SECTION_ENTRY.size)
+        (name, dtype, rows, columns, offset) = entry
+        name = name.rstrip('\0')
+        dtype = numpy.dtype(dtype.rstrip('\0'))
+        if name not in SECTION_DTYPES or dtype not in section_dtypes(name, version):
+            raise ModelFileError("Unknown model file section: %s %s" % (name, dtype))
+        size = rows * max(columns, 1)
+        if offset % ALIGNMENT != 0 or offset < data_start or offset + size * dtype.itemsize > len(data):
+            raise ModelFileError("Model file section %s is out of bounds" % name)
+        array = numpy.frombuffer(data, dtype=dtype, count=size, offset=offset)
+        sections[name] = array.reshape(rows, columns) if columns > 0 else array
+    missing = set(SECTION_DTYPES) - set(sections)
+    if missing:
+        raise ModelFileError("Model file is missing sections: %s" % ", ".join(sorted(missing)))
+    check_sections(nsize, sections)
+    return nsize, sections
+
+
+def section_dtypes(name, version):
+    """
+    :return: list of the dtypes the section can have in the format version
+    """
+    dtypes = [numpy.dtype(SECTION_DTYPES[name])]
+    if name == 'counts' and version >= 2:
+        dtypes.append(numpy.dtype(FLOAT_COUNT_DTYPE))
+    return dtypes
+
+
+def check_sections(nsize, sections):
+    """
+    Checks that the sections fit together, so that lookups into them stay in bounds
+    """
+    def check(condition, message):
+        if not condition:
+            raise ModelFileError("Invalid model file: %s" % message)
+
+    def check_offsets(offsets, total, name):
+        check(len(offsets) > 0 and offsets[0] == 0 and offsets[-1] == total, name + " offsets")
+        check(numpy.all(numpy.diff(offsets) >= 0), name + " offsets are not sorted")
+
+    note_count = len(sections['note_starts'])
+    for name in ('note_durations', 'note_pitches', 'note_volumes'):
+        check(len(sections[name]) == note_count, name + " length")
+    check_offsets(sections['sound_event_notes'], note_count, "sound event")
+    check_offsets(sections['tempo_offsets'], len(sections['tempo_bytes']), "tempo")
+    components = sections['components']
+    check(components.ndim == 2 and components.shape[1] == 4, "component columns")
+    if len(components) > 0:
+        check(0 <= components[:, 0].min() and components[:, 0].max() < len(sections['sound_event_notes']) - 1,
+              "component sound event ids")
+        check(-1 <= components[:, 1].min() and components[:, 1].max() < len(sections['tempo_offsets']) - 1,
+              "component tempo ids")
+    frames = sections['frames']
+    check(len(frames) == 0 or (frames.ndim == 2 and frames.shape[1] == nsize), "frame columns")
+    if frames.size > 0:
+        check(0 <= frames.min() and frames.max() < len(components), "frame component ids")
+    check(len(sections['counts']) == len(frames), "counts length")
+    instrument_count = len(sections['instruments'])
+    check(len(sections['instrument_frames']) == instrument_count + 1, "instrument frames length")
+    check_offsets(sections['instrument_frames'], len(frames), "instrument frames")
+    check(len(sections['instrument_contexts']) == instrument_count + 1, "instrument contexts length")
+    check_offsets(sections['instrument_contexts'], len(sections['context_ids']), "instrument contexts")
+    check(len(sections['context_frames']) == len(sections['context_ids']) + 1, "context frames length")
+    check_offsets(sections['context_frames'], len(sections['index_frames']), "context frames")
+    index_frames = sections['index_frames']
+    if len(index_frames) > 0:
+        check(0 <= index_frames.min() and index_frames.max() < len(frames), "index frames")
+
+
+def build_model(nsize, sections):
+    """
+    Rebuilds the ngram objects from the model file sections
+    :return: MultiInstrumentNGram
+    """
+    multi_instrument_ngram = MultiInstrumentNGram(nsize)
+    (sound_event_ids, component_ids) = add_sections(multi_instrument_ngram, sections)
+    for (name, ids) in (("sound event", sound_event_ids), ("component", component_ids)):
+        for (index, mapped_id) in enumerate(ids):
+            if index != mapped_id:
+                raise ModelFileError("Invalid model file: duplicate %s %s" % (name, index))
+    return multi_instrument_ngram
+
+
+def add_sections(multi_instrument_ngram, sections):
+    """
+    Adds the sound events, components and frame counts of the sections to the ngram. The ids used in the sections are
+    interned again into the vocabulary of the ngram, so the sections can come from a different model
+    :param multi_instrument_ngram: MultiInstrumentNGram with the same nsize as the sections
+    :param sections: dict that maps section names to numpy arrays
+    :return: (sound event ids, component ids) lists that map the ids of the sections to the ids of the ngram
+    """
+    vocabulary = multi_instrument_ngram.vocabulary
+    frames = sections['frames']
+    if len(frames) > 0 and frames.shape[1] != multi_instrument_ngram.nsize:
+        raise ValueError("Can not add frames of size %s to an ngram with nsize %s" %
+                         (frames.shape[1], multi_instrument_ngram.nsize))
+
+    sound_events = []
+    sound_event_ids = []
+    notes = zip(sections['note_starts'].tolist(), sections['note_durations'].tolist(),
+                sections['note_pitches'].tolist(), sections['note_volumes'].tolist())
+    note_offsets = sections['sound_event_notes'].tolist()
+    for index in range(len(note_offsets) - 1):
+        sound_event = InstrumentSoundEvent(Note(start_time=start_time, duration=duration, pitch=pitch, volume=volume)
+                                           for (start_time, duration, pitch, volume)
+                                           in notes[note_offsets[index]:note_offsets[index + 1]])
+        sound_event_ids.append(vocabulary.intern_sound_event(sound_event))
+        sound_events.append(sound_event)
+
+    tempo_bytes = sections['tempo_bytes'].tolist()
+    tempo_offsets = sections['tempo_offsets'].tolist()
+    tempo_events = [midi.SetTempoEvent(data=tempo_bytes[tempo_offsets[index]:tempo_offsets[index + 1]])
+                    for index in range(len(tempo_offsets) - 1)]
+
+    component_ids = []
+    for (sound_event_id, tempo_id, pause_to_next, pause_to_previous) in sections['components'].tolist():
+        tempo_event = tempo_events[tempo_id] if tempo_id >= 0 else None
+        component_ids.append(vocabulary.intern_component(sound_events[sound_event_id], tempo_event,
+                                                         pause_to_next_event=pause_to_next,
+                                                         pause_to_previous_event=pause_to_previous))
+
+    frames = numpy.array(component_ids, dtype=numpy.int64)[frames].tolist() if len(frames) > 0 else []
+    counts = sections['counts'].tolist()
+    instrument_frames = sections['instrument_frames'].tolist()
+    for (index, instrument) in enumerate(sections['instruments'].tolist()):
+        ngram = multi_instrument_ngram.get_or_create_ngram(instrument)
+        for row in range(instrument_frames[index], instrument_frames[index + 1]):
+            ngram.add_frame_count(tuple(frames[row]), counts[row])
+        ngram.sort_and_index()
+    return sound_event_ids, component_ids
+
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class MappedMultiInstrumentNGram(object):
+    """
+    Read-only MultiInstrumentNGram served from the sections of a memory mapped model file
+    """
+
+    def __init__(self, nsize, sections, mapped_file=None):
+        self.nsize = nsize
+        self.mapped_file = mapped_file
+        self.vocabulary = MappedFrameComponentVocabulary(sections)
+        self.instrument_ngrams = {}
+        instrument_frames = sections['instrument_frames']
+        instrument_contexts = sections['instrument_contexts']
+        for (index, instrument) in enumerate(sections['instruments'].tolist()):
+            frame_range = (int(instrument_frames[index]), int(instrument_frames[index + 1]))
+            context_range = (int(instrument_contexts[index]), int(instrument_contexts[index + 1]))
+            self.instrument_ngrams[instrument] = _MappedSingleInstrumentNGram(sections, self.vocabulary,
+                                                                              frame_range, context_range)
+
+    def get_ngram(self, instrument):
+        return self.instrument_ngrams[instrument]
+
+    def get_instruments(self):
+        return sorted(self.instrument_ngrams)
+
+    def close(self):
+        """
+        Unmaps the file, the ngram can not be used afterwards
+        """
+        self.instrument_ngrams = {}
+        self.vocabulary = None
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+            self.mapped_file = None
+
+
+class _MappedSingleInstrumentNGram(object):
+    """
+    Read-only _SingleInstrumentNGram of one instrument, its frames are the rows of a range of the frames section
+
+    Frames are returned as tuples of component ids, like in _SingleInstrumentNGram, and are only created when asked for
+    """
+
+    def __init__(self, sections, vocabulary, frame_range, context_range):
+        self.vocabulary = vocabulary
+        (first_row, end_row) = frame_range
+        (first_context, end_context) = context_range
+        self.frames = sections['frames'][first_row:end_row]
+        self.counts = sections['counts'][first_row:end_row]
+        self.context_ids = sections['context_ids'][first_context:end_context]
+        self.context_frames = sections['context_frames'][first_context:end_context + 1]
+        # rows of index frames are relative to the whole frames section
+        self.index_frames = sections['index_frames']
+        self.first_row = first_row
+        # maps component ids to (rows, alias table) pairs, built on the first draw from a context
+        self.context_samplers = {}
+
+    def get_context_rows(self, component_id):
+        """
+        :param component_id: id of the first component
+        :return: numpy array with the rows of the frames that start with the component, sorted by count
+        """
+        index = numpy.searchsorted(self.context_ids, component_id)
+        if index == len(self.context_ids) or self.context_ids[index] != component_id:
+            return self.index_frames[0:0]
+        rows = self.index_frames[self.context_frames[index]:self.context_frames[index + 1]]
+        return rows - self.first_row
+
+    def get_frame(self, row):
+        return tuple(self.frames[row].tolist())
+
+    def get_frame_counts(self):
+        return zip(map(tuple, self.frames.tolist()), self.counts.tolist())
+
+    def get_first_frame(self):
+        return self.get_frame(0)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def get_random_frame(self, rng=random):
+        return self.get_frame(rng.randint(0, len(self.frames) - 1))
+
+    def get_next_best_frame(self, component_id):
+        rows = self.get_context_rows(component_id)
+        if len(rows) == 0:
+            return None
+        return self.get_frame(rows[-1])
+
+    def get_next_frame_counts(self, component_id):
+        rows = self.get_context_rows(component_id)
+        return zip(map(tuple, self.frames[rows].tolist()), self.counts[rows].tolist())
+
+    def get_next_prob_frame(self, component_id, rng=random):
+        sampler = self.context_samplers.get(component_id)
+        if sampler is None:
+            # the rows in the order of the frames, which is the order the indexer draws from
+            rows = numpy.sort(self.get_context_rows(component_id))
+            rows = rows[self.counts[rows] > 0]
+            if len(rows) == 0:
+                return None
+            sampler = (rows, AliasTable(self.counts[rows].tolist()))
+            self.context_samplers[component_id] = sampler
+        (rows, alias_table) = sampler
+        return self.get_frame(rows[alias_table.sample(rng)])
+
+    def get_frame_components(self, frame):
+        return self.vocabulary.get_components(frame)
+
+
+class MappedFrameComponentVocabulary(object):
+    """
+    Read-only FrameComponentVocabulary served from the model file sections
+
+    Frame components and their sound events are created the first time they are asked for
+    """
+
+    def __init__(self, sections):
+        self.sections = sections
+        self._components = {}
+        self._sound_events = {}
+        self._tempo_events = {}
+
+    def get_component(self, component_id):
+        component = self._components.get(component_id)
+        if component is None:
+            (sound_event_id, tempo_id, pause_to_next, pause_to_previous) = \
+                self.sections['components'][component_id].tolist()
+            component = FrameComponent(sound_event=self.get_sound_event(sound_event_id),
+                                       tempo_event=self.get_tempo_event(tempo_id),
+                                       pause_to_next_event=pause_to_next, pause_to_previous_event=pause_to_previous)
+            self._components[component_id] = component
+        return component
+
+    def get_components(self, component_ids):
+        return tuple(self.get_component(component_id) for component_id in component_ids)
+
+    def get_component_key(self, component_id):
+        (sound_event_id, tempo_id, pause_to_next, pause_to_previous) = \
+            self.sections['components'][component_id].tolist()
+        tempo_event = self.get_tempo_event(tempo_id)
+        tempo_key = tuple(tempo_event.data) if tempo_event is not None else None
+        return sound_event_id, tempo_key, pause_to_next, pause_to_previous
+
+    def get_sound_event(self, sound_event_id):
+        sound_event = self._sound_events.get(sound_event_id)
+        if sound_event is None:
+            offsets = self.sections['sound_event_notes']
+            (start, end) = (offsets[sound_event_id], offsets[sound_event_id + 1])
+            notes = zip(self.sections['note_starts'][start:end].tolist(),
+                        self.sections['note_durations'][start:end].tolist(),
+                        self.sections['note_pitches'][start:end].tolist(),
+                        self.sections['note_volumes'][start:end].tolist())
+            sound_event = InstrumentSoundEvent(Note(*note) for note in notes)
+            self._sound_events[sound_event_id] = sound_event
+        return sound_event
+
+    def get_tempo_event(self, tempo_id):
+        if tempo_id < 0:
+            return None
+        tempo_event = self._tempo_events.get(tempo_id)
+        if tempo_event is None:
+            offsets = self.sections['tempo_offsets']
+            data = self.sections['tempo_bytes'][offsets[tempo_id]:offsets[tempo_id + 1]].tolist()
+            tempo_event = midi.SetTempoEvent(data=data)
+            self._tempo_events[tempo_id] = tempo_event
+        return tempo_event
+
+    def __len__(self):
+        return len(self.sections['components'])
@@ -1,38 +1,105 @@
 import midi
-import sys
+
 from graphmodel.utils import MidiUtils
 
 __author__ = 'Adisor'
 
 
+class AnalysisReport(object):
+    """
+    Structured result of the analysis of a midi pattern. Each issue names the rule that the pattern breaks, the track
+    where it was found and the event that breaks it
+    """
+    MULTIPLE_CHANNELS = "TRACK HAS MULTIPLE CHANNELS"
+    MISPLACED_GLOBAL_META_EVENT = "GLOBAL META EVENTS NEED TO BE IN THE FIRST TRACK"
+
+    def __init__(self):
+        # list of (rule, track index, midi event) tuples, in the order in which they were found
+        self.issues = []
+
+    def add_issue(self, rule, track_index, event):
+        self.issues.append((rule, track_index, event))
+
+    def is_valid(self):
+        return len(self.issues) == 0
+
+    def get_rules(self):
+        """
+        :return: the distinct rules broken by the pattern, in the order in which they were found
+        """
+        rules = []
+        for (rule, track_index, event) in self.issues:
+            if rule not in rules:
+                rules.append(rule)
+        return rules
+
+    def __str__(self):
+        return "\n".join("%s (track %s) %s" % (rule, track_index, event) for (rule, track_index, event) in self.issues)
+
+
+class MidiFormatError(Exception):
+    """
+    Raised when a midi file breaks the input format rules, holds the report of the analysis
+    """
+
+    def __init__(self, report):
+        Exception.__init__(self, ", ".join(report.get_rules()))
+        self.report = report
+
+
+class TrackAnalyzer(object):
+    """
+    Checks the events of one track as they are read, so the analysis can run in the same pass over the track that
+    loads it. Issues are added to the report that is shared by the tracks of the pattern
+    """
+
+    def __init__(self, track_index, report):
+        self.track_index = track_index
+        self.report = report
+        self.channel = None
+        self.has_multiple_channels = False
+
+    def check_event(self, event):
+        """
+        Each track should use a single channel and global meta events should be in the first track
+        :param event: Midi event of the track
+        """
+        if MidiUtils.is_channel_event(event):
+            if self.channel is None:
+                self.channel = event.channel
+            elif self.channel != event.channel and not self.has_multiple_channels:
+                # one issue per track is enough to reject it
+                self.has_multiple_channels = True
+                self.report.add_issue(AnalysisReport.MULTIPLE_CHANNELS, self.track_index, event)
+        if self.track_index > 0 and MidiUtils.is_song_meta_event(event):
+            self.report.add_issue(AnalysisReport.MISPLACED_GLOBAL_META_EVENT, self.track_index, event)
+
+
 class Analyzer(object):
     """
     Class is used for analyzing, input curation, validation, and pre-processing a midi file before execution.
     With this class, we can capture events that are not being processed or midi patterns that break our
-    rules or assumptions. If any pattern would break our rules or assumptions, the program exits.
+    rules or assumptions. The analysis returns a report of the patterns that would break them.
+
+    The transcript loader runs the same checks while it loads the tracks, this class is for analyzing a file on its own
     """
-    DO_EXIT = True
 
-    def __init__(self, midi_file_name):
-        self.pattern = midi.read_midifile(midi_file_name)
+    def __init__(self, midi_file_name=None, pattern=None):
+        """
+        :param midi_file_name: String path, read if no pattern is given
+        :param pattern: already parsed midi pattern
+        """
+        if pattern is None:
+            pattern = midi.read_midifile(midi_file_name)
+        self.pattern = pattern
 
     def perform_analysis(self):
-        # check for unprocessed events
-        for track in self.pattern:
-            channel = -1
-            for event in track:
-                if MidiUtils.is_channel_event(event):
-                    if channel == -1:
-                        channel = event.channel
-                    if channel != event.channel:
-                        print "TRACK HAS MULTIPLE CHANNELS"
-                        if Analyzer.DO_EXIT:
-                            sys.exit(-1)
-
-        # global meta events should be in the first track
-        for i in range(1, len(self.pattern), 1):
-            for event in self.pattern[i]:
-                if MidiUtils.is_song_meta_event(event):
-                    print "GLOBAL META EVENTS NEED TO BE IN THE FIRST TRACK", event
-                    if Analyzer.DO_EXIT:
-                        sys.exit(-1)
+        """
+        :return: AnalysisReport
+        """
+        report = AnalysisReport()
+        for track_index in range(0, len(self.pattern), 1):
+            track_analyzer = TrackAnalyzer(track_index, report)
+            for event in self.pattern[track_index]:
+                track_analyzer.check_event(event)
+        return report
@@ -1,12 +1,13 @@
+from collections import OrderedDict
+
 import midi
 import pygame
 
-from graphmodel.appio import applogger
-from graphmodel.appio.preprocessing import Analyzer
+from graphmodel.appio import applogger, midistream
+from graphmodel.appio.preprocessing import AnalysisReport, MidiFormatError, TrackAnalyzer
 from graphmodel.model import instruments
 from graphmodel.model.Meta import TranscriptMeta
 from graphmodel.model.Song import SongTranscript, InstrumentTrack
-from graphmodel.model.SongObjects import Note
 from graphmodel.utils import MidiUtils
 
 __author__ = 'Adisor'
@@ -20,18 +21,39 @@ EACH TRACK HAS ONLY 1 CHANNEL AND 1 INSTRUMENT
 
 logger = applogger.logger
 
+# on-disk TranscriptCache of the decoded midi files, None to decode the files every time
+transcript_cache = None
+
 
 def load_transcript(midi_file_name):
     """
     Creates a transcript from the midi file and returns it
-    First runs an analysis on the file to check for irregularities in the data
+    The file is decoded once by the streaming reader, which also analyzes it for irregularities in the data.
+    If the transcript cache is set and already has the content of the file, the file is not decoded at all
+    :raises MidiFormatError: if the file breaks the input format rules, the error holds the analysis report
+    """
+    (transcript, report) = load_transcript_with_report(midi_file_name)
+    if not report.is_valid():
+        raise MidiFormatError(report)
+    return transcript
+
+
+def load_transcript_with_report(midi_file_name):
+    """
+    Loads the transcript without rejecting the file if it breaks the input format rules
+    :param midi_file_name: String path
+    :return: (SongTranscript, AnalysisReport)
     """
-    analyzer = Analyzer(midi_file_name=midi_file_name)
-    analyzer.perform_analysis()
+    report = AnalysisReport()
+    if transcript_cache is None:
+        midi_arrays = midistream.read_midi_file(midi_file_name, report)
+    else:
+        midi_arrays = transcript_cache.load_midi_arrays(midi_file_name, report)
+    logger.debug("Read %s with %s tracks", midi_file_name, len(midi_arrays.tracks))
     loader = TranscriptLoader()
-    loader.load(midi_file_name=midi_file_name)
-    logger.debug(loader.transcript)
-    return loader.transcript
+    loader.load_arrays(midi_arrays)
+    logger.debug("Loaded transcript of %s with instruments %s", midi_file_name, loader.transcript.get_instruments())
+    return loader.transcript, report
 
 
 def play_music(midi_file_name):
@@ -61,65 +83,138 @@ class TranscriptLoader(object):
         self.pattern = None
 
         self.transcript = SongTranscript()
+        # tracks of each instrument that are waiting to be merged, in the order in which they were loaded
+        self.instrument_tracks = OrderedDict()
 
     def load(self, midi_file_name):
         """
-        First load the context, then loop through each track and load the notes from the tracks
+        Parses the file, then loads the context and the notes of the tracks
+        :return: AnalysisReport of the file
         """
         self.pattern = midi.read_midifile(midi_file_name)
-        logger.debug("Loaded Pattern From File")
-        logger.debug(self.pattern)
-        self.load_meta()
-        self.load_tracks()
+        logger.debug("Loaded Pattern From File %s with %s tracks", midi_file_name, len(self.pattern))
+        return self.load_pattern(self.pattern)
 
-    def load_meta(self):
+    def load_arrays(self, midi_arrays):
+        """
+        Loads the meta and the notes decoded by the streaming reader. Like the pattern loader, it takes the meta from
+        the first track and the notes from the tracks after it, tracks without notes are not added to the transcript.
+        :param midi_arrays: MidiFileArrays
+        """
+        transcript_meta = TranscriptMeta(midiformat=midi_arrays.format, resolution=midi_arrays.resolution)
+        if len(midi_arrays.tracks) > 0:
+            for (start_time, event) in midi_arrays.tracks[0].meta_events:
+                set_meta_event(transcript_meta, start_time, event)
+        self.transcript.set_transcript_meta(transcript_meta)
+        for track_arrays in midi_arrays.tracks[1:]:
+            if len(track_arrays) == 0:
+                continue
+            track = InstrumentTrack.from_arrays(track_arrays.starts, track_arrays.durations, track_arrays.pitches,
+                                                track_arrays.velocities)
+            instrument = track_arrays.program
+            if instrument is None:
+                instrument = instruments.PIANO
+            self.add_track(instrument, track)
+        self.merge_tracks()
+
+    def load_pattern(self, pattern):
+        """
+        Makes a single pass over the events of each track, which checks them and loads them at the same time
+        :param pattern: parsed midi pattern
+        :return: AnalysisReport of the pattern
+        """
+        self.pattern = pattern
+        report = AnalysisReport()
+        self.load_meta(TrackAnalyzer(0, report))
+        self.load_tracks(report)
+        return report
+
+    def load_meta(self, track_analyzer):
         """
         Loads the metadata from the file into the transcript meta object which is then passed to the transcript object
+        :param track_analyzer: checks the events of the meta track
         """
         transcript_meta = TranscriptMeta(midiformat=self.pattern.format, resolution=self.pattern.resolution)
         start_time = 0
         for event in self.pattern[0]:
+            track_analyzer.check_event(event)
             start_time += event.tick
-            if MidiUtils.is_key_signature_event(event):
-                transcript_meta.key_signature_event = event
-            if MidiUtils.is_time_signature_event(event):
-                transcript_meta.time_signature_event = event
-            if MidiUtils.is_set_tempo_event(event):
-                transcript_meta.tempo_dict[start_time] = event
+            set_meta_event(transcript_meta, start_time, event)
         self.transcript.set_transcript_meta(transcript_meta)
 
-    def load_tracks(self):
+    def load_tracks(self, report):
         """
-        Loops through each track after the meta track (the first one), and checks to see if there are any
-        notes in the track, and if there are, it proceeds forward to load them.
+        Loops through each track after the meta track (the first one) and loads its notes. Tracks without notes are
+        still checked but are not added to the transcript.
+        :param report: AnalysisReport shared by the tracks
         """
         for track_index in range(1, len(self.pattern), 1):
-            if MidiUtils.has_notes(self.pattern[track_index]):
-                self.load_track(self.pattern[track_index])
+            self.load_track(self.pattern[track_index], TrackAnalyzer(track_index, report))
+        self.merge_tracks()
+
+    def add_track(self, instrument, track):
+        """
+        Keeps the track until all the tracks are loaded, so the tracks of an instrument are merged once
+        """
+        if instrument not in self.instrument_tracks:
+            self.instrument_tracks[instrument] = []
+        self.instrument_tracks[instrument].append(track)
 
-    def load_track(self, miditrack):
+    def merge_tracks(self):
+        """
+        Adds the loaded tracks to the transcript with a single merge per instrument
+        """
+        for (instrument, tracks) in self.instrument_tracks.items():
+            self.transcript.add_tracks(instrument, tracks)
+        self.instrument_tracks = OrderedDict()
+
+    def load_track(self, miditrack, track_analyzer):
         """
         The main method for converting the track data into sound events
 
         Loops sequentially through each event and does the following:
-        1. Update the current time from the event
-        2. If the event is a note on event, then create a new note and add it to the track
-        3. If the event is a note off event, then compute its duration
+        1. Check the event for the analysis report
+        2. Update the current time from the event
+        3. If the event is the first program change event, then it sets the instrument of the track
+        4. If the event is a note on event, then start a new note
+        5. If the event is a note off event, then compute its duration
+        Then the notes are added to the track
         """
         present_time = 0
         on_notes = {}
-        track = InstrumentTrack()
-        for event_index in range(0, len(miditrack), 1):
-            event = miditrack[event_index]
+        instrument = None
+        # [start time, duration, pitch, volume] of the notes in the order of their note on events
+        notes = []
+        for event in miditrack:
+            track_analyzer.check_event(event)
             present_time += event.tick
+            if instrument is None and MidiUtils.is_program_change_event(event):
+                instrument = event.data[0]
             if MidiUtils.is_new_note(event):
-                note = Note(start_time=present_time, pitch=event.pitch, volume=event.velocity)
-                on_notes[note.pitch] = note
-                track.add_note(note)
+                note = [present_time, 0, event.pitch, event.velocity]
+                on_notes[event.pitch] = note
+                notes.append(note)
             if MidiUtils.has_note_ended(event):
                 note = on_notes[event.pitch]
-                note.duration = present_time - note.start_time
-        instrument = MidiUtils.get_instrument(miditrack)
+                note[1] = present_time - note[0]
+        if len(notes) == 0:
+            return
+        track = InstrumentTrack.from_arrays(*zip(*notes))
         if instrument is None:
             instrument = instruments.PIANO
-        self.transcript.add_track(instrument, track)
+        self.add_track(instrument, track)
+
+
+def set_meta_event(transcript_meta, start_time, event):
+    """
+    Keeps the event in the transcript meta if it is a global meta event or a tempo event
+    :param transcript_meta: TranscriptMeta
+    :param start_time: absolute time of the event
+    :param event: Midi event of the meta track
+    """
+    if MidiUtils.is_key_signature_event(event):
+        transcript_meta.key_signature_event = event
+    if MidiUtils.is_time_signature_event(event):
+        transcript_meta.time_signature_event = event
+    if MidiUtils.is_set_tempo_event(event):
+        transcript_meta.tempo_timeline.set_tempo(start_time, event)
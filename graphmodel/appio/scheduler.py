@@ -1,5 +1,6 @@
 from collections import OrderedDict, defaultdict
 from graphmodel.utils import MidiUtils
+from graphmodel.utils.timeline import TempoTimeline
 
 __author__ = 'Adisor'
 
@@ -83,3 +84,31 @@ class NotesAndEventsScheduledTrack(AbstractEventsScheduledTrack):
         self.schedule_event(MidiUtils.to_note_off_event(note, self.channel), start + note.duration)
 
 
+class TempoScheduledTrack(AbstractEventsScheduledTrack):
+    """
+    Used to model the meta track, which holds at most one tempo event at a time
+    """
+
+    def __init__(self):
+        super(TempoScheduledTrack, self).__init__()
+        self.tempo_timeline = TempoTimeline()
+
+    def schedule_event(self, event, start):
+        """
+        Sets the tempo at the start time, replacing any tempo already scheduled there
+        :param event: tempo event, None when the sound event had no tempo
+        :param start: start time of the tempo
+        """
+        if event is None:
+            return
+        self.tempo_timeline.set_tempo(start, event)
+        self.duration = max(start, self.duration)
+
+    def get_tempo_at(self, time):
+        return self.tempo_timeline.tempo_at(time)
+
+    def get_scheduled_events(self):
+        return OrderedDict((time, [event]) for time, event in self.tempo_timeline.items())
+
+    def sort(self):
+        pass
@@ -1,3 +1,5 @@
+import struct
+
 import midi
 from midi import events
 from graphmodel import defaults
@@ -66,3 +68,214 @@ class MidiTrackWriter(object):
                 last_time = time
                 self.track.append(event)
         return last_time
+
+
+class MidiBytesWriter(object):
+    """
+    Encodes a pattern schedule straight into the bytes of a midi file, without building a midi Pattern
+
+    Delta times are encoded as variable length quantities and channel events use running status, like python-midi
+    does, so the file is the same as the one written by MidiFileWriter. The scheduled events are read, not modified.
+    """
+
+    def __init__(self, pattern_schedule):
+        self.pattern_schedule = pattern_schedule
+
+    def encode(self):
+        """
+        :return: String with the contents of the midi file
+        """
+        scheduled_tracks = self.pattern_schedule.get_scheduled_tracks()
+        chunks = [encode_header(self.pattern_schedule, len(scheduled_tracks) + 1)]
+        chunks.append(encode_track_chunk(encode_meta_track(self.pattern_schedule)))
+        for track_schedule in scheduled_tracks:
+            chunks.append(encode_track_chunk(self.encode_scheduled_track(track_schedule)))
+        return ''.join(chunks)
+
+    @staticmethod
+    def encode_scheduled_track(track_schedule):
+        """
+        Sorts the track schedule by time and encodes its events with the ticks between them
+        """
+        track_schedule.sort()
+        track_buffer = bytearray()
+        running_status = None
+        last_time = 0
+        for (time, scheduled_events) in track_schedule.get_scheduled_events().items():
+            for event in scheduled_events:
+                running_status = encode_event(track_buffer, time - last_time, event, running_status)
+                last_time = time
+        encode_event(track_buffer, 1, events.EndOfTrackEvent(), running_status)
+        return track_buffer
+
+    def save_to_file(self, midi_file_name):
+        data = self.encode()
+        with open(midi_file_name, 'wb') as midi_file:
+            midi_file.write(data)
+
+
+class MidiStreamWriter(object):
+    """
+    Writes the midi file of a pattern schedule whose scheduled tracks are streams of (time, midi event) pairs in the
+    order of the track, such as the ones made by Generator.generate_multi_instrument_events
+
+    The events are encoded as they come, so the tracks are never kept as event objects, and the streams are consumed
+    one after another. A track chunk starts with its length, so on outputs that can seek a placeholder is written and
+    filled in at the end of the track, and the encoded events are written every flush_bytes. Other outputs, such as
+    sockets, get each track chunk once the whole track is encoded, which is a few bytes per event.
+    """
+
+    def __init__(self, pattern_schedule, flush_bytes=64 * 1024):
+        self.pattern_schedule = pattern_schedule
+        self.flush_bytes = flush_bytes
+
+    def write(self, output):
+        """
+        :param output: file like object open for binary writing
+        """
+        track_streams = self.pattern_schedule.get_scheduled_tracks()
+        seekable = can_seek(output)
+        output.write(encode_header(self.pattern_schedule, len(track_streams) + 1))
+        output.write(encode_track_chunk(encode_meta_track(self.pattern_schedule)))
+        for timed_events in track_streams:
+            if seekable:
+                self.write_track_in_place(output, timed_events)
+            else:
+                output.write(encode_track_chunk(encode_track_stream(timed_events)))
+
+    def write_track_in_place(self, output, timed_events):
+        chunk_start = output.tell()
+        output.write(MIDI_TRACK_HEADER + struct.pack('>L', 0))
+        length = 0
+        for track_buffer in iter_track_buffers(timed_events, self.flush_bytes):
+            output.write(str(track_buffer))
+            length += len(track_buffer)
+        chunk_end = output.tell()
+        output.seek(chunk_start + len(MIDI_TRACK_HEADER))
+        output.write(struct.pack('>L', length))
+        output.seek(chunk_end)
+
+    def write_encoded(self, output):
+        """
+        Writes the file of a pattern schedule whose scheduled tracks were already encoded, such as the ones
+        generated by worker processes
+        :param output: file like object open for binary writing
+        """
+        track_buffers = self.pattern_schedule.get_scheduled_tracks()
+        output.write(encode_header(self.pattern_schedule, len(track_buffers) + 1))
+        output.write(encode_track_chunk(encode_meta_track(self.pattern_schedule)))
+        for track_buffer in track_buffers:
+            output.write(encode_track_chunk(track_buffer))
+
+    def save_to_file(self, midi_file_name):
+        with open(midi_file_name, 'wb') as midi_file:
+            self.write(midi_file)
+
+
+def encode_header(pattern_schedule, track_count):
+    return MIDI_HEADER + struct.pack('>LHHH', MIDI_HEADER_SIZE, defaults.FORMAT, track_count,
+                                     pattern_schedule.get_resolution())
+
+
+def encode_meta_track(pattern_schedule):
+    """
+    The meta events keep their own ticks, like in the pattern built by MidiFileWriter
+    """
+    track_buffer = bytearray()
+    for event in pattern_schedule.get_meta_events():
+        if event is not None:
+            encode_event(track_buffer, event.tick, event, None)
+    encode_event(track_buffer, 0, events.EndOfTrackEvent(), None)
+    return track_buffer
+
+
+def encode_track_stream(timed_events):
+    """
+    :param timed_events: iterator of (time, midi event) pairs in the order of the track
+    :return: bytearray with the encoded events of the track
+    """
+    return bytearray().join(iter_track_buffers(timed_events))
+
+
+def iter_track_buffers(timed_events, flush_bytes=None):
+    """
+    Encodes the events with the ticks between them
+    :param flush_bytes: size after which a buffer is handed out, None to encode the track into a single buffer
+    :return: iterator of bytearrays of about flush_bytes with the encoded track, the last one ends the track
+    """
+    track_buffer = bytearray()
+    running_status = None
+    last_time = 0
+    for (time, event) in timed_events:
+        running_status = encode_event(track_buffer, time - last_time, event, running_status)
+        last_time = time
+        if flush_bytes is not None and len(track_buffer) >= flush_bytes:
+            yield track_buffer
+            track_buffer = bytearray()
+    encode_event(track_buffer, 1, events.EndOfTrackEvent(), running_status)
+    yield track_buffer
+
+
+def can_seek(output):
+    try:
+        output.tell()
+    except (AttributeError, IOError):
+        return False
+    return True
+
+
+MIDI_HEADER = 'MThd'
+MIDI_HEADER_SIZE = 6
+MIDI_TRACK_HEADER = 'MTrk'
+
+
+def encode_track_chunk(track_buffer):
+    """
+    :param track_buffer: bytearray with the encoded events of the track
+    :return: String with the track chunk
+    """
+    return MIDI_TRACK_HEADER + struct.pack('>L', len(track_buffer)) + str(track_buffer)
+
+
+def encode_event(track_buffer, tick, event, running_status):
+    """
+    Appends the delta time and the event to the buffer
+    :param track_buffer: bytearray
+    :param tick: ticks since the previous event
+    :param event: Midi event
+    :param running_status: status byte of the previous channel event, None if there is none
+    :return: the running status after the event
+    """
+    encode_varlen(track_buffer, tick)
+    if isinstance(event, events.MetaEvent):
+        track_buffer.append(event.statusmsg)
+        track_buffer.append(event.metacommand)
+        encode_varlen(track_buffer, len(event.data))
+        track_buffer.extend(event.data)
+    elif isinstance(event, events.SysexEvent):
+        track_buffer.append(0xF0)
+        track_buffer.extend(event.data)
+        track_buffer.append(0xF7)
+    else:
+        status = event.statusmsg | event.channel
+        if status != running_status:
+            running_status = status
+            track_buffer.append(status)
+        track_buffer.extend(event.data)
+    return running_status
+
+
+def encode_varlen(track_buffer, value):
+    """
+    Appends the value as a variable length quantity, 7 bits per byte with the most significant group first
+    """
+    if value < 0x80:
+        track_buffer.append(value)
+        return
+    groups = [value & 0x7F]
+    value >>= 7
+    while value:
+        groups.append((value & 0x7F) | 0x80)
+        value >>= 7
+    groups.reverse()
+    track_buffer.extend(groups)
@@ -0,0 +1,127 @@
+import argparse
+import gc
+import sys
+
+from graphmodel import corpus
+from graphmodel.NGram import FrameComponent, FrameStatisticalData
+from graphmodel.model import instruments
+from graphmodel.model.SongObjects import InstrumentSoundEvent, Note
+
+__author__ = 'Adisor'
+
+"""
+Measures the memory of the song and ngram objects
+
+The dict backed classes below have the same fields as the classes of the object model before it used slots, they
+are only kept here to compare against. The per object size counts the instance and its dict, but not the objects
+it refers to, which are the same in both layouts.
+
+usage: python -m graphmodel.benchmarks.objects music/Eminem -n 4
+"""
+
+
+class DictNote(object):
+    def __init__(self, start_time=0, duration=0, pitch=0, volume=0):
+        self.start_time = start_time
+        self.duration = duration
+        self.pitch = pitch
+        self.volume = volume
+        self._hash = None
+
+
+class DictInstrumentSoundEvent(object):
+    def __init__(self, notes=()):
+        self._instrument = instruments.PIANO
+        self._notes = list(notes)
+        self._hash = None
+
+
+class DictFrameComponent(object):
+    def __init__(self, sound_event, tempo_event=None, pause_to_next_event=0, pause_to_previous_event=0):
+        self.sound_event = sound_event
+        self.tempo_event = tempo_event
+        self.pause_to_next_event = pause_to_next_event
+        self.pause_to_previous_event = pause_to_previous_event
+        self.hash = None
+
+
+class DictFrameStatisticalData(object):
+    def __init__(self):
+        self.count = 0
+        self.last_played_elapsed = 0
+
+
+def object_size(obj):
+    """
+    :return: bytes of the instance, its instance dict and its list or tuple of notes
+    """
+    size = sys.getsizeof(obj)
+    if type(obj).__dictoffset__ != 0:
+        size += sys.getsizeof(obj.__dict__)
+    notes = getattr(obj, '_notes', None)
+    if notes is not None:
+        size += sys.getsizeof(notes)
+    return size
+
+
+def per_object_sizes():
+    """
+    :return: list of (class name, dict backed bytes, slotted bytes) of objects with the same content
+    """
+    notes = [Note(start_time=0, duration=120, pitch=60 + index, volume=90) for index in range(3)]
+    dict_notes = [DictNote(start_time=0, duration=120, pitch=60 + index, volume=90) for index in range(3)]
+    sound_event = InstrumentSoundEvent(notes)
+    pairs = [('Note', dict_notes[0], notes[0]),
+             ('InstrumentSoundEvent', DictInstrumentSoundEvent(dict_notes), sound_event),
+             ('FrameComponent', DictFrameComponent(sound_event), FrameComponent(sound_event)),
+             ('FrameStatisticalData', DictFrameStatisticalData(), FrameStatisticalData())]
+    return [(name, object_size(dict_object), object_size(slotted_object))
+            for (name, dict_object, slotted_object) in pairs]
+
+
+def model_object_sizes(midi_file_names, nsize):
+    """
+    Builds the corpus model and measures the objects that it keeps alive
+    :return: (dict that maps class names to (number of objects, bytes), number of notes if they were not shared)
+    """
+    (ngram, rejected) = corpus.build_corpus_model(midi_file_names, nsize, processes=1)
+    gc.collect()
+    sizes = dict((name, [0, 0]) for name in ['InstrumentSoundEvent', 'FrameComponent', 'FrameStatisticalData'])
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in sizes and type(obj).__module__.startswith('graphmodel'):
+            sizes[name][0] += 1
+            sizes[name][1] += object_size(obj)
+    # tuples of numbers are not tracked by the garbage collector, so the notes are found through the vocabulary
+    notes = {}
+    unshared_notes = 0
+    for sound_event in ngram.vocabulary.get_sound_events():
+        for note in sound_event.get_notes():
+            notes[id(note)] = note
+        unshared_notes += len(sound_event.get_notes())
+    sizes['Note'] = [len(notes), sum(object_size(note) for note in notes.values())]
+    return sizes, unshared_notes
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Measures the memory of the song and ngram objects")
+    parser.add_argument('paths', nargs='*', help="midi files or folders with midi files for the model measurement")
+    parser.add_argument('-n', '--nsize', type=int, default=4, help="ngram size")
+    options = parser.parse_args(args)
+
+    print "%-22s %10s %10s %8s" % ("bytes per object", "dict", "slots", "saved")
+    for (name, dict_size, slotted_size) in per_object_sizes():
+        print "%-22s %10d %10d %7.0f%%" % (name, dict_size, slotted_size, 100.0 * (dict_size - slotted_size) / dict_size)
+
+    if options.paths:
+        (sizes, unshared_notes) = model_object_sizes(corpus.list_midi_files(options.paths), options.nsize)
+        print
+        print "%-22s %10s %10s" % ("model objects", "count", "bytes")
+        for name in sorted(sizes):
+            print "%-22s %10d %10d" % (name, sizes[name][0], sizes[name][1])
+        print "notes in the vocabulary sound events: %d, shared note objects: %d" % (unshared_notes,
+                                                                                      sizes['Note'][0])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+
+from graphmodel import Generator, corpus
+from graphmodel.NGram import MultiInstrumentNGram
+from graphmodel.appio import reader
+from graphmodel.appio.midistream import MidiStreamError
+from graphmodel.appio.preprocessing import MidiFormatError
+from graphmodel.appio.scheduler import PatternSchedule
+from graphmodel.appio.writer import MidiBytesWriter, MidiFileWriter
+from graphmodel.model.Policies import FrameSelectionPolicy
+
+__author__ = 'Adisor'
+
+"""
+Times and measures the memory of each stage of the generation on a corpus of midi files
+
+The stages are run for every file, for every ngram size and number of ticks of the sweep:
+    load            reader.load_transcript
+    build           MultiInstrumentNGram.build_from_transcript without the indexing of the frames
+    sort_and_index  the indexing of the frames of each instrument ngram, with the sorting of every context and the
+                    building of its alias table, which the generations would otherwise do on their first queries
+    generate        generate_multi_instrument_tracks, once for each policy, with a fixed seed
+    write_pattern   MidiFileWriter, which builds a python-midi pattern
+    write_bytes     MidiBytesWriter
+
+Each stage is run repeat times and keeps its best time. The memory of a stage is the growth of the resident set
+and of the number of objects tracked by the garbage collector over its first run, which is the memory held by what
+the stage built. The results are saved as json rows, and two result files can be compared row by row.
+
+usage: python -m graphmodel.benchmarks.stages music music/Eminem -n 2 3 4 -t 5000 20000 -o results.json
+       python -m graphmodel.benchmarks.stages --compare before.json after.json
+"""
+
+DEFAULT_PATHS = ['music', 'music/Eminem']
+DEFAULT_NSIZES = [2, 3, 4]
+DEFAULT_TICKS = [5000, 20000, 80000]
+DEFAULT_SEED = 0
+
+# policies by their names in the results, the random and experimental policies do not select frames yet
+POLICIES = [('highest', FrameSelectionPolicy.HIGHEST_COUNT), ('prob', FrameSelectionPolicy.PROB)]
+
+# fields that identify a row, used to match the rows of two runs
+ROW_KEY = ('file', 'stage', 'nsize', 'ticks', 'policy')
+
+
+def get_rss():
+    """
+    :return: bytes of the resident set of this process
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        # only the peak is known on systems without proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(function, repeat=1):
+    """
+    Runs the function repeat times
+    :return: (result of the first run, dict with the best seconds, the rss growth and the object growth)
+    """
+    gc.collect()
+    rss = get_rss()
+    objects = len(gc.get_objects())
+    start = time.time()
+    result = function()
+    seconds = time.time() - start
+    measurement = {'rss_bytes': get_rss() - rss, 'objects': len(gc.get_objects()) - objects}
+    for run in range(repeat - 1):
+        start = time.time()
+        function()
+        seconds = min(seconds, time.time() - start)
+    measurement['seconds'] = seconds
+    return result, measurement
+
+
+def build_without_index(transcript, nsize):
+    """
+    Same as MultiInstrumentNGram.build_from_transcript, except that the frames are not indexed
+    """
+    ngram = MultiInstrumentNGram(nsize)
+    for instrument in transcript.get_instruments():
+        track = transcript.get_track(instrument)
+        ngram.get_or_create_ngram(instrument).build_from_track(track, transcript.get_tempo_timeline())
+    return ngram
+
+
+def sort_and_index(ngram):
+    ngram.finish_index()
+
+
+def generate(ngram, ticks, policy, seed):
+    return Generator.generate_multi_instrument_tracks(ngram, ticks, policy=policy, rng=random.Random(seed))
+
+
+def write_pattern(pattern_schedule, midi_file_name):
+    MidiFileWriter(pattern_schedule).save_to_file(midi_file_name)
+
+
+def benchmark_file(midi_file_name, nsizes, ticks_sweep, seed=DEFAULT_SEED, repeat=1):
+    """
+    Runs the stages on one file
+    :return: list of result rows, a row is a dict with the ROW_KEY fields and the measurement of the stage
+    """
+    rows = []
+
+    def add_row(stage, nsize=None, ticks=None, policy=None):
+        row = {'file': midi_file_name, 'stage': stage, 'nsize': nsize, 'ticks': ticks, 'policy': policy}
+        rows.append(row)
+        return row
+
+    def measure_stage(stage, function, nsize=None, ticks=None, policy=None, stage_repeat=repeat, expected_errors=()):
+        """
+        Adds the row of the stage
+        :param expected_errors: tuple of the exception types the stage is known to raise on some inputs, a stage
+        that raises one of them gets a row with the error instead of the measurement, other errors are raised
+        :return: result of the function, None if it failed
+        """
+        row = add_row(stage, nsize, ticks, policy)
+        try:
+            (result, measurement) = measure(function, stage_repeat)
+        except expected_errors as exception:
+            row['error'] = "%s: %s" % (exception.__class__.__name__, exception)
+            return None
+        row.update(measurement)
+        return result
+
+    # files that break the input format rules are rejected here
+    (transcript, measurement) = measure(lambda: reader.load_transcript(midi_file_name), repeat)
+    add_row('load').update(measurement)
+    meta = transcript.get_transcript_meta()
+    (handle, output_file_name) = tempfile.mkstemp(suffix='.mid')
+    os.close(handle)
+    try:
+        for nsize in nsizes:
+            # the built ngram of the first run is indexed and generated from, the other runs only count the time
+            ngram = measure_stage('build', lambda: build_without_index(transcript, nsize), nsize)
+            measure_stage('sort_and_index', lambda: sort_and_index(ngram), nsize, stage_repeat=1)
+            for ticks in ticks_sweep:
+                written_tracks = None
+                for (name, policy) in POLICIES:
+                    scheduled_tracks = measure_stage('generate', lambda: generate(ngram, ticks, policy, seed), nsize,
+                                                     ticks, name)
+                    if written_tracks is None:
+                        written_tracks = scheduled_tracks
+                pattern_schedule = PatternSchedule(scheduled_tracks=written_tracks, meta=meta)
+                measure_stage('write_bytes', lambda: MidiBytesWriter(pattern_schedule).encode(), nsize, ticks)
+                # the pattern writer sets the ticks of the scheduled events, so it runs after the bytes writer, and
+                # it reads the ticks of meta events that files without a key signature do not have
+                measure_stage('write_pattern', lambda: write_pattern(pattern_schedule, output_file_name), nsize, ticks,
+                              expected_errors=(AttributeError,))
+    finally:
+        os.remove(output_file_name)
+    return rows
+
+
+def run_benchmarks(midi_file_names, nsizes, ticks_sweep, seed=DEFAULT_SEED, repeat=1):
+    """
+    :return: dict with the settings, the result rows and the files that were rejected by the reader
+    """
+    rows = []
+    rejected = []
+    for midi_file_name in midi_file_names:
+        try:
+            rows.extend(benchmark_file(midi_file_name, nsizes, ticks_sweep, seed, repeat))
+        except (MidiFormatError, MidiStreamError):
+            rejected.append(midi_file_name)
+    settings = {'files': midi_file_names, 'nsizes': nsizes, 'ticks': ticks_sweep, 'seed': seed, 'repeat': repeat,
+                'python': platform.python_version(), 'platform': platform.platform(), 'time': time.time(),
+                'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    return {'settings': settings, 'rows': rows, 'rejected': rejected}
+
+
+def get_stage_totals(rows):
+    """
+    :return: dict that maps (stage, policy) to the total seconds of the rows that have no error
+    """
+    totals = {}
+    for row in rows:
+        if 'seconds' in row:
+            key = (row['stage'], row['policy'])
+            totals[key] = totals.get(key, 0) + row['seconds']
+    return totals
+
+
+def compare_results(before, after):
+    """
+    Matches the rows of two runs
+    :return: list of (stage, policy, seconds before, seconds after) totals of the rows that are in both runs
+    """
+    before_rows = dict((tuple(row[field] for field in ROW_KEY), row) for row in before['rows'] if 'seconds' in row)
+    matched_before = []
+    matched_after = []
+    for row in after['rows']:
+        key = tuple(row[field] for field in ROW_KEY)
+        if 'seconds' in row and key in before_rows:
+            matched_before.append(before_rows[key])
+            matched_after.append(row)
+    before_totals = get_stage_totals(matched_before)
+    after_totals = get_stage_totals(matched_after)
+    return [(stage, policy, before_totals[(stage, policy)], after_totals[(stage, policy)])
+            for (stage, policy) in sorted(before_totals)]
+
+
+def print_totals(results):
+    totals = get_stage_totals(results['rows'])
+    print "%-16s %-12s %10s" % ("stage", "policy", "seconds")
+    for (stage, policy) in sorted(totals):
+        print "%-16s %-12s %10.3f" % (stage, policy or '', totals[(stage, policy)])
+    for (stage, policy, error) in sorted(set((row['stage'], row['policy'], row['error'])
+                                             for row in results['rows'] if 'error' in row)):
+        print "%s %s failed: %s" % (stage, policy or '', error)
+    for midi_file_name in results['rejected']:
+        print "Skipped", midi_file_name
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Times and measures the memory of each stage of the generation")
+    parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS, help="midi files or folders with midi files")
+    parser.add_argument('-n', '--nsizes', type=int, nargs='+', default=DEFAULT_NSIZES, help="ngram sizes")
+    parser.add_argument('-t', '--ticks', type=int, nargs='+', default=DEFAULT_TICKS, help="generated durations")
+    parser.add_argument('-s', '--seed', type=int, default=DEFAULT_SEED, help="seed of the generations")
+    parser.add_argument('-r', '--repeat', type=int, default=1, help="runs of each stage, the best time is kept")
+    parser.add_argument('-o', '--output', default=None, help="json file to save the results to")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compares two result files")
+    options = parser.parse_args(args)
+
+    if options.compare is not None:
+        results = []
+        for result_file_name in options.compare:
+            with open(result_file_name) as result_file:
+                results.append(json.load(result_file))
+        print "%-16s %-12s %10s %10s %8s" % ("stage", "policy", "before", "after", "speedup")
+        for (stage, policy, before, after) in compare_results(*results):
+            print "%-16s %-12s %10.3f %10.3f %7.2fx" % (stage, policy or '', before, after, before / max(after, 1e-9))
+        return
+
+    midi_file_names = corpus.list_midi_files(options.paths)
+    results = run_benchmarks(midi_file_names, options.nsizes, options.ticks, options.seed, options.repeat)
+    if options.output is not None:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent=1, sort_keys=True)
+    print_totals(results)
+
+
+if __name__ == '__main__':
+    main()
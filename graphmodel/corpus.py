@@ -0,0 +1,116 @@
+import argparse
+import itertools
+import os
+import time
+from multiprocessing import Pool
+
+from graphmodel.NGram import MultiInstrumentNGram, NGramBuildBackend
+from graphmodel.appio import applogger, modelfile, reader
+from graphmodel.appio.cache import TranscriptCache
+from graphmodel.appio.preprocessing import MidiFormatError
+
+__author__ = 'Adisor'
+
+"""
+Builds one ngram model from a corpus of midi files
+
+Each file is read and counted in a worker process, which sends back its model as the compact arrays of the model
+file format. The reduction merges the arrays into the corpus model in the order of the files, so the corpus model is
+the same as the one built by reading the files one after the other
+
+usage: python -m graphmodel.corpus music/Eminem -n 20 -o eminem.model -c cache/transcripts
+"""
+
+logger = applogger.logger
+
+
+def count_file(job):
+    """
+    Builds the ngram of a single file, runs in the worker processes
+    :param job: (midi file name, nsize, backend) tuple
+    :return: (midi file name, model file sections), the sections are None if the file was rejected
+    """
+    (midi_file_name, nsize, backend) = job
+    try:
+        transcript = reader.load_transcript(midi_file_name)
+    except MidiFormatError:
+        return midi_file_name, None
+    ngram = MultiInstrumentNGram(nsize, backend)
+    ngram.build_from_transcript(transcript)
+    return midi_file_name, modelfile.model_sections(ngram)
+
+
+def build_corpus_model(midi_file_names, nsize, processes=None, backend=NGramBuildBackend.NUMPY):
+    """
+    Builds the ngram of every file in parallel and merges them into one model
+    :param midi_file_names: list of String paths, merged in this order
+    :param nsize: ngram size
+    :param processes: number of worker processes, None for one per core, 1 to count the files in this process
+    :param backend: backend used to count the files
+    :return: (MultiInstrumentNGram, list of the file names that were rejected)
+    """
+    corpus_ngram = MultiInstrumentNGram(nsize, backend)
+    rejected = []
+    jobs = [(midi_file_name, nsize, backend) for midi_file_name in midi_file_names]
+    pool = None
+    if processes == 1:
+        results = itertools.imap(count_file, jobs)
+    else:
+        pool = Pool(processes)
+        results = pool.imap(count_file, jobs)
+    try:
+        for (midi_file_name, sections) in results:
+            if sections is None:
+                logger.warning("Skipped %s, it does not have the proper input format", midi_file_name)
+                rejected.append(midi_file_name)
+                continue
+            modelfile.add_sections(corpus_ngram, sections)
+            logger.info("Merged %s", midi_file_name)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return corpus_ngram, rejected
+
+
+def list_midi_files(paths):
+    """
+    :param paths: list of midi files and folders
+    :return: the midi files, folders are replaced by the midi files they contain in sorted order
+    """
+    midi_file_names = []
+    for path in paths:
+        if os.path.isdir(path):
+            midi_file_names.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                                   if name.lower().endswith('.mid'))
+        else:
+            midi_file_names.append(path)
+    return midi_file_names
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Builds a model file from a corpus of midi files")
+    parser.add_argument('paths', nargs='+', help="midi files or folders with midi files")
+    parser.add_argument('-o', '--output', required=True, help="model file to write")
+    parser.add_argument('-n', '--nsize', type=int, default=2, help="ngram size")
+    parser.add_argument('-j', '--processes', type=int, default=None, help="worker processes, one per core by default")
+    parser.add_argument('-c', '--cache', default=None, help="folder of the transcript cache, no cache by default")
+    options = parser.parse_args(args)
+    if options.cache is not None:
+        # the worker processes are forked after this, so they share the cache folder
+        reader.transcript_cache = TranscriptCache(options.cache)
+
+    start = time.time()
+    midi_file_names = list_midi_files(options.paths)
+    (ngram, rejected) = build_corpus_model(midi_file_names, options.nsize, options.processes)
+    modelfile.save_model(ngram, options.output)
+    print "Built %s from %s files in %.2fs" % (options.output, len(midi_file_names) - len(rejected),
+                                               time.time() - start)
+    for midi_file_name in rejected:
+        print "Skipped", midi_file_name
+    if options.cache is not None and options.processes == 1:
+        print "Transcript cache:", reader.transcript_cache.get_stats()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+
+from graphmodel.appio import applogger
+
+__author__ = 'Adisor'
+
+"""
+Runs long tasks, such as generating songs, on a bounded pool of background threads
+
+A job is submitted with the function to run and gets an id right away. The function receives a progress keyword
+argument, which it calls with (fraction done, stage name), and the job status can be polled by its id.
+
+The jobs live in the memory of the process that runs the queue, so the web app should run as a single process
+(for example gunicorn --workers 1 --threads 8) for the status requests to reach the queue that has the job.
+"""
+
+logger = applogger.logger
+
+
+class JobStatus(object):
+    def __init__(self):
+        pass
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job(object):
+    """
+    State of a submitted task, updated by the worker that runs it
+    """
+
+    def __init__(self, function, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.status = JobStatus.QUEUED
+        self.progress = 0.0
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.submitted_time = time.time()
+        self.started_time = None
+        self.finished_time = None
+
+    def set_progress(self, fraction, stage=None):
+        self.progress = fraction
+        self.stage = stage
+
+    def is_finished(self):
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+    def to_dict(self):
+        """
+        :return: dict with the state of the job that can be sent as json
+        """
+        return {'id': self.id, 'status': self.status, 'progress': self.progress, 'stage': self.stage,
+                'result': self.result, 'error': self.error, 'submitted': self.submitted_time,
+                'started': self.started_time, 'finished': self.finished_time}
+
+
+class JobQueue(object):
+    """
+    Bounded queue of jobs and the worker threads that run them
+    """
+
+    def __init__(self, workers=2, max_pending=16, max_finished=256):
+        """
+        :param workers: number of worker threads
+        :param max_pending: number of queued and running jobs after which new jobs are refused
+        :param max_finished: number of finished jobs whose status is kept
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        # all the known jobs by id, in the order in which they were submitted
+        self._jobs = OrderedDict()
+        self._queued = deque()
+        self._running = 0
+        self._finished = deque()
+        self._condition = threading.Condition()
+        self._threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self.work, name="job-worker-%s" % index)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queues function(*args, progress=job.set_progress, **kwargs)
+        :return: Job
+        :raises QueueFullError: if max_pending jobs are already queued or running
+        """
+        with self._condition:
+            if self.get_depth() >= self.max_pending:
+                raise QueueFullError("%s jobs are already waiting" % self.get_depth())
+            job = Job(function, args, kwargs)
+            self._jobs[job.id] = job
+            self._queued.append(job)
+            self._condition.notify()
+        return job
+
+    def get_job(self, job_id):
+        """
+        :return: the job with the id, None if it is not known or was forgotten
+        """
+        return self._jobs.get(job_id)
+
+    def get_depth(self):
+        """
+        :return: number of queued and running jobs
+        """
+        return len(self._queued) + self._running
+
+    def get_stats(self):
+        with self._condition:
+            return {'queued': len(self._queued), 'running': self._running, 'workers': self.workers,
+                    'max_pending': self.max_pending}
+
+    def work(self):
+        while True:
+            with self._condition:
+                while len(self._queued) == 0:
+                    self._condition.wait()
+                job = self._queued.popleft()
+                self._running += 1
+            self.run(job)
+            with self._condition:
+                self._running -= 1
+                self.forget_finished(job)
+
+    @staticmethod
+    def run(job):
+        job.status = JobStatus.RUNNING
+        job.started_time = time.time()
+        try:
+            job.result = job.function(*job.args, progress=job.set_progress, **job.kwargs)
+            job.status = JobStatus.DONE
+        except Exception as exception:
+            logger.error("Job %s failed\n%s", job.id, traceback.format_exc())
+            job.error = "%s: %s" % (exception.__class__.__name__, exception)
+            job.status = JobStatus.FAILED
+        job.finished_time = time.time()
+
+    def forget_finished(self, job):
+        """
+        Keeps the status of the last max_finished jobs
+        """
+        self._finished.append(job.id)
+        while len(self._finished) > self.max_finished:
+            self._jobs.pop(self._finished.popleft(), None)
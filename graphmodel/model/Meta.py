@@ -1,6 +1,5 @@
-from collections import OrderedDict
-
 from graphmodel import defaults
+from graphmodel.utils.timeline import TempoTimeline
 
 __author__ = 'Adisor'
 
@@ -21,5 +20,12 @@ class TranscriptMeta(object):
         self.key_signature_event = key_signature_event
         # sets the overall timing
         self.time_signature_event = time_signature_event
-        # maps tempo events to times
-        self.tempo_dict = OrderedDict()
+        # maps times to tempo events
+        self.tempo_timeline = TempoTimeline()
+
+    @property
+    def tempo_dict(self):
+        """
+        :return: ordered dict that maps times to tempo events
+        """
+        return self.tempo_timeline.to_dict()
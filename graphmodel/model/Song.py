@@ -1,9 +1,13 @@
-from collections import defaultdict, OrderedDict
+from collections import defaultdict
 
-from graphmodel.model.SongObjects import InstrumentSoundEvent
+import numpy
+
+from graphmodel.model.SongObjects import InstrumentSoundEvent, Note
 
 __author__ = 'Adisor'
 
+NOTE_DTYPE = numpy.int64
+
 
 # TODO: ADD OPTION TO LOAD NOTES BUT ON SEPARATE TRACKS
 class SongTranscript(object):
@@ -22,11 +26,14 @@ class SongTranscript(object):
         """
         :return: list of tempo events
         """
-        return self.get_tempo_dict().values()
+        return self.get_tempo_timeline().tempo_events
 
     def get_tempo_dict(self):
         return self._transcript_meta.tempo_dict
 
+    def get_tempo_timeline(self):
+        return self._transcript_meta.tempo_timeline
+
     def set_transcript_meta(self, transcript_meta):
         self._transcript_meta = transcript_meta
 
@@ -48,45 +55,28 @@ class SongTranscript(object):
         else:
             self.merge_tracks(instrument, track)
 
+    def add_tracks(self, instrument, tracks):
+        """
+        Adds several tracks of the instrument with a single merge, the result is the same as adding them one after
+        the other with add_track
+        :param instrument: midi instrument number
+        :param tracks: list of instrument tracks in the order in which they would be added
+        """
+        # each add_track puts the notes of the added track before the notes that are already there at equal times
+        merged_tracks = list(reversed(tracks))
+        if self.instrument_tracks[instrument] is not None:
+            merged_tracks.append(self.instrument_tracks[instrument])
+        if len(merged_tracks) == 1:
+            self.set_track(instrument, merged_tracks[0])
+        else:
+            self.set_track(instrument, InstrumentTrack.merge(*merged_tracks))
+
     def merge_tracks(self, instrument, track):
         """
         Merges the track on the current channel with the parameter track
-        The merge algorithm ensures the notes are in sorted order by time
-        """
-        final_track = InstrumentTrack()
-        param_times = track.times()
-        param_index = 0
-        times = self.instrument_tracks[instrument].times()
-        index = 0
-        # merge both tracks into one track in order of time
-        while param_index < len(param_times) or index < len(times):
-            if param_index < len(param_times):
-                param_time = param_times[param_index]
-            if index < len(times):
-                time = times[index]
-            # merge from param track if param time is smaller or the entire source track has been merged
-            can_add = (param_time < time or (param_time > time and index == len(times)))
-            if param_index < len(param_times) and can_add:
-                self.add_notes_to_track(track, final_track, param_time)
-                param_index += 1
-            # merge from both tracks
-            if param_time == time:
-                self.add_notes_to_track(track, final_track, param_time)
-                self.add_notes_to_track(self.instrument_tracks[instrument], final_track, time)
-                param_index += 1
-                index += 1
-            # merge from self track if time is smaller or the entire param track has been merged
-            can_add = (param_time > time or (param_time < time and param_index == len(param_times)))
-            if index < len(times) and can_add:
-                self.add_notes_to_track(self.instrument_tracks[instrument], final_track, time)
-                index += 1
-
-        self.set_track(instrument, final_track)
-
-    @staticmethod
-    def add_notes_to_track(from_track, to_track, time):
-        for note in from_track.get_sound_event(time).get_notes():
-            to_track.add_note(note)
+        The notes are merged in sorted order by time, at equal times the notes of the parameter track come first
+        """
+        self.set_track(instrument, InstrumentTrack.merge(track, self.instrument_tracks[instrument]))
 
     def get_instruments(self):
         """
@@ -118,50 +108,166 @@ class InstrumentTrack(object):
     This class stores note information in sorted order by time. Each note is stored into a sound event, and
     there are sound events that can have multiple notes, meaning the sound event is a chord
 
-    This class also stores meta information regarding instrument and channel
-    NOTE: THIS CLASS DOES NOT MAINTAIN SORTED TIMES, BUT ONLY REMEMBERS INSERTION ORDER
-    IF YOU WANT THE ELEMENTS TO BE SORTED BY TIME, INSERT THE SOUND EVENTS BY TIME
+    The notes are stored in columns: parallel arrays of start times, durations, pitches and volumes sorted by start
+    time. The chord offsets group the notes that share a start time, sound event i is made of the notes from
+    chord_offsets[i] to chord_offsets[i + 1]. Sound events are views over the columns that are created when they are
+    asked for. Notes with the same start time keep the order in which they were added
     """
 
     def __init__(self):
-        self._sound_events = OrderedDict()
+        empty = numpy.zeros(0, dtype=NOTE_DTYPE)
+        self._starts = empty
+        self._durations = empty
+        self._pitches = empty
+        self._volumes = empty
+        # index of the first note of each sound event, followed by the number of notes
+        self._chord_offsets = numpy.zeros(1, dtype=NOTE_DTYPE)
+        # start time of each sound event
+        self._times = empty
+        # notes added one at a time, they are sorted into the columns on the next read
+        self._pending_notes = []
+        # python lists of the columns and the sound events, built when they are first needed
+        self._note_lists = None
+        self._sound_events = {}
+
+    @classmethod
+    def from_arrays(cls, starts, durations, pitches, volumes):
+        """
+        :param starts: array like of note start times, in any order
+        :param durations: array like of note durations
+        :param pitches: array like of note pitches
+        :param volumes: array like of note volumes
+        :return: track with the notes
+        """
+        track = cls()
+        track.set_note_arrays(starts, durations, pitches, volumes)
+        return track
+
+    @staticmethod
+    def merge(*tracks):
+        """
+        Merges any number of tracks with one stable sort over their concatenated columns
+        :return: new track with the notes of the tracks, at equal times the notes of earlier tracks come first
+        """
+        columns = zip(*[track.get_note_arrays() for track in tracks])
+        return InstrumentTrack.from_arrays(*[numpy.concatenate(column) for column in columns])
+
+    def set_note_arrays(self, starts, durations, pitches, volumes):
+        """
+        Replaces the notes of the track, the notes are sorted by start time and then grouped into sound events
+        """
+        starts = numpy.asarray(starts, dtype=NOTE_DTYPE)
+        order = numpy.argsort(starts, kind='mergesort')
+        self._starts = starts[order]
+        self._durations = numpy.asarray(durations, dtype=NOTE_DTYPE)[order]
+        self._pitches = numpy.asarray(pitches, dtype=NOTE_DTYPE)[order]
+        self._volumes = numpy.asarray(volumes, dtype=NOTE_DTYPE)[order]
+        chord_starts = numpy.flatnonzero(numpy.diff(self._starts)) + 1
+        self._chord_offsets = numpy.concatenate(([0], chord_starts, [len(self._starts)])).astype(NOTE_DTYPE)
+        if len(self._starts) == 0:
+            self._chord_offsets = self._chord_offsets[1:]
+        self._times = self._starts[self._chord_offsets[:-1]]
+        self._pending_notes = []
+        self._note_lists = None
+        self._sound_events = {}
+
+    def flush(self):
+        """
+        Sorts the notes that were added one at a time into the columns
+        """
+        if len(self._pending_notes) == 0:
+            return
+        pending_columns = zip(*self._pending_notes)
+        self.set_note_arrays(*[numpy.concatenate((column, pending_column)) for (column, pending_column)
+                               in zip((self._starts, self._durations, self._pitches, self._volumes), pending_columns)])
+
+    def get_note_arrays(self):
+        """
+        :return: (start times, durations, pitches, volumes) arrays sorted by start time
+        """
+        self.flush()
+        return self._starts, self._durations, self._pitches, self._volumes
+
+    def get_chord_offsets(self):
+        """
+        :return: array with the index of the first note of each sound event, followed by the number of notes
+        """
+        self.flush()
+        return self._chord_offsets
+
+    def get_times(self):
+        """
+        :return: array with the start time of each sound event
+        """
+        self.flush()
+        return self._times
 
     def times(self):
         """
         :return: list of numbers which represent absolute times for each played note
         """
-        return self._sound_events.keys()
+        return self.get_times().tolist()
 
     def get_sound_event(self, time):
         """
         :param time: integer time
         :return: the sound event that starts at time
         """
-        return self._sound_events[time]
+        times = self.get_times()
+        index = numpy.searchsorted(times, time)
+        if index == len(times) or times[index] != time:
+            raise KeyError(time)
+        return self.get_sound_event_at(int(index))
+
+    def get_sound_event_at(self, index):
+        """
+        :param index: index of the sound event in time order
+        :return: sound event made of the notes of the chord
+        """
+        self.flush()
+        sound_event = self._sound_events.get(index)
+        if sound_event is None:
+            if self._note_lists is None:
+                self._note_lists = zip(self._starts.tolist(), self._durations.tolist(), self._pitches.tolist(),
+                                       self._volumes.tolist())
+            (start, end) = (self._chord_offsets[index], self._chord_offsets[index + 1])
+            sound_event = InstrumentSoundEvent(Note(*note) for note in self._note_lists[start:end])
+            self._sound_events[index] = sound_event
+        return sound_event
 
     def get_sound_events(self):
         """
         :return: list of sound events
         """
-        return self._sound_events.values()
+        return [self.get_sound_event_at(index) for index in range(len(self))]
+
+    def get_sound_event_hashes(self):
+        """
+        Hashes the sound events straight from the columns, without creating them
+        :return: list with hash(sound event) of each sound event in time order
+        """
+        self.flush()
+        encodings = ((self._durations << 8) | self._pitches).tolist()
+        offsets = self._chord_offsets.tolist()
+        return [hash((hash(tuple(encodings[offsets[index]:offsets[index + 1]])) << 8) |
+                     (offsets[index + 1] - offsets[index])) for index in range(len(offsets) - 1)]
 
     def add_sound_event(self, sound_event):
-        self._sound_events[sound_event.get_start_time()] = sound_event
+        for note in sound_event.get_notes():
+            self.add_note(note)
 
     def add_note(self, note):
         """
-        Adds a note to the current sound event, and if there is no sound event at the note start time,
+        Adds a note to the sound event at the note start time, and if there is no sound event at the note start time,
         a new sound event is created
         """
-        if note.start_time not in self._sound_events:
-            self._sound_events[note.start_time] = InstrumentSoundEvent()
-        self._sound_events.get(note.start_time).add_note(note)
+        self._pending_notes.append((note.start_time, note.duration, note.pitch, note.volume))
 
     def __len__(self):
-        return len(self._sound_events)
+        return len(self.get_times())
 
     def __str__(self):
         string = "Track\n"
-        for time in sorted(self._sound_events.keys()):
-            string += str(self._sound_events.get(time)) + "\n"
+        for sound_event in self.get_sound_events():
+            string += str(sound_event) + "\n"
         return string
@@ -1,7 +1,14 @@
+from collections import namedtuple
+
 from graphmodel.model import instruments
 
 __author__ = 'Adisor'
 
+"""
+The song objects are immutable and use slots instead of instance dicts, so a model can hold a large number of them.
+Objects that are equal can be shared, see NoteFlyweights
+"""
+
 
 class InstrumentSoundEvent(object):
     """
@@ -9,23 +16,30 @@ class InstrumentSoundEvent(object):
 
     If the size of the list is greater than 1 - this object symbolizes a chord
     """
+    __slots__ = ('_instrument', '_notes', '_hash')
 
-    def __init__(self, instrument=instruments.PIANO):
+    def __init__(self, notes=(), instrument=instruments.PIANO):
+        """
+        :param notes: iterable of notes, kept as a tuple
+        :param instrument: midi instrument number
+        """
         self._instrument = instrument
-        self._notes = []
+        self._notes = tuple(notes)
         self._hash = None
 
-    def set_instrument(self, instrument):
-        self._instrument = instrument
+    def get_instrument(self):
+        return self._instrument
 
     def get_start_time(self):
         if len(self._notes) == 0:
             return 0
-        return self._notes[0].get_start_time()
+        return self._notes[0].start_time
 
-    def add_note(self, note):
-        self._notes.append(note)
-        self._hash = None
+    def with_note(self, note):
+        """
+        :return: new sound event with the note added after the notes of this one
+        """
+        return InstrumentSoundEvent(self._notes + (note,), self._instrument)
 
     def first(self):
         return self._notes[0]
@@ -38,21 +52,20 @@ class InstrumentSoundEvent(object):
         Builds the hash first if it is null. The hash is built by creating a tuple of notes and using the builtin
         hash function on the tuple
 
-        The tuple contains the notes in sorted order by duration because the tuple hashing function should not care
-        about the order of the notes
+        The notes are hashed in the order in which they were added
 
         Things the hash could include: pauses
         """
         if self._hash is None:
-            notes_tuple = ()
-            for note in sorted(self._notes, key=lambda key: self._notes[0].duration):
-                notes_tuple += (note,)
-            self._hash = (hash(notes_tuple) << 8) | len(notes_tuple)
+            self._hash = (hash(self._notes) << 8) | len(self._notes)
         return self._hash
 
     def __eq__(self, other):
         return self.__hash__() == other.__hash__()
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
     def __str__(self):
         string = " "
         for note in self._notes:
@@ -64,13 +77,22 @@ class OrchestralSoundEvent(object):
     """
     Collection of instrument sound events
     """
+    __slots__ = ('_instrument_sound_events', '_hash')
 
-    def __init__(self):
-        self._instrument_sound_events = {}
+    def __init__(self, instrument_sound_events=None):
+        """
+        :param instrument_sound_events: dict that maps instruments to sound events, it is copied
+        """
+        self._instrument_sound_events = dict(instrument_sound_events or {})
         self._hash = None
 
-    def add_sound_event(self, instrument, sound_event):
-        self._instrument_sound_events[instrument] = sound_event
+    def with_sound_event(self, instrument, sound_event):
+        """
+        :return: new orchestral sound event with the sound event set for the instrument
+        """
+        instrument_sound_events = dict(self._instrument_sound_events)
+        instrument_sound_events[instrument] = sound_event
+        return OrchestralSoundEvent(instrument_sound_events)
 
     def get_instruments(self):
         return self._instrument_sound_events.keys()
@@ -89,6 +111,9 @@ class OrchestralSoundEvent(object):
     def __eq__(self, other):
         return self.__hash__() == other.__hash__()
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
     def __str__(self):
         string = str(self.__class__.__name__)
         for instrument in self.get_instruments():
@@ -96,20 +121,17 @@ class OrchestralSoundEvent(object):
         return string
 
 
-class Note(object):
+class Note(namedtuple('NoteFields', ['start_time', 'duration', 'pitch', 'volume'])):
     """
     The class that represents a musical note.
 
     The class contains a custom hash function to ensure its uniqueness.
     A note is unique by its duration and pitch
     """
+    __slots__ = ()
 
-    def __init__(self, start_time=0, duration=0, pitch=0, volume=0):
-        self.start_time = start_time
-        self.duration = duration
-        self.pitch = pitch
-        self.volume = volume
-        self._hash = None
+    def __new__(cls, start_time=0, duration=0, pitch=0, volume=0):
+        return super(Note, cls).__new__(cls, start_time, duration, pitch, volume)
 
     # duration | tempo | pitch
     # bytes: >0 | 24 | 8
@@ -117,13 +139,45 @@ class Note(object):
         return (self.duration << 8) | self.pitch
 
     def __hash__(self):
-        if self._hash is None:
-            self._hash = self.encoding()
-        return self._hash
+        return self.encoding()
 
     def __eq__(self, other):
         return self.encoding() == other.encoding()
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
     def __str__(self):
         args = (self.__class__.__name__, self.start_time, self.duration, self.pitch, self.volume, self.__hash__())
         return '{}(s:{}, d:{}, pitch:{}, vol:{}, hash:{})'.format(*args)
+
+
+class NoteFlyweights(object):
+    """
+    Shares the notes and sound events that are kept by a model
+
+    Inside a model a sound event only stands for the notes it plays, so the shared objects are moved to time 0 and
+    each distinct (duration, pitch, volume) note is created once for all the sound events that play it
+    """
+
+    def __init__(self):
+        # maps (duration, pitch, volume) to the shared note
+        self._notes = {}
+
+    def intern_note(self, note):
+        key = (note.duration, note.pitch, note.volume)
+        shared_note = self._notes.get(key)
+        if shared_note is None:
+            shared_note = Note(duration=note.duration, pitch=note.pitch, volume=note.volume)
+            self._notes[key] = shared_note
+        return shared_note
+
+    def intern_sound_event(self, sound_event):
+        """
+        :return: sound event equal to the parameter, made of shared notes
+        """
+        return InstrumentSoundEvent(tuple(self.intern_note(note) for note in sound_event.get_notes()),
+                                    sound_event.get_instrument())
+
+    def __len__(self):
+        return len(self._notes)
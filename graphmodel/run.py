@@ -1,18 +1,35 @@
 from __future__ import print_function  # In python 2.7
 import os, sys
 sys.path.append('/home/ubuntu/sebastian')
-from flask import Flask, request, redirect, url_for, json, make_response, request
+from flask import Flask, request, redirect, url_for, json, make_response, request, Response
 from flask import send_from_directory
 from flask import render_template
 from werkzeug import secure_filename
 import random, string
+import time
 import Generator
+import jobs
+from graphmodel.appio import reader
+from graphmodel.appio.cache import MemoryCache, OutputCache, TranscriptCache
 
 
 UPLOAD_FOLDER_PREFIX = 'static/files/{}'
 ALLOWED_EXTENSIONS = set(['mid'])
+TRANSCRIPT_CACHE_FOLDER = 'cache/transcripts'
+OUTPUT_CACHE_FOLDER = 'cache/outputs'
+MODEL_CACHE_SIZE = 512 * 1024 * 1024
+GENERATION_WORKERS = 2
+MAX_PENDING_JOBS = 16
+JOB_EVENTS_INTERVAL = 0.5
 
 app = Flask(__name__)
+# the same files are uploaded over and over, so the decoded files are kept by their content
+reader.transcript_cache = TranscriptCache(TRANSCRIPT_CACHE_FOLDER)
+# new ticks or policies for a song only repeat the sampling, and songs generated with a seed are kept as they are
+Generator.model_cache = MemoryCache(MODEL_CACHE_SIZE, Generator.estimate_model_size)
+Generator.output_cache = OutputCache(OUTPUT_CACHE_FOLDER)
+# songs are generated in the background, the jobs only exist in this process so run the app with a single worker
+job_queue = jobs.JobQueue(workers=GENERATION_WORKERS, max_pending=MAX_PENDING_JOBS)
 
 
 def allowed_file(filename):
@@ -34,20 +51,41 @@ def upload_file():
 
     if request.method == 'POST':
         upload_files = request.files.getlist("file[]")
-        ticks = int(request.form['ticks'])
-        nsize = int(request.form['nsize'])
         policy = request.form['policy']
-        for f in upload_files:
-            if f and allowed_file(f.filename):
-                filename = secure_filename(f.filename)
-                destination = os.path.join(upload_folder, filename)
-                f.save(destination)
-                Generator.generate(filename, ticks, folder=upload_folder, nsize=nsize, policy=policy)
-        return redirect(url_for('upload_file'))
+        seed = request.form.get('seed', '').strip()
+        try:
+            ticks = int(request.form['ticks'])
+            nsize = int(request.form['nsize'])
+            seed = int(seed) if seed else None
+        except ValueError:
+            resp = json.jsonify(error="Ticks, ngram size and seed must be whole numbers")
+            resp.status_code = 400
+            return resp
+        job_ids = []
+        try:
+            for f in upload_files:
+                if f and allowed_file(f.filename):
+                    filename = secure_filename(f.filename)
+                    destination = os.path.join(upload_folder, filename)
+                    f.save(destination)
+                    job = job_queue.submit(Generator.generate, filename, ticks, folder=upload_folder, nsize=nsize,
+                                           policy=policy, seed=seed)
+                    job_ids.append(job.id)
+        except jobs.QueueFullError as error:
+            resp = json.jsonify(error=str(error), jobs=job_ids)
+            resp.status_code = 503
+            resp.headers['Retry-After'] = '30'
+            return resp
+        if request.is_xhr or request.accept_mimetypes.best == 'application/json':
+            resp = json.jsonify(jobs=job_ids)
+            resp.status_code = 202
+            return resp
+        return redirect(url_for('upload_file', jobs=','.join(job_ids)))
 
     songs = os.listdir(upload_folder)
-    resp = make_response(render_template("index.html",
-                                         title='Sebastian Music', songs=songs, upload_folder=upload_folder))
+    job_ids = [job_id for job_id in request.args.get('jobs', '').split(',') if job_id]
+    resp = make_response(render_template("index.html", title='Sebastian Music', songs=songs,
+                                         upload_folder=upload_folder, job_ids=job_ids))
     resp.set_cookie('foldername', folder_name)
 
     return resp
@@ -68,6 +106,52 @@ def delete_song():
     return redirect(url_for('upload_file'))
 
 
+@app.route('/jobs')
+def job_queue_stats():
+    return json.jsonify(job_queue.get_stats())
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get_job(job_id)
+    if job is None:
+        resp = json.jsonify(error='unknown job')
+        resp.status_code = 404
+        return resp
+    return json.jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Server sent events with the status of the job, until it is finished
+    """
+    job = job_queue.get_job(job_id)
+    if job is None:
+        resp = json.jsonify(error='unknown job')
+        resp.status_code = 404
+        return resp
+
+    def stream():
+        last_state = None
+        while True:
+            state = job.to_dict()
+            if state != last_state:
+                yield 'data: %s\n\n' % json.dumps(state)
+                last_state = state
+            if job.is_finished():
+                break
+            time.sleep(JOB_EVENTS_INTERVAL)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/stats/cache')
+def cache_stats():
+    return json.jsonify(transcripts=reader.transcript_cache.get_stats(), models=Generator.model_cache.get_stats(),
+                        outputs=Generator.output_cache.get_stats())
+
+
 # @app.route('/songs')
 # def index():
 #     music_files = [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith('mid')]
@@ -0,0 +1,32 @@
+__author__ = 'Adisor'
+import unittest
+
+from graphmodel.appio import reader
+from graphmodel.benchmarks import stages
+
+
+class StageBenchmarkTest(unittest.TestCase):
+
+  def test_rows_of_every_stage(self):
+    results = stages.run_benchmarks(['../music/mary.mid', '../music/Eminem/forgotaboutdre.mid'], [2], [1000, 2000])
+    self.assertEqual(results['rejected'], ['../music/Eminem/forgotaboutdre.mid'])
+    rows = results['rows']
+    self.assertEqual(sorted(set(row['stage'] for row in rows)),
+                     ['build', 'generate', 'load', 'sort_and_index', 'write_bytes', 'write_pattern'])
+    generate_rows = [row for row in rows if row['stage'] == 'generate' and row['ticks'] == 1000]
+    self.assertEqual([row['policy'] for row in generate_rows], ['highest', 'prob'])
+    self.assertEqual([row for row in rows if 'error' in row], [])
+    comparison = stages.compare_results(results, results)
+    self.assertIn(('load', None, rows[0]['seconds'], rows[0]['seconds']), comparison)
+
+  def test_sort_and_index_stage_sorts_every_context(self):
+    ngram = stages.build_without_index(reader.load_transcript('../music/mary.mid'), 2)
+    stages.sort_and_index(ngram)
+    for instrument in ngram.get_instruments():
+      indexer = ngram.get_ngram(instrument).indexer
+      self.assertEqual(len(indexer.unsorted_contexts), 0)
+      self.assertEqual(sorted(indexer.context_samplers), sorted(indexer.first_sound_event_frames))
+
+
+if __name__ == '__main__':
+  unittest.main()
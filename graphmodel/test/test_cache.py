@@ -0,0 +1,156 @@
+__author__ = 'Adisor'
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from graphmodel import Generator
+from graphmodel.appio import midistream, reader
+from graphmodel.appio.cache import DiskCache, ENTRY_HEADER, MemoryCache, OutputCache, TranscriptCache
+from graphmodel.appio.scheduler import PatternSchedule
+from graphmodel.appio.writer import MidiBytesWriter
+from graphmodel.model.Policies import FrameSelectionPolicy
+
+
+class DiskCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+
+  def test_least_recently_used_entries_are_evicted(self):
+    disk_cache = DiskCache(self.folder, 3 * (ENTRY_HEADER.size + 10))
+    for (index, key) in enumerate(['a', 'b', 'c']):
+      disk_cache.put(key, str(index) * 10)
+      os.utime(disk_cache.get_entry_path(key), (index, index))
+    self.assertEqual(disk_cache.get('a'), '0' * 10)
+    disk_cache.put('d', '3' * 10)
+    self.assertIsNone(disk_cache.get('b'))
+    self.assertEqual(disk_cache.get('a'), '0' * 10)
+    self.assertEqual(disk_cache.get('d'), '3' * 10)
+    stats = disk_cache.get_stats()
+    self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['entries']), (3, 1, 1, 3))
+
+  def test_damaged_entry_is_a_miss(self):
+    disk_cache = DiskCache(self.folder, 1000)
+    disk_cache.put('a', 'payload')
+    with open(disk_cache.get_entry_path('a'), 'r+b') as entry_file:
+      entry_file.seek(ENTRY_HEADER.size)
+      entry_file.write('X')
+    self.assertIsNone(disk_cache.get('a'))
+    self.assertFalse(os.path.exists(disk_cache.get_entry_path('a')))
+
+
+class TranscriptCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+
+  def tearDown(self):
+    reader.transcript_cache = None
+    shutil.rmtree(self.folder)
+
+  def test_encoding_round_trip(self):
+    midi_arrays = midistream.read_midi_file('../music/bach.mid')
+    decoded = midistream.decode_midi_arrays(midistream.encode_midi_arrays(midi_arrays))
+    self.assertEqual((decoded.format, decoded.resolution), (midi_arrays.format, midi_arrays.resolution))
+    for (track, decoded_track) in zip(midi_arrays.tracks, decoded.tracks):
+      for name in ['starts', 'durations', 'pitches', 'velocities', 'channels']:
+        self.assertEqual(getattr(track, name).tolist(), getattr(decoded_track, name).tolist())
+      self.assertEqual(track.program, decoded_track.program)
+      self.assertEqual([(start_time, type(event), event.tick, event.data) for (start_time, event) in track.meta_events],
+                       [(start_time, type(event), event.tick, event.data)
+                        for (start_time, event) in decoded_track.meta_events])
+
+  def test_cached_transcript_is_the_same(self):
+    expected = reader.load_transcript('../music/mary.mid')
+    reader.transcript_cache = TranscriptCache(self.folder)
+    first = reader.load_transcript('../music/mary.mid')
+    second = reader.load_transcript('../music/mary.mid')
+    self.assertEqual(str(first), str(expected))
+    self.assertEqual(str(second), str(expected))
+    self.assertEqual(second.get_tempo_dict().keys(), expected.get_tempo_dict().keys())
+    stats = reader.transcript_cache.get_stats()
+    self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+  def test_rejected_files_are_not_cached(self):
+    reader.transcript_cache = TranscriptCache(self.folder)
+    for attempt in range(2):
+      (transcript, report) = reader.load_transcript_with_report('../music/Eminem/forgotaboutdre.mid')
+      self.assertFalse(report.is_valid())
+    self.assertEqual(reader.transcript_cache.get_stats()['entries'], 0)
+
+
+class MemoryCacheTest(unittest.TestCase):
+
+  def test_least_recently_used_objects_are_evicted(self):
+    memory_cache = MemoryCache(10, len)
+    memory_cache.put('a', 'aaaa')
+    memory_cache.put('b', 'bbbb')
+    self.assertEqual(memory_cache.get('a'), 'aaaa')
+    memory_cache.put('c', 'cccc')
+    self.assertIsNone(memory_cache.get('b'))
+    self.assertEqual(memory_cache.get('a'), 'aaaa')
+    memory_cache.put('d', 'd' * 11)
+    self.assertIsNone(memory_cache.get('d'))
+    stats = memory_cache.get_stats()
+    self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (2, 2, 1, 8))
+
+
+class GeneratorCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    shutil.copy('../music/mary.mid', self.folder)
+    Generator.model_cache = MemoryCache(1024 * 1024 * 1024, Generator.estimate_model_size)
+    Generator.output_cache = OutputCache(os.path.join(self.folder, 'outputs'))
+
+  def tearDown(self):
+    Generator.model_cache = None
+    Generator.output_cache = None
+    shutil.rmtree(self.folder)
+
+  def generate(self, policy, seed):
+    output_file_name = Generator.generate('mary.mid', 2000, folder=self.folder, nsize=2, policy=policy, seed=seed)
+    with open(output_file_name, 'rb') as output_file:
+      return output_file.read()
+
+  def test_repeated_generations_use_the_caches(self):
+    first = self.generate('prob', 1)
+    self.generate('highest', 1)
+    self.assertEqual(self.generate('prob', 1), first)
+    self.assertEqual(Generator.model_cache.get_stats()['misses'], 1)
+    stats = Generator.output_cache.get_stats()
+    self.assertEqual((stats['hits'], stats['entries']), (1, 2))
+
+  def test_seeded_generation_is_the_same_without_caches(self):
+    cached = self.generate('prob', 3)
+    Generator.model_cache = None
+    Generator.output_cache = None
+    self.assertEqual(self.generate('prob', 3), cached)
+
+  def test_cached_model_gives_the_same_song_on_every_thread(self):
+    input_file_name = os.path.join(self.folder, 'mary.mid')
+    (ngram, meta) = Generator.load_model(input_file_name, 2, ('mary', 2))
+    outputs = [None] * 4
+
+    def generate(index):
+      (ngram, meta) = Generator.load_model(input_file_name, 2, ('mary', 2))
+      policy = [FrameSelectionPolicy.PROB, FrameSelectionPolicy.HIGHEST_COUNT][index % 2]
+      scheduled_tracks = Generator.generate_multi_instrument_tracks(ngram, 20000, policy, seed=5)
+      outputs[index] = MidiBytesWriter(PatternSchedule(scheduled_tracks, meta)).encode()
+
+    threads = [threading.Thread(target=generate, args=(index,)) for index in range(len(outputs))]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(Generator.model_cache.get_stats()['misses'], 1)
+    for instrument in ngram.get_instruments():
+      self.assertEqual(len(ngram.get_ngram(instrument).indexer.unsorted_contexts), 0)
+    self.assertEqual(outputs[2], outputs[0])
+    self.assertEqual(outputs[3], outputs[1])
+
@@ -0,0 +1,39 @@
+__author__ = 'Adisor'
+import unittest
+
+from graphmodel import corpus
+from graphmodel.NGram import MultiInstrumentNGram
+from graphmodel.appio import modelfile, reader
+
+
+class CorpusTest(unittest.TestCase):
+
+  def setUp(self):
+    self.midi_file_names = ['../music/mary.mid', '../music/bach.mid', '../music/Eminem/mosh.mid']
+
+  def sequential_model(self, nsize):
+    ngram = MultiInstrumentNGram(nsize)
+    for midi_file_name in self.midi_file_names:
+      ngram.build_from_transcript(reader.load_transcript(midi_file_name))
+    return ngram
+
+  def assert_same_sections(self, expected, actual):
+    expected_sections = modelfile.model_sections(expected)
+    actual_sections = modelfile.model_sections(actual)
+    self.assertEqual(sorted(expected_sections), sorted(actual_sections))
+    for name in expected_sections:
+      self.assertEqual(expected_sections[name].tolist(), actual_sections[name].tolist(), name)
+
+  def test_parallel_build_matches_sequential_build(self):
+    (ngram, rejected) = corpus.build_corpus_model(self.midi_file_names, 4, processes=2)
+    self.assertEqual(rejected, [])
+    self.assert_same_sections(self.sequential_model(4), ngram)
+
+  def test_in_process_build_matches_sequential_build(self):
+    (ngram, rejected) = corpus.build_corpus_model(self.midi_file_names, 2, processes=1)
+    self.assert_same_sections(self.sequential_model(2), ngram)
+
+  def test_list_midi_files(self):
+    midi_file_names = corpus.list_midi_files(['../music/Eminem', '../music/mary.mid'])
+    self.assertEqual(midi_file_names[-1], '../music/mary.mid')
+    self.assertEqual(len(midi_file_names), 15)
@@ -0,0 +1,40 @@
+__author__ = 'Adisor'
+import unittest
+from StringIO import StringIO
+
+from graphmodel import Generator
+from graphmodel.NGram import MultiInstrumentNGram
+from graphmodel.appio import reader
+from graphmodel.appio.scheduler import PatternSchedule
+from graphmodel.appio.writer import MidiBytesWriter, MidiStreamWriter
+from graphmodel.model.Policies import FrameSelectionPolicy
+
+
+class ParallelGenerationTest(unittest.TestCase):
+
+  def setUp(self):
+    transcript = reader.load_transcript('../music/bach.mid')
+    self.meta = transcript.get_transcript_meta()
+    self.ngram = MultiInstrumentNGram(3)
+    self.ngram.build_from_transcript(transcript)
+
+  def test_same_file_as_serial_generation(self):
+    scheduled_tracks = Generator.generate_multi_instrument_tracks(self.ngram, 5000, FrameSelectionPolicy.PROB, seed=4)
+    expected = MidiBytesWriter(PatternSchedule(scheduled_tracks, self.meta)).encode()
+    for processes in [1, 2]:
+      track_buffers = Generator.generate_parallel_tracks(self.ngram, 5000, 4, FrameSelectionPolicy.PROB,
+                                                         processes=processes)
+      output = StringIO()
+      MidiStreamWriter(PatternSchedule(track_buffers, self.meta)).write_encoded(output)
+      self.assertEqual(output.getvalue(), expected)
+
+  def test_instrument_without_frames_is_silent(self):
+    ngram = MultiInstrumentNGram(3)
+    ngram.get_or_create_ngram(40)
+    scheduled_track = Generator.generate_multi_instrument_tracks(ngram, 1000, FrameSelectionPolicy.PROB, seed=1)[0]
+    self.assertEqual(scheduled_track.get_duration(), 0)
+    self.assertEqual(len(scheduled_track.get_scheduled_events()), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,65 @@
+__author__ = 'Adisor'
+import threading
+import time
+import unittest
+
+from graphmodel.jobs import JobQueue, JobStatus, QueueFullError
+
+
+def wait_for(job, timeout=5):
+  end = time.time() + timeout
+  while not job.is_finished() and time.time() < end:
+    time.sleep(0.01)
+
+
+class JobQueueTest(unittest.TestCase):
+
+  def test_job_result_and_progress(self):
+    def task(a, b, progress):
+      progress(0.5, 'adding')
+      return a + b
+
+    job = JobQueue(workers=1).submit(task, 1, b=2)
+    wait_for(job)
+    self.assertEqual(job.status, JobStatus.DONE)
+    self.assertEqual(job.result, 3)
+    self.assertEqual((job.progress, job.stage), (0.5, 'adding'))
+
+  def test_failed_job_keeps_error(self):
+    def task(progress):
+      raise ValueError("bad input")
+
+    job = JobQueue(workers=1).submit(task)
+    wait_for(job)
+    self.assertEqual(job.status, JobStatus.FAILED)
+    self.assertEqual(job.error, "ValueError: bad input")
+
+  def test_full_queue_refuses_jobs(self):
+    release = threading.Event()
+
+    def task(progress):
+      release.wait()
+
+    job_queue = JobQueue(workers=1, max_pending=2)
+    jobs = [job_queue.submit(task), job_queue.submit(task)]
+    self.assertRaises(QueueFullError, job_queue.submit, task)
+    release.set()
+    for job in jobs:
+      wait_for(job)
+    time.sleep(0.05)
+    self.assertEqual(job_queue.get_depth(), 0)
+    self.assertEqual(job_queue.get_job(jobs[0].id).status, JobStatus.DONE)
+
+  def test_old_finished_jobs_are_forgotten(self):
+    job_queue = JobQueue(workers=1, max_finished=1)
+    first = job_queue.submit(lambda progress: None)
+    wait_for(first)
+    second = job_queue.submit(lambda progress: None)
+    wait_for(second)
+    time.sleep(0.05)
+    self.assertIsNone(job_queue.get_job(first.id))
+    self.assertIs(job_queue.get_job(second.id), second)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,76 @@
+__author__ = 'Adisor'
+import unittest
+from StringIO import StringIO
+
+import midi
+
+from graphmodel.appio import midistream
+from graphmodel.appio.preprocessing import AnalysisReport
+from graphmodel.utils import MidiUtils
+
+
+def to_bytes(pattern):
+  midi_file = StringIO()
+  midi.write_midifile(midi_file, pattern)
+  return midi_file.getvalue()
+
+
+def build_pattern(note_events):
+  pattern = midi.Pattern(resolution=96)
+  pattern.append(midi.Track([midi.SetTempoEvent(tick=0, bpm=100), midi.TimeSignatureEvent(tick=5),
+                             midi.EndOfTrackEvent(tick=0)]))
+  pattern.append(midi.Track(note_events + [midi.EndOfTrackEvent(tick=0)]))
+  return pattern
+
+
+class MidiStreamTest(unittest.TestCase):
+
+  def test_running_status_and_meta(self):
+    pattern = build_pattern([midi.ProgramChangeEvent(tick=0, channel=2, data=[33]),
+                             midi.NoteOnEvent(tick=0, channel=2, pitch=60, velocity=90),
+                             midi.NoteOnEvent(tick=0, channel=2, pitch=64, velocity=80),
+                             midi.NoteOnEvent(tick=200, channel=2, pitch=60, velocity=0),
+                             midi.NoteOffEvent(tick=40, channel=2, pitch=64)])
+    midi_arrays = midistream.read_midi_bytes(to_bytes(pattern))
+    self.assertEqual((midi_arrays.format, midi_arrays.resolution), (1, 96))
+    track = midi_arrays.tracks[1]
+    self.assertEqual(track.starts.tolist(), [0, 0])
+    self.assertEqual(track.durations.tolist(), [200, 240])
+    self.assertEqual(track.pitches.tolist(), [60, 64])
+    self.assertEqual(track.velocities.tolist(), [90, 80])
+    self.assertEqual(track.channels.tolist(), [2, 2])
+    self.assertEqual(track.program, 33)
+    meta_events = midi_arrays.tracks[0].meta_events
+    self.assertEqual([start_time for (start_time, event) in meta_events], [0, 5])
+    self.assertEqual(meta_events[0][1].bpm, 100)
+    self.assertTrue(MidiUtils.is_time_signature_event(meta_events[1][1]))
+
+  def test_overlapping_notes_with_the_same_pitch(self):
+    pattern = build_pattern([midi.NoteOnEvent(tick=0, channel=0, pitch=60, velocity=90),
+                             midi.NoteOnEvent(tick=10, channel=0, pitch=60, velocity=90),
+                             midi.NoteOffEvent(tick=10, channel=0, pitch=60),
+                             midi.NoteOffEvent(tick=30, channel=0, pitch=60),
+                             midi.NoteOffEvent(tick=5, channel=0, pitch=61)])
+    track = midistream.read_midi_bytes(to_bytes(pattern)).tracks[1]
+    self.assertEqual(track.starts.tolist(), [0, 10])
+    self.assertEqual(track.durations.tolist(), [20, 40])
+
+  def test_report(self):
+    pattern = build_pattern([midi.NoteOnEvent(tick=0, channel=0, pitch=60, velocity=90),
+                             midi.NoteOnEvent(tick=0, channel=1, pitch=60, velocity=90),
+                             midi.KeySignatureEvent(tick=0)])
+    report = AnalysisReport()
+    midistream.read_midi_bytes(to_bytes(pattern), report)
+    self.assertEqual(report.get_rules(), [AnalysisReport.MULTIPLE_CHANNELS,
+                                          AnalysisReport.MISPLACED_GLOBAL_META_EVENT])
+
+  def test_matches_python_midi_notes(self):
+    pattern = midi.read_midifile('../music/bach.mid')
+    midi_arrays = midistream.read_midi_file('../music/bach.mid')
+    self.assertEqual(len(midi_arrays.tracks), len(pattern))
+    for (track, track_arrays) in zip(pattern, midi_arrays.tracks):
+      notes = [(event.pitch, event.velocity) for event in track if MidiUtils.is_new_note(event)]
+      self.assertEqual(zip(track_arrays.pitches.tolist(), track_arrays.velocities.tolist()), notes)
+
+  def test_bad_header(self):
+    self.assertRaises(midistream.MidiStreamError, midistream.read_midi_bytes, 'RIFF' + '\0' * 20)
@@ -0,0 +1,132 @@
+__author__ = 'Adisor'
+import os
+import shutil
+import tempfile
+import unittest
+
+import midi
+
+from graphmodel import Generator
+from graphmodel.NGram import MultiInstrumentNGram, merge_models
+from graphmodel.appio import modelfile, reader
+from graphmodel.model.Policies import FrameSelectionPolicy
+from graphmodel.model.Song import InstrumentTrack
+from graphmodel.model.SongObjects import Note
+from graphmodel.utils.timeline import TempoTimeline
+
+
+def build_model(nsize=3):
+  tempo_timeline = TempoTimeline()
+  tempo_timeline.set_tempo(0, midi.SetTempoEvent(data=[7, 161, 32]))
+  tempo_timeline.set_tempo(300, midi.SetTempoEvent(data=[6, 26, 128]))
+  ngram = MultiInstrumentNGram(nsize)
+  for instrument, pitches in ((0, [60, 62, 64, 60, 62, 64, 65, 60, 62]), (24, [40, 43, 40, 43, 47])):
+    track = InstrumentTrack()
+    for index, pitch in enumerate(pitches):
+      track.add_note(Note(start_time=index * 60, duration=50 + index % 2, pitch=pitch, volume=80 + index))
+      track.add_note(Note(start_time=index * 60, duration=120, pitch=pitch - 12, volume=70))
+    ngram.add_instrument_track(instrument, track, tempo_timeline)
+  return ngram
+
+
+def frames_and_counts(ngram):
+  return [(ngram.get_frame_components(frame), ngram.frame_distribution[frame].count) for frame in ngram.frames]
+
+
+class ModelFileTest(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.model_file_name = os.path.join(self.folder, 'model.bin')
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+
+  def assert_same_model(self, expected, actual):
+    self.assertEqual(expected.nsize, actual.nsize)
+    self.assertEqual(sorted(expected.get_instruments()), sorted(actual.get_instruments()))
+    self.assertEqual(len(expected.vocabulary), len(actual.vocabulary))
+    for component_id in range(len(expected.vocabulary)):
+      self.assertEqual(expected.vocabulary.get_component_key(component_id),
+                       actual.vocabulary.get_component_key(component_id))
+    for instrument in expected.get_instruments():
+      expected_ngram = expected.get_ngram(instrument)
+      actual_ngram = actual.get_ngram(instrument)
+      self.assertEqual([(frame, expected_ngram.frame_distribution[frame].count) for frame in expected_ngram.frames],
+                       [(frame, actual_ngram.frame_distribution[frame].count) for frame in actual_ngram.frames])
+      for component_id in range(len(expected.vocabulary)):
+        self.assertEqual(expected_ngram.get_next_best_frame(component_id),
+                         actual_ngram.get_next_best_frame(component_id))
+
+  def test_round_trip(self):
+    ngram = build_model()
+    modelfile.save_model(ngram, self.model_file_name)
+    self.assert_same_model(ngram, modelfile.load_model(self.model_file_name))
+
+  def test_round_trip_keeps_notes_and_tempos(self):
+    ngram = build_model()
+    modelfile.save_model(ngram, self.model_file_name)
+    loaded = modelfile.load_model(self.model_file_name)
+    for component_id in range(len(ngram.vocabulary)):
+      expected = ngram.vocabulary.get_component(component_id)
+      actual = loaded.vocabulary.get_component(component_id)
+      self.assertEqual(expected.get_tempo_event().data, actual.get_tempo_event().data)
+      self.assertEqual([(note.duration, note.pitch, note.volume) for note in expected.get_sound_event().get_notes()],
+                       [(note.duration, note.pitch, note.volume) for note in actual.get_sound_event().get_notes()])
+
+  def test_round_trip_weighted_counts(self):
+    ngram = merge_models([build_model()], [0.25])
+    modelfile.save_model(ngram, self.model_file_name)
+    self.assert_same_model(ngram, modelfile.load_model(self.model_file_name))
+
+  def test_rejects_corrupt_files(self):
+    modelfile.save_model(build_model(), self.model_file_name)
+    with open(self.model_file_name, 'rb') as model_file:
+      data = model_file.read()
+    with open(self.model_file_name, 'wb') as model_file:
+      model_file.write(data[:-1] + chr(ord(data[-1]) ^ 1))
+    self.assertRaises(modelfile.ModelFileError, modelfile.load_model, self.model_file_name)
+    with open(self.model_file_name, 'wb') as model_file:
+      model_file.write('NOTAMODEL' + data[9:])
+    self.assertRaises(modelfile.ModelFileError, modelfile.load_model, self.model_file_name)
+
+
+class MappedModelTest(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.model_file_name = os.path.join(self.folder, 'model.bin')
+    self.ngram = build_model()
+    modelfile.save_model(self.ngram, self.model_file_name)
+    self.mapped = modelfile.map_model(self.model_file_name)
+
+  def tearDown(self):
+    self.mapped.close()
+    shutil.rmtree(self.folder)
+
+  def test_queries_match_loaded_model(self):
+    for instrument in self.ngram.get_instruments():
+      ngram = self.ngram.get_ngram(instrument)
+      mapped = self.mapped.get_ngram(instrument)
+      self.assertEqual(ngram.get_first_frame(), mapped.get_first_frame())
+      for component_id in range(len(self.ngram.vocabulary)):
+        self.assertEqual(ngram.get_next_best_frame(component_id), mapped.get_next_best_frame(component_id))
+        self.assertEqual(ngram.get_next_frame_counts(component_id), mapped.get_next_frame_counts(component_id))
+        frame = mapped.get_next_prob_frame(component_id)
+        self.assertTrue(frame is None or frame[0] == component_id)
+
+  def test_generation_matches_loaded_model(self):
+    # the contexts of the song have several frames, and the highest count generations sort them before the draws
+    ngram = MultiInstrumentNGram(2)
+    ngram.build_from_transcript(reader.load_transcript('../music/Eminem/mosh.mid'))
+    model_file_name = os.path.join(self.folder, 'mosh.bin')
+    modelfile.save_model(ngram, model_file_name)
+    mapped = modelfile.map_model(model_file_name)
+    try:
+      for policy in [FrameSelectionPolicy.HIGHEST_COUNT, FrameSelectionPolicy.PROB]:
+        for seed in range(3):
+          expected = Generator.generate_multi_instrument_tracks(ngram, 5000, policy, seed=seed)
+          actual = Generator.generate_multi_instrument_tracks(mapped, 5000, policy, seed=seed)
+          self.assertEqual([str(track) for track in expected], [str(track) for track in actual])
+    finally:
+      mapped.close()
@@ -0,0 +1,185 @@
+__author__ = 'Adisor'
+import unittest
+
+from graphmodel.NGram import OrderedFrames, FrameComponentVocabulary, MultiInstrumentNGram, NGramBuildBackend, \
+  _SingleInstrumentNGram, HighestCountFrameSelector, merge_models
+from graphmodel.model.Song import InstrumentTrack
+from graphmodel.model.SongObjects import InstrumentSoundEvent, Note
+from graphmodel.utils.timeline import TempoTimeline
+
+
+class OrderedFramesTest(unittest.TestCase):
+
+  def test_emits_each_window_once(self):
+    frames = OrderedFrames(3)
+    emitted = []
+    for component in range(6):
+      frames.add(component)
+      if frames.is_first_frame_full():
+        emitted.append(frames.remove_first())
+      self.assertFalse(frames.is_first_frame_full())
+    self.assertEqual(emitted, [(0, 1, 2), (1, 2, 3), (2, 3, 4), (3, 4, 5)])
+
+  def test_short_track_emits_nothing(self):
+    frames = OrderedFrames(3)
+    frames.add(0)
+    frames.add(1)
+    self.assertFalse(frames.is_first_frame_full())
+
+  def test_zero_size_never_fills(self):
+    frames = OrderedFrames(0)
+    frames.add(0)
+    self.assertFalse(frames.is_first_frame_full())
+
+
+class FrameComponentVocabularyTest(unittest.TestCase):
+
+  def sound_event(self, start_time, pitch):
+    return InstrumentSoundEvent([Note(start_time=start_time, duration=10, pitch=pitch, volume=100)])
+
+  def test_equal_components_share_an_id(self):
+    vocabulary = FrameComponentVocabulary()
+    first = vocabulary.intern_component(self.sound_event(0, 60), pause_to_next_event=10)
+    second = vocabulary.intern_component(self.sound_event(50, 60), pause_to_next_event=10)
+    self.assertEqual(first, second)
+    self.assertEqual(len(vocabulary), 1)
+
+  def test_timing_distinguishes_components(self):
+    vocabulary = FrameComponentVocabulary()
+    first = vocabulary.intern_component(self.sound_event(0, 60), pause_to_next_event=10)
+    second = vocabulary.intern_component(self.sound_event(0, 60), pause_to_next_event=20)
+    self.assertNotEqual(first, second)
+    self.assertIs(vocabulary.get_component(first).get_sound_event(),
+                  vocabulary.get_component(second).get_sound_event())
+
+
+def build_track(pitches, step=60):
+  track = InstrumentTrack()
+  for index, pitch in enumerate(pitches):
+    track.add_note(Note(start_time=index * step + (index % 3) * 10, duration=step, pitch=pitch, volume=90))
+  return track
+
+
+def counted_frames(ngram):
+  return sorted((frame, data.count) for frame, data in ngram.frame_distribution.items())
+
+
+class NGramBuildBackendTest(unittest.TestCase):
+
+  def build(self, backend, nsize):
+    ngram = MultiInstrumentNGram(nsize, backend=backend)
+    ngram.add_instrument_track(0, build_track([60, 62, 64, 60, 62, 64, 65, 60, 62, 64]), TempoTimeline())
+    ngram.add_instrument_track(0, build_track([64, 60, 62, 64, 60]), TempoTimeline())
+    return ngram
+
+  def test_backends_count_the_same_frames(self):
+    for nsize in (1, 2, 4, 20):
+      python_ngram = self.build(NGramBuildBackend.PYTHON, nsize)
+      numpy_ngram = self.build(NGramBuildBackend.NUMPY, nsize)
+      self.assertEqual(counted_frames(python_ngram.get_ngram(0)), counted_frames(numpy_ngram.get_ngram(0)))
+      self.assertEqual(len(python_ngram.vocabulary), len(numpy_ngram.vocabulary))
+
+
+class SoundEventFrameIndexerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.ngram = _SingleInstrumentNGram(2)
+
+  def test_reindexing_does_not_duplicate_frames(self):
+    self.ngram.add_frame_count((0, 1))
+    self.ngram.add_frame_count((0, 2))
+    self.ngram.sort_and_index()
+    self.ngram.add_frame_count((0, 1))
+    self.ngram.sort_and_index()
+    self.ngram.sort_and_index()
+    self.assertEqual(len(self.ngram.indexer.get_frames_that_start_with_sound_event(0)), 2)
+
+  def test_best_frame_follows_count_changes(self):
+    self.ngram.add_frame_count((0, 1))
+    self.ngram.add_frame_count((0, 2), 2)
+    self.ngram.sort_and_index()
+    self.assertEqual(self.ngram.get_next_best_frame(0), (0, 2))
+    self.ngram.add_frame_count((0, 1), 5)
+    self.ngram.sort_and_index()
+    self.assertEqual(self.ngram.get_next_best_frame(0), (0, 1))
+
+  def test_frames_are_indexed_only_after_sort_and_index(self):
+    self.ngram.add_frame_count((3, 4))
+    self.assertIsNone(self.ngram.get_next_best_frame(3))
+    self.ngram.sort_and_index()
+    self.assertEqual(self.ngram.get_next_best_frame(3), (3, 4))
+
+  def test_prob_frame_only_draws_continuations(self):
+    self.ngram.add_frame_count((0, 1))
+    self.ngram.add_frame_count((0, 2), 3)
+    self.ngram.add_frame_count((5, 6))
+    self.ngram.sort_and_index()
+    draws = set(self.ngram.get_next_prob_frame(0) for i in range(100))
+    self.assertEqual(draws, set([(0, 1), (0, 2)]))
+    self.assertIsNone(self.ngram.get_next_prob_frame(9))
+
+  def test_first_and_random_frames_come_from_the_frame_array(self):
+    self.ngram.add_frame_count((0, 1))
+    self.ngram.add_frame_count((0, 2))
+    self.ngram.add_frame_count((0, 1))
+    self.assertEqual(self.ngram.frames, [(0, 1), (0, 2)])
+    self.assertEqual(self.ngram.get_first_frame(), (0, 1))
+    self.ngram.add_frame_count((7, 8))
+    draws = set(self.ngram.get_random_frame() for i in range(200))
+    self.assertEqual(draws, set([(0, 1), (0, 2), (7, 8)]))
+
+
+class HighestCountFrameSelectorTest(unittest.TestCase):
+
+  def test_recently_selected_frames_give_way(self):
+    ngram = _SingleInstrumentNGram(2)
+    ngram.add_frame_count((0, 1), 3)
+    ngram.add_frame_count((0, 2), 2)
+    ngram.add_frame_count((0, 3))
+    ngram.sort_and_index()
+    selector = HighestCountFrameSelector(ngram)
+    selections = [selector.select(0) for i in range(6)]
+    self.assertEqual(selections[0], (0, 1))
+    self.assertEqual(set(selections), set([(0, 1), (0, 2), (0, 3)]))
+    self.assertGreater(selections.count((0, 1)), selections.count((0, 3)))
+
+  def test_no_candidates(self):
+    selector = HighestCountFrameSelector(_SingleInstrumentNGram(2))
+    self.assertIsNone(selector.select(4))
+
+
+class MergeTest(unittest.TestCase):
+
+  def setUp(self):
+    self.first_track = build_track([60, 62, 64, 60, 62, 64, 65])
+    self.second_track = build_track([64, 60, 62, 64, 67, 69])
+
+  def build(self, tracks):
+    ngram = MultiInstrumentNGram(2)
+    for (instrument, track) in tracks:
+      ngram.add_instrument_track(instrument, track, TempoTimeline())
+    return ngram
+
+  def component_frames(self, ngram, instrument):
+    single = ngram.get_ngram(instrument)
+    return sorted((tuple(ngram.vocabulary.get_component_key(component_id) for component_id in frame), count)
+                  for (frame, count) in single.get_frame_counts())
+
+  def test_merge_matches_building_both(self):
+    expected = self.build([(0, self.first_track), (0, self.second_track), (5, self.second_track)])
+    merged = merge_models([self.build([(0, self.first_track)]),
+                           self.build([(0, self.second_track), (5, self.second_track)])])
+    for instrument in (0, 5):
+      self.assertEqual(self.component_frames(expected, instrument), self.component_frames(merged, instrument))
+
+  def test_weights_scale_counts(self):
+    single = self.build([(0, self.first_track)])
+    merged = merge_models([single, single], [1, 0.5])
+    self.assertEqual([count * 1.5 for (frame, count) in single.get_ngram(0).get_frame_counts()],
+                     [count for (frame, count) in merged.get_ngram(0).get_frame_counts()])
+
+  def test_rejects_different_nsize(self):
+    self.assertRaises(ValueError, merge_models, [MultiInstrumentNGram(2), MultiInstrumentNGram(3)])
+
+  def test_rejects_no_models(self):
+    self.assertRaises(ValueError, merge_models, [])
@@ -0,0 +1,47 @@
+__author__ = 'Adisor'
+import unittest
+
+import midi
+
+from graphmodel.appio import reader
+from graphmodel.appio.preprocessing import AnalysisReport, Analyzer, MidiFormatError
+from graphmodel.appio.reader import TranscriptLoader
+
+
+def build_pattern(second_track_events):
+  pattern = midi.Pattern(resolution=120)
+  meta_track = midi.Track([midi.SetTempoEvent(tick=0, bpm=120), midi.EndOfTrackEvent(tick=0)])
+  pattern.append(meta_track)
+  pattern.append(midi.Track(second_track_events + [midi.EndOfTrackEvent(tick=0)]))
+  return pattern
+
+
+class ReaderTest(unittest.TestCase):
+
+  def test_single_pass_load_matches_analyzer(self):
+    pattern = build_pattern([midi.ProgramChangeEvent(tick=0, channel=0, data=[40]),
+                             midi.NoteOnEvent(tick=0, channel=0, pitch=60, velocity=90),
+                             midi.NoteOnEvent(tick=10, channel=0, pitch=60, velocity=0),
+                             midi.NoteOnEvent(tick=0, channel=1, pitch=62, velocity=90),
+                             midi.NoteOffEvent(tick=10, channel=1, pitch=62),
+                             midi.KeySignatureEvent(tick=0)])
+    loader = TranscriptLoader()
+    report = loader.load_pattern(pattern)
+    self.assertEqual(report.get_rules(), [AnalysisReport.MULTIPLE_CHANNELS,
+                                          AnalysisReport.MISPLACED_GLOBAL_META_EVENT])
+    self.assertEqual(report.issues, Analyzer(pattern=pattern).perform_analysis().issues)
+    self.assertEqual(loader.transcript.get_instruments(), [40])
+    self.assertEqual(len(loader.transcript.get_track(40)), 2)
+
+  def test_tracks_without_notes_are_skipped(self):
+    loader = TranscriptLoader()
+    report = loader.load_pattern(build_pattern([midi.ProgramChangeEvent(tick=0, channel=0, data=[40])]))
+    self.assertTrue(report.is_valid())
+    self.assertEqual(loader.transcript.get_instruments(), [])
+
+  def test_rejected_file_raises_report(self):
+    with self.assertRaises(MidiFormatError) as context:
+      reader.load_transcript('../music/Eminem/forgotaboutdre.mid')
+    self.assertFalse(context.exception.report.is_valid())
+    (transcript, report) = reader.load_transcript_with_report('../music/Eminem/forgotaboutdre.mid')
+    self.assertEqual(report.issues, Analyzer('../music/Eminem/forgotaboutdre.mid').perform_analysis().issues)
@@ -0,0 +1,25 @@
+__author__ = 'Adisor'
+import random
+import unittest
+
+from graphmodel.utils.sampling import AliasTable
+
+
+class AliasTableTest(unittest.TestCase):
+
+  def test_draws_follow_weights(self):
+    weights = [1, 0, 3, 6]
+    table = AliasTable(weights)
+    rng = random.Random(7)
+    draws = [0] * len(weights)
+    for i in range(20000):
+      draws[table.sample(rng)] += 1
+    self.assertEqual(draws[1], 0)
+    for index, weight in enumerate(weights):
+      self.assertAlmostEqual(draws[index] / 20000.0, weight / 10.0, delta=0.02)
+
+  def test_single_weight(self):
+    self.assertEqual(AliasTable([5]).sample(), 0)
+
+  def test_needs_positive_weight(self):
+    self.assertRaises(ValueError, AliasTable, [0, 0])
@@ -0,0 +1,43 @@
+__author__ = 'Adisor'
+import unittest
+
+from graphmodel.NGram import FrameComponentVocabulary, FrameStatisticalData
+from graphmodel.model.SongObjects import InstrumentSoundEvent, Note, NoteFlyweights
+
+
+class SongObjectsTest(unittest.TestCase):
+
+  def test_objects_are_immutable_and_slotted(self):
+    note = Note(start_time=10, duration=20, pitch=60, volume=90)
+    self.assertRaises(AttributeError, setattr, note, 'duration', 5)
+    sound_event = InstrumentSoundEvent([note])
+    self.assertRaises(AttributeError, setattr, sound_event, 'volume', 5)
+    for slotted_type in [Note, InstrumentSoundEvent, FrameStatisticalData]:
+      self.assertEqual(slotted_type.__dictoffset__, 0)
+    self.assertRaises(AttributeError, setattr, FrameStatisticalData(), 'other', 5)
+
+  def test_with_note_keeps_the_hash_of_the_chord(self):
+    first = Note(start_time=10, duration=20, pitch=60, volume=90)
+    second = Note(start_time=10, duration=20, pitch=64, volume=90)
+    chord = InstrumentSoundEvent([first]).with_note(second)
+    self.assertEqual(chord.get_notes(), (first, second))
+    self.assertEqual(hash(chord), hash(InstrumentSoundEvent((first, second))))
+    self.assertEqual(chord.get_start_time(), 10)
+
+  def test_flyweights_share_equal_notes(self):
+    flyweights = NoteFlyweights()
+    chord = InstrumentSoundEvent([Note(10, 20, 60, 90), Note(10, 20, 64, 90)])
+    single = InstrumentSoundEvent([Note(50, 20, 60, 90)])
+    shared_chord = flyweights.intern_sound_event(chord)
+    shared_single = flyweights.intern_sound_event(single)
+    self.assertIs(shared_chord.first(), shared_single.first())
+    self.assertEqual(shared_chord, chord)
+    self.assertEqual(len(flyweights), 2)
+
+  def test_vocabulary_keeps_shared_sound_events(self):
+    vocabulary = FrameComponentVocabulary()
+    vocabulary.intern_component(InstrumentSoundEvent([Note(10, 20, 60, 90)]))
+    vocabulary.intern_component(InstrumentSoundEvent([Note(30, 20, 60, 90), Note(30, 40, 67, 90)]))
+    (first, second) = vocabulary.get_sound_events()
+    self.assertIs(first.first(), second.first())
+    self.assertEqual(first.get_start_time(), 0)
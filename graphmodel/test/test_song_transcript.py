@@ -1,6 +1,8 @@
 import unittest
 
 from graphmodel.appio import reader
+from graphmodel.model.Song import InstrumentTrack, SongTranscript
+from graphmodel.model.SongObjects import Note
 
 class SongTranscriptTest(unittest.TestCase):
 
@@ -34,3 +36,49 @@ class SongTranscriptTest(unittest.TestCase):
   def is_sorted(self, array):
     self.assertTrue(all(array[i] <= array[i+1] for i in xrange(len(array)-1)))
 
+
+class InstrumentTrackTest(unittest.TestCase):
+
+  def setUp(self):
+    self.track = InstrumentTrack.from_arrays([30, 0, 30, 10], [5, 6, 7, 8], [60, 61, 62, 63], [90, 91, 92, 93])
+
+  def test_notes_are_grouped_into_chords(self):
+    self.assertEqual(self.track.times(), [0, 10, 30])
+    self.assertEqual(self.track.get_chord_offsets().tolist(), [0, 1, 2, 4])
+    chord = self.track.get_sound_event(30)
+    self.assertEqual([(note.duration, note.pitch) for note in chord.get_notes()], [(5, 60), (7, 62)])
+    self.assertRaises(KeyError, self.track.get_sound_event, 20)
+
+  def test_added_notes_join_their_chords(self):
+    self.track.add_note(Note(start_time=10, duration=1, pitch=70, volume=50))
+    self.track.add_note(Note(start_time=5, duration=1, pitch=71, volume=50))
+    self.assertEqual(self.track.times(), [0, 5, 10, 30])
+    self.assertEqual([note.pitch for note in self.track.get_sound_event(10).get_notes()], [63, 70])
+
+  def test_merge_puts_the_first_track_first_at_equal_times(self):
+    other = InstrumentTrack.from_arrays([10, 40], [1, 1], [20, 21], [50, 50])
+    merged = InstrumentTrack.merge(other, self.track)
+    self.assertEqual(merged.times(), [0, 10, 30, 40])
+    self.assertEqual([note.pitch for note in merged.get_sound_event(10).get_notes()], [20, 63])
+
+  def test_hashes_match_the_sound_events(self):
+    track = reader.load_transcript('../music/bach.mid').get_tracks()[0]
+    self.assertEqual(track.get_sound_event_hashes(), [hash(sound_event) for sound_event in track.get_sound_events()])
+
+  def test_empty_track(self):
+    track = InstrumentTrack()
+    self.assertEqual((len(track), track.times(), track.get_sound_events()), (0, [], []))
+    self.assertEqual(track.get_sound_event_hashes(), [])
+
+  def test_add_tracks_matches_adding_one_track_at_a_time(self):
+    tracks = [InstrumentTrack.from_arrays([0, 10, 20], [1, 1, 1], [index, index, index], [50, 50, 50])
+              for index in range(4)] + [self.track]
+    sequential = SongTranscript()
+    for track in tracks:
+      sequential.add_track(7, track)
+    batched = SongTranscript()
+    batched.add_track(7, tracks[0])
+    batched.add_tracks(7, tracks[1:])
+    for (expected, actual) in zip(sequential.get_track(7).get_note_arrays(), batched.get_track(7).get_note_arrays()):
+      self.assertEqual(expected.tolist(), actual.tolist())
+    self.assertEqual([note.pitch for note in batched.get_track(7).get_sound_event(10).get_notes()], [63, 3, 2, 1, 0])
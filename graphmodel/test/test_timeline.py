@@ -0,0 +1,37 @@
+__author__ = 'Adisor'
+import unittest
+
+from graphmodel.utils.timeline import TempoTimeline
+
+
+class TempoTimelineTest(unittest.TestCase):
+
+  def setUp(self):
+    self.timeline = TempoTimeline()
+    self.timeline.set_tempo(100, 'b')
+    self.timeline.set_tempo(10, 'a')
+    self.timeline.set_tempo(200, 'c')
+
+  def test_times_are_sorted(self):
+    self.assertEqual(self.timeline.times, [10, 100, 200])
+    self.assertEqual(self.timeline.tempo_events, ['a', 'b', 'c'])
+
+  def test_tempo_at(self):
+    self.assertEqual(self.timeline.tempo_at(0), 'a')
+    self.assertEqual(self.timeline.tempo_at(10), 'a')
+    self.assertEqual(self.timeline.tempo_at(150), 'b')
+    self.assertEqual(self.timeline.tempo_at(200), 'c')
+    self.assertEqual(self.timeline.tempo_at(10000), 'c')
+
+  def test_tempos_at_matches_tempo_at(self):
+    times = [0, 10, 99, 100, 101, 199, 200, 500]
+    self.assertEqual(self.timeline.tempos_at(times), [self.timeline.tempo_at(time) for time in times])
+
+  def test_set_tempo_replaces_same_time(self):
+    self.timeline.set_tempo(100, 'd')
+    self.assertEqual(self.timeline.tempo_events, ['a', 'd', 'c'])
+
+  def test_empty_timeline(self):
+    timeline = TempoTimeline()
+    self.assertIsNone(timeline.tempo_at(5))
+    self.assertEqual(timeline.tempos_at([1, 2]), [None, None])
@@ -0,0 +1,31 @@
+__author__ = 'Adisor'
+import os
+import shutil
+import tempfile
+import unittest
+
+from graphmodel import Generator, variants
+
+
+class VariantsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    shutil.copy('../music/mary.mid', self.folder)
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+
+  def test_variants_are_the_seeded_songs(self):
+    model = Generator.load_model(os.path.join(self.folder, 'mary.mid'), 2)
+    serial = list(variants.generate_variants(model, 3000, [5, 6, 7], processes=1))
+    self.assertEqual(list(variants.generate_variants(model, 3000, [5, 6, 7], processes=2)), serial)
+    output_file_names = variants.save_variants(serial, os.path.join(self.folder, 'variants'), 'mary')
+    self.assertEqual([os.path.basename(name) for name in output_file_names], ['mary-5.mid', 'mary-6.mid', 'mary-7.mid'])
+    output_file_name = Generator.generate('mary.mid', 3000, folder=self.folder, nsize=2, policy='prob', seed=6)
+    with open(output_file_name, 'rb') as output_file:
+      self.assertEqual(output_file.read(), serial[1][1])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,100 @@
+__author__ = 'Adisor'
+import os
+import random
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import midi
+
+from graphmodel import Generator
+from graphmodel.NGram import MultiInstrumentNGram
+from graphmodel.appio import reader
+from graphmodel.appio.scheduler import NotesAndEventsScheduledTrack, PatternSchedule
+from graphmodel.appio.writer import MidiBytesWriter, MidiFileWriter, MidiStreamWriter, encode_varlen
+from graphmodel.model.Meta import TranscriptMeta
+from graphmodel.model.SongObjects import Note
+
+
+def build_pattern_schedule():
+  meta = TranscriptMeta(resolution=220, key_signature_event=midi.KeySignatureEvent(tick=0, data=[1, 0]),
+                        time_signature_event=midi.TimeSignatureEvent(tick=0, data=[4, 2, 24, 8]))
+  scheduled_tracks = []
+  for channel in range(2):
+    track = NotesAndEventsScheduledTrack(instrument=channel + 20, channel=channel)
+    for index in range(40):
+      track.schedule_note(Note(duration=30 + index, pitch=50 + index % 7, volume=90), index * 200 + channel)
+    scheduled_tracks.append(track)
+  return PatternSchedule(scheduled_tracks=scheduled_tracks, meta=meta)
+
+
+class WriterTest(unittest.TestCase):
+
+  def test_varlen(self):
+    for (value, expected) in [(0, [0]), (0x7F, [0x7F]), (0x80, [0x81, 0]), (0x3FFF, [0xFF, 0x7F]),
+                              (0x200000, [0x81, 0x80, 0x80, 0])]:
+      track_buffer = bytearray()
+      encode_varlen(track_buffer, value)
+      self.assertEqual(list(track_buffer), expected)
+
+  def test_same_file_as_pattern_writer(self):
+    (handle, midi_file_name) = tempfile.mkstemp(suffix='.mid')
+    os.close(handle)
+    try:
+      MidiFileWriter(build_pattern_schedule()).save_to_file(midi_file_name)
+      with open(midi_file_name, 'rb') as midi_file:
+        expected = midi_file.read()
+      MidiBytesWriter(build_pattern_schedule()).save_to_file(midi_file_name)
+      with open(midi_file_name, 'rb') as midi_file:
+        self.assertEqual(midi_file.read(), expected)
+      (transcript, report) = reader.load_transcript_with_report(midi_file_name)
+      self.assertEqual(transcript.get_instruments(), [20, 21])
+      self.assertEqual(len(transcript.get_track(21)), 40)
+    finally:
+      os.remove(midi_file_name)
+
+
+class SocketLikeOutput(object):
+  """
+  Output that can not seek
+  """
+
+  def __init__(self):
+    self.parts = []
+
+  def write(self, data):
+    self.parts.append(str(data))
+
+
+class StreamWriterTest(unittest.TestCase):
+
+  def setUp(self):
+    transcript = reader.load_transcript('../music/bach.mid')
+    self.meta = transcript.get_transcript_meta()
+    self.ngram = MultiInstrumentNGram(3)
+    self.ngram.build_from_transcript(transcript)
+
+  def test_same_file_as_bytes_writer(self):
+    scheduled_tracks = Generator.generate_multi_instrument_tracks(self.ngram, 5000, rng=random.Random(2))
+    expected = MidiBytesWriter(PatternSchedule(scheduled_tracks, self.meta)).encode()
+    output = StringIO()
+    streams = Generator.generate_multi_instrument_events(self.ngram, 5000, rng=random.Random(2))
+    MidiStreamWriter(PatternSchedule(streams, self.meta), flush_bytes=16).write(output)
+    self.assertEqual(output.getvalue(), expected)
+    output = SocketLikeOutput()
+    streams = Generator.generate_multi_instrument_events(self.ngram, 5000, rng=random.Random(2))
+    MidiStreamWriter(PatternSchedule(streams, self.meta)).write(output)
+    self.assertEqual(''.join(output.parts), expected)
+
+  def test_events_at_the_same_time_keep_their_order(self):
+    scheduler = Generator.StreamingTrackScheduler(instrument=5, channel=1)
+    scheduled_track = NotesAndEventsScheduledTrack(instrument=5, channel=1)
+    for (start, duration, pitch) in [(0, 10, 60), (0, 0, 61), (10, 5, 62), (10, 0, 63), (12, 3, 64), (20, 1, 65)]:
+      scheduler.schedule_note(Note(duration=duration, pitch=pitch, volume=80), start)
+      scheduled_track.schedule_note(Note(duration=duration, pitch=pitch, volume=80), start)
+    self.assertEqual(scheduler.get_duration(), scheduled_track.get_duration())
+    scheduled_track.sort()
+    expected = [(time, event.__class__, event.data) for (time, scheduled_events)
+                in scheduled_track.get_scheduled_events().items() for event in scheduled_events]
+    streamed = scheduler.pop_ready_events() + scheduler.finish()
+    self.assertEqual([(time, event.__class__, event.data) for (time, event) in streamed], expected)
@@ -0,0 +1,35 @@
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+__author__ = 'Adisor'
+
+
+def sliding_windows(array, size):
+    """
+    Returns a read-only view with every run of size consecutive elements of the array as a row, without copying
+    :param array: one dimensional numpy array
+    :param size: window size
+    :return: two dimensional numpy array with len(array) - size + 1 rows
+    """
+    array = numpy.ascontiguousarray(array)
+    rows = max(len(array) - size + 1, 0)
+    stride = array.strides[0]
+    windows = as_strided(array, shape=(rows, size), strides=(stride, stride))
+    windows.flags.writeable = False
+    return windows
+
+
+def unique_rows_in_order(matrix):
+    """
+    Counts the distinct rows of the matrix
+    :param matrix: two dimensional numpy array
+    :return: (rows, first_indexes, inverse, counts) with the distinct rows ordered by their first occurrence,
+        inverse maps every row of the matrix to its distinct row
+    """
+    rows, first_indexes, inverse, counts = numpy.unique(matrix, axis=0, return_index=True, return_inverse=True,
+                                                        return_counts=True)
+    order = numpy.argsort(first_indexes, kind='mergesort')
+    # rank[i] is the position of the distinct row i in first occurrence order
+    rank = numpy.empty_like(order)
+    rank[order] = numpy.arange(len(order))
+    return rows[order], first_indexes[order], rank[inverse.reshape(-1)], counts[order]
@@ -0,0 +1,54 @@
+import random
+
+__author__ = 'Adisor'
+
+
+class AliasTable(object):
+    """
+    Walker's alias table for drawing indexes in proportion to their weights
+
+    Building the table costs O(k) for k weights, after which every draw costs O(1): a single uniform number picks a
+    column and decides between the column index and its alias
+    """
+
+    def __init__(self, weights):
+        """
+        :param weights: list of non negative numbers, at least one of them positive
+        """
+        size = len(weights)
+        total = float(sum(weights))
+        if size == 0 or total <= 0:
+            raise ValueError("Alias table needs at least one positive weight")
+        # probability of keeping the column index instead of taking its alias
+        self.probabilities = [1.0] * size
+        self.aliases = range(size)
+        scaled = [weight * size / total for weight in weights]
+        small = [index for index, weight in enumerate(scaled) if weight < 1.0]
+        large = [index for index, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # whatever is left is 1 up to rounding errors
+        for index in small + large:
+            self.probabilities[index] = 1.0
+
+    def sample(self, rng=random):
+        """
+        :param rng: object with a random() method, such as the random module or a random.Random instance
+        :return: index drawn in proportion to its weight
+        """
+        position = rng.random() * len(self.probabilities)
+        index = int(position)
+        if position - index < self.probabilities[index]:
+            return index
+        return self.aliases[index]
+
+    def __len__(self):
+        return len(self.probabilities)
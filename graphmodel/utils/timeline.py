@@ -0,0 +1,102 @@
+import bisect
+from collections import OrderedDict
+
+import numpy
+
+__author__ = 'Adisor'
+
+
+class TempoTimeline(object):
+    """
+    Maps times to the tempo event that is active at that time
+
+    The times and tempo events are kept in parallel sorted lists, so the tempo that is active at a time is found
+    with a binary search instead of walking the tempo events. The active tempo at a time is the last tempo set at or
+    before that time, and times before the first tempo get the first tempo
+    """
+
+    def __init__(self, tempo_dict=None):
+        # sorted tempo event times
+        self.times = []
+        # tempo events in the same order as the times
+        self.tempo_events = []
+        # numpy copy of the times used for vectorized lookups, rebuilt after changes
+        self._time_array = None
+        if tempo_dict is not None:
+            for time, tempo_event in tempo_dict.items():
+                self.set_tempo(time, tempo_event)
+
+    def set_tempo(self, time, tempo_event):
+        """
+        Sets the tempo event at the time, replacing the tempo event that was already set at that time
+        Setting tempos in order of time appends in constant time
+        """
+        self._time_array = None
+        if len(self.times) == 0 or time > self.times[-1]:
+            self.times.append(time)
+            self.tempo_events.append(tempo_event)
+            return
+        index = bisect.bisect_left(self.times, time)
+        if self.times[index] == time:
+            self.tempo_events[index] = tempo_event
+        else:
+            self.times.insert(index, time)
+            self.tempo_events.insert(index, tempo_event)
+
+    def index_at(self, time):
+        """
+        :param time: integer time
+        :return: the index of the tempo event active at the time, -1 if the timeline is empty
+        """
+        if len(self.times) == 0:
+            return -1
+        return max(bisect.bisect_right(self.times, time) - 1, 0)
+
+    def tempo_at(self, time):
+        """
+        :param time: integer time
+        :return: the tempo event active at the time, None if the timeline is empty
+        """
+        index = self.index_at(time)
+        if index < 0:
+            return None
+        return self.tempo_events[index]
+
+    def indexes_at(self, times):
+        """
+        Vectorized version of index_at
+        :param times: numpy array or list of times
+        :return: numpy array with the index of the active tempo event for each time, -1 if the timeline is empty
+        """
+        times = numpy.asarray(times, dtype=numpy.int64)
+        if len(self.times) == 0:
+            return numpy.full(len(times), -1, dtype=numpy.int64)
+        if self._time_array is None:
+            self._time_array = numpy.array(self.times, dtype=numpy.int64)
+        indexes = numpy.searchsorted(self._time_array, times, side='right') - 1
+        return numpy.maximum(indexes, 0)
+
+    def tempos_at(self, times):
+        """
+        Vectorized version of tempo_at
+        :param times: numpy array or list of times
+        :return: list with the tempo event active at each time
+        """
+        if len(self.times) == 0:
+            return [None] * len(times)
+        return [self.tempo_events[index] for index in self.indexes_at(times).tolist()]
+
+    def items(self):
+        """
+        :return: list of (time, tempo event) pairs in order of time
+        """
+        return zip(self.times, self.tempo_events)
+
+    def to_dict(self):
+        """
+        :return: ordered dict that maps times to tempo events
+        """
+        return OrderedDict(self.items())
+
+    def __len__(self):
+        return len(self.times)
@@ -0,0 +1,123 @@
+import argparse
+import os
+import time
+from StringIO import StringIO
+from multiprocessing import Pool
+
+from graphmodel import Generator
+from graphmodel.appio.scheduler import PatternSchedule
+from graphmodel.appio.writer import MidiStreamWriter
+from graphmodel.model.Policies import FrameSelectionPolicy
+
+__author__ = 'Adisor'
+
+"""
+Generates many variations of one song from a single model
+
+The model is built once, and each variation is generated from its own seed, so a variation can be generated again
+from its seed. The variations are generated in worker processes that are forked with the model, and each worker sends
+back the whole midi file, which is written with a single write
+
+usage: python -m graphmodel.variants music/bach.mid -o variants -v 50 -n 3 -t 20000 -p prob
+"""
+
+# (MultiInstrumentNGram, TranscriptMeta) of the variations, set in the worker processes when they start
+worker_model = None
+
+
+def set_worker_model(model):
+    global worker_model
+    worker_model = model
+
+
+def generate_worker_variant(job):
+    """
+    Generates a variation of the worker model, runs in the worker processes
+    """
+    return generate_variant(worker_model, job)
+
+
+def generate_variant(model, job):
+    """
+    Generates one variation, the same as Generator.generate with the seed
+    :param model: (MultiInstrumentNGram, TranscriptMeta)
+    :param job: (ticks, frame selection policy, seed) tuple
+    :return: (seed, String with the midi file)
+    """
+    (ngram, meta) = model
+    (ticks, policy, seed) = job
+    track_buffers = Generator.generate_parallel_tracks(ngram, ticks, seed, policy=policy, processes=1)
+    output = StringIO()
+    MidiStreamWriter(PatternSchedule(scheduled_tracks=track_buffers, meta=meta)).write_encoded(output)
+    return seed, output.getvalue()
+
+
+def generate_variants(model, ticks, seeds, policy=FrameSelectionPolicy.PROB, processes=None):
+    """
+    Generates a variation for each seed in parallel
+    :param model: (MultiInstrumentNGram, TranscriptMeta), such as the one returned by Generator.load_model
+    :param ticks: duration of each variation
+    :param seeds: list of seeds, one variation is generated for each
+    :param policy: frame selection policy
+    :param processes: number of worker processes, None for one per core, 1 to generate the variations in this process
+    :return: iterator of (seed, String with the midi file) in the order of the seeds
+    """
+    jobs = [(ticks, policy, seed) for seed in seeds]
+    if processes == 1:
+        for job in jobs:
+            yield generate_variant(model, job)
+        return
+    pool = Pool(processes, initializer=set_worker_model, initargs=(model,))
+    try:
+        # the files are small, so several are sent back at a time
+        for variant in pool.imap(generate_worker_variant, jobs, chunksize=4):
+            yield variant
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def save_variants(variants, folder, name):
+    """
+    Writes each variation to <folder>/<name>-<seed>.mid
+    :param variants: iterator of (seed, String with the midi file)
+    :return: list of the file names
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    output_file_names = []
+    for (seed, data) in variants:
+        output_file_name = os.path.join(folder, "%s-%s.mid" % (name, seed))
+        with open(output_file_name, 'wb') as output_file:
+            output_file.write(data)
+        output_file_names.append(output_file_name)
+    return output_file_names
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Generates variations of a song from a single model")
+    parser.add_argument('input', help="midi file of the song")
+    parser.add_argument('-o', '--output', required=True, help="folder of the variations")
+    parser.add_argument('-v', '--variants', type=int, default=20, help="number of variations")
+    parser.add_argument('-s', '--seed', type=int, default=0, help="seed of the first variation, the next ones follow")
+    parser.add_argument('-n', '--nsize', type=int, default=2, help="ngram size")
+    parser.add_argument('-t', '--ticks', type=int, default=20000, help="duration of each variation")
+    # the random and experimental policies do not select frames yet
+    parser.add_argument('-p', '--policy', default='prob', choices=['highest', 'prob'], help="frame selection policy")
+    parser.add_argument('-j', '--processes', type=int, default=None, help="worker processes, one per core by default")
+    options = parser.parse_args(args)
+
+    start = time.time()
+    model = Generator.load_model(options.input, options.nsize)
+    built = time.time()
+    seeds = range(options.seed, options.seed + options.variants)
+    variants = generate_variants(model, options.ticks, seeds, Generator.POLICY_NAMES[options.policy],
+                                 options.processes)
+    name = os.path.splitext(os.path.basename(options.input))[0]
+    output_file_names = save_variants(variants, options.output, name)
+    print "Built the model of %s in %.2fs" % (options.input, built - start)
+    print "Generated %s variations in %s in %.2fs" % (len(output_file_names), options.output, time.time() - built)
+
+
+if __name__ == '__main__':
+    main()